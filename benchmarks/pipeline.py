@@ -0,0 +1,108 @@
+"""
+Measure how long each stage of the detection pipeline takes on synthetic corpora of growing size.
+The corpora are generated from the documents in data/docs: every generated document mixes the sentences of one
+bundled document with sentences of the others, so that pairs share content like real assignments do.
+Matching stages run on a random sample of the document pairs of each corpus, since their number grows quadratically.
+The results are written as JSON so that they can be compared between commits:
+`python benchmarks/pipeline.py --size 10 --size 100 --out pipeline.json`
+"""
+from __future__ import annotations
+
+import json
+import os
+import random
+import sys
+from itertools import combinations
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import click
+
+from revision import git_revision
+
+DATA_DIR = Path(__file__).parent.parent / 'data' / 'docs'
+DEFAULT_SIZES = (10, 100, 1000, 10000)
+SEED = 42
+
+
+def _generate_corpus(target_dir: Path, size: int, rng: random.Random):
+    sources = [path.read_text(encoding='utf-8').splitlines() for path in sorted(DATA_DIR.glob('*.txt'))]
+    sentences = [sent for source in sources for sent in source]
+    for idx in range(size):
+        doc_sents = list(sources[idx % len(sources)])
+        doc_sents.extend(rng.sample(sentences, k=min(len(sentences), 5)))
+        rng.shuffle(doc_sents)
+        (target_dir / f'doc{idx}.txt').write_text('\n'.join(doc_sents), encoding='utf-8')
+
+
+def _sample_pairs(docs: list, max_pairs: int, rng: random.Random) -> list[tuple]:
+    pair_count = len(docs) * (len(docs) - 1) // 2
+    if pair_count <= max_pairs:
+        return list(combinations(docs, 2))
+    pairs = set()
+    while len(pairs) < max_pairs:
+        doc1, doc2 = rng.sample(docs, k=2)
+        pairs.add((doc1, doc2) if doc1.name < doc2.name else (doc2, doc1))
+    return sorted(pairs, key=lambda pair: (pair[0].name, pair[1].name))
+
+
+def _run(size: int, max_pairs: int, lang: str) -> dict:
+    from plagdef.config import settings
+    from plagdef.model.detection import DocumentMatcher
+    from plagdef.model.matching import VerbatimMatcher
+    from plagdef.model.models import DocumentPairMatches, Match, MatchType
+    from plagdef.model.pipeline.extension import ClusterBuilder
+    from plagdef.model.pipeline.filtering import ClusterFilter
+    from plagdef.model.pipeline.seeding import SeedFinder
+    from plagdef.model.reporting import write_text_report
+    from plagdef.model.stats import stats
+    from plagdef.repositories import DocumentFileRepository, DocumentPairMatchesJsonRepository
+
+    rng = random.Random(SEED)
+    seeder = SeedFinder(settings['min_cos_sim'], settings['min_dice_sim'])
+    cluster_builder = ClusterBuilder(settings['adjacent_sents_gap'], settings['min_adjacent_sents_gap'],
+                                     settings['min_sent_number'], settings['min_cluster_cos_sim'])
+    cluster_filter = ClusterFilter(settings['min_cluster_char_len'])
+    verbatim_matcher = VerbatimMatcher(settings['min_verbatim_match_char_len'])
+    stats.reset()
+    with TemporaryDirectory() as corpus_dir, TemporaryDirectory() as report_dir:
+        _generate_corpus(Path(corpus_dir), size, rng)
+        with stats.timer('reading'):
+            docs = DocumentFileRepository(Path(corpus_dir), lang=lang).list()
+        DocumentMatcher(settings).preprocess(lang, docs)
+        pairs = _sample_pairs(sorted(docs, key=lambda doc: doc.name), max_pairs, rng)
+        matches = []
+        for doc1, doc2 in pairs:
+            clusters = cluster_filter.filter(cluster_builder.extend(seeder.seed(doc1, doc2)))
+            verbatim_matches = verbatim_matcher.find_verbatim_matches(clusters)
+            doc_pair_matches = DocumentPairMatches(doc1, doc2, {
+                *verbatim_matches, *(Match.from_cluster(MatchType.INTELLIGENT, cluster) for cluster in clusters)})
+            matches.append(doc_pair_matches) if len(doc_pair_matches) else None
+        with stats.timer('reporting'), open(os.devnull, 'w', encoding='utf-8') as devnull:
+            write_text_report(matches, devnull)
+        with stats.timer('serialization'):
+            DocumentPairMatchesJsonRepository(Path(report_dir)).save_all(matches)
+    # Own seconds exclude nested stages, e.g. seeding excludes vectorization
+    timings = {stage: times['own_seconds'] for stage, times in stats.to_dict()['stages'].items()}
+    return {'docs': len(docs), 'pairs': len(pairs), 'doc_pair_matches': len(matches), 'stages': timings}
+
+
+@click.command(context_settings=dict(help_option_names=["-h", "--help"]))
+@click.option('sizes', '--size', '-s', type=click.IntRange(2, 10000), multiple=True, default=DEFAULT_SIZES,
+              show_default=True, help='Number of documents of a generated corpus. Can be given multiple times.')
+@click.option('max_pairs', '--pairs', '-p', type=click.IntRange(1), default=1000, show_default=True,
+              help='Maximum number of document pairs matched per corpus.')
+@click.option('lang', '--lang', '-l', default='de', show_default=True, help='Language of the bundled documents.')
+@click.option('out', '--out', '-o', type=click.Path(dir_okay=False), help='Write the results to this JSON file.')
+def main(sizes: tuple[int], max_pairs: int, lang: str, out: str):
+    results = {'revision': git_revision(), 'python': sys.version.split()[0], 'max_pairs': max_pairs,
+               'corpora': {str(size): _run(size, max_pairs, lang) for size in sorted(set(sizes))}}
+    text = json.dumps(results, indent=4)
+    if out:
+        with open(out, 'w', encoding='utf-8') as f:
+            f.write(text)
+    click.echo(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,14 @@
+"""
+Revision of the measured code, shared by the benchmark scripts so that their results can be told apart by commit.
+"""
+from __future__ import annotations
+
+import subprocess
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
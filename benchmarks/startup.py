@@ -0,0 +1,49 @@
+"""
+Measure how long it takes to start PlagDef's entry points.
+Every command runs in a fresh interpreter so that no module is cached between runs.
+The results are written as JSON so that they can be compared between commits:
+`python benchmarks/startup.py --out startup.json`
+"""
+from __future__ import annotations
+
+import json
+import subprocess
+import sys
+from statistics import median
+from time import perf_counter
+
+import click
+
+from revision import git_revision
+
+COMMANDS = {
+    'import_app': [sys.executable, '-c', 'import plagdef.app'],
+    'import_services': [sys.executable, '-c', 'import plagdef.services'],
+    'cli_help': [sys.executable, '-m', 'plagdef.app', '-h'],
+}
+
+
+def _time_command(cmd: list[str], repeat: int) -> dict:
+    timings = []
+    for _ in range(repeat):
+        start = perf_counter()
+        subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        timings.append(perf_counter() - start)
+    return {'min': min(timings), 'median': median(timings), 'max': max(timings), 'runs': repeat}
+
+
+@click.command(context_settings=dict(help_option_names=["-h", "--help"]))
+@click.option('repeat', '--repeat', '-r', type=click.IntRange(1), default=5, help='Runs per command.')
+@click.option('out', '--out', '-o', type=click.Path(dir_okay=False), help='Write the results to this JSON file.')
+def main(repeat: int, out: str):
+    results = {'revision': git_revision(), 'python': sys.version.split()[0],
+               'startup': {name: _time_command(cmd, repeat) for name, cmd in COMMANDS.items()}}
+    text = json.dumps(results, indent=4)
+    if out:
+        with open(out, 'w', encoding='utf-8') as f:
+            f.write(text)
+    click.echo(text)
+
+
+if __name__ == '__main__':
+    main()
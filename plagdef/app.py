@@ -1,18 +1,22 @@
 from __future__ import annotations
 
+import json
+import logging
 import os
 import signal
 import sys
+from contextlib import contextmanager, redirect_stderr, redirect_stdout
 from pathlib import Path
+from threading import Thread
 
 import click
 from click import UsageError
 
-from plagdef import services
 from plagdef.config import settings
 from plagdef.model.models import DocumentPairMatches, Document
-from plagdef.model.reporting import generate_text_report
-from plagdef.repositories import DocumentFileRepository, DocumentPairMatchesJsonRepository, DocumentPairRepository
+from plagdef.model.reporting import write_text_report
+from plagdef.repositories import DocumentFileRepository, DocumentPairMatchesJsonRepository, DocumentPairRepository, \
+    ReportEntry
 
 
 @click.command(context_settings=dict(help_option_names=["-h", "--help"]))
@@ -32,9 +36,26 @@ from plagdef.repositories import DocumentFileRepository, DocumentPairMatchesJson
 @click.option('ocr', '--ocr', '-o', type=bool, default=True, help='Use OCR for PDFs with poor text layers.'
                                                                   'May improve text extraction but significantly '
                                                                   'reduces performance.')
+@click.option('sweep_ths', '--sweep', '-w', type=click.FloatRange(0, 1), multiple=True,
+              help='Similarity threshold to evaluate in a single run, can be given multiple times. Seeds are only '
+                   'computed once and matches are reported per threshold. Overrides --similarity-threshold.')
 @click.option('jsondir', '--json', '-j', type=click.Path(), help='Output directory for JSON reports.')
+@click.option('profile_pair_time', '--profile-pairs', type=click.FloatRange(0),
+              help='Profile document pairs whose matching takes longer than the given amount of seconds. The '
+                   'profiles and statistics of these pairs are written to a folder in the JSON output directory.')
+@click.option('stats_file', '--stats', type=click.Path(dir_okay=False),
+              help='Write timings of the pipeline stages, counters and the slowest document pairs to this JSON file. '
+                   'The seconds of a stage include the stages it calls, its own seconds do not.')
+@click.option('shard_queue', '--shard-queue', type=click.Path(file_okay=False),
+              help='Shared directory through which the document pairs are matched in shards by workers on several '
+                   'nodes. Start the workers of the other nodes with `plagdef-worker <SHARD_QUEUE>`. '
+                   'Not used with --sweep.')
+@click.option('use_daemon', '--daemon', is_flag=True,
+              help='Let a running `plagdef-daemon` do the matching, which saves loading the models on every run.')
 def cli(docdir: tuple[click.Path, bool], lang: str, ocr: bool, common_docdir: [click.Path, bool],
-        archive_docdir: [click.Path, bool], sim_th: float, jsondir: click.Path, download_path: click.Path):
+        archive_docdir: [click.Path, bool], sim_th: float, sweep_ths: tuple[float], jsondir: click.Path,
+        download_path: click.Path, profile_pair_time: float, stats_file: click.Path, shard_queue: click.Path,
+        use_daemon: bool):
     """
     \b
     PlagDef supports plagiarism detection for student assignments.
@@ -43,9 +64,119 @@ def cli(docdir: tuple[click.Path, bool], lang: str, ocr: bool, common_docdir: [c
     For instance if you would like to recursively search <DOCDIR> the correct command looks like this:
     `plagdef <DOCDIR> True`
     """
+    if use_daemon:
+        from plagdef.daemon import submit_job
+        sys.exit(submit_job(_job_params(click.get_current_context().params), settings['daemon_port'],
+                            _daemon_token_path()))
     settings.update({'lang': lang, 'ocr': ocr, 'min_cos_sim': sim_th, 'min_dice_sim': sim_th,
                      'min_cluster_cos_sim': sim_th, 'download_path': str(download_path)})
-    matches = find_matches(docdir, archive_docdir, common_docdir)
+    if profile_pair_time is not None:
+        settings.update({'profile_pair_time': profile_pair_time,
+                         'profile_path': str(Path(str(jsondir)) / 'profiles') if jsondir else settings['profile_path']})
+    settings.update({'shard_queue_path': str(shard_queue)}) if shard_queue else None
+    if sweep_ths:
+        sweep_results = sweep_matches(docdir, archive_docdir, common_docdir, sweep_ths)
+        for sweep_th, matches in sweep_results.items():
+            if jsondir:
+                _report_matches(matches, _sweep_jsondir(jsondir, sweep_th))
+            else:
+                click.echo(f'\nSimilarity threshold {sweep_th}:')
+                _report_matches(matches)
+    else:
+        matches = find_matches(docdir, archive_docdir, common_docdir)
+        _report_matches(matches, jsondir)
+    _write_stats(stats_file) if stats_file else None
+    sys.exit(0)
+
+
+def _job_params(params: dict) -> dict:
+    """The daemon runs in another working directory, so paths are sent as absolute paths."""
+    job_params = {name: value for name, value in params.items() if name != 'use_daemon'}
+    for name in ('docdir', 'archive_docdir', 'common_docdir'):
+        job_params[name] = [os.path.abspath(str(params[name][0])), params[name][1]] if params[name] else None
+    for name in ('download_path', 'jsondir', 'stats_file', 'shard_queue'):
+        job_params[name] = os.path.abspath(str(params[name])) if params[name] else None
+    return job_params
+
+
+def _run_daemon_job(params: dict, out) -> int:
+    """Run a job of the daemon like a CLI invocation with the given parameters and return its exit code."""
+    from plagdef.model.stats import stats
+    params = {name: tuple(value) if isinstance(value, list) else value for name, value in params.items()}
+    prev_settings = dict(settings)
+    stats.reset()
+    try:
+        with _job_output(out):
+            cli.callback(**params, use_daemon=False)
+        return 0
+    except SystemExit as e:
+        return e.code if isinstance(e.code, int) else 1
+    except click.ClickException as e:
+        out.write(f'Error: {e.format_message()}\n')
+        return e.exit_code
+    except Exception as e:
+        out.write(f'Error: {e}\n')
+        return 1
+    finally:
+        settings.clear()
+        settings.update(prev_settings)
+
+
+@contextmanager
+def _job_output(out):
+    """Send the report, the progress bars and the log of a daemon job to its client. Redirecting stdout and stderr
+    is process-wide, so the daemon must keep running its jobs one after another, see JobServer.job_lock."""
+    plagdef_log = logging.getLogger('plagdef')
+    handler = logging.StreamHandler(out)
+    handler.setLevel(logging.INFO)
+    handler.setFormatter(plagdef_log.handlers[0].formatter if plagdef_log.handlers else None)
+    plagdef_log.addHandler(handler)
+    try:
+        with redirect_stdout(out), redirect_stderr(out):
+            yield
+    finally:
+        plagdef_log.removeHandler(handler)
+
+
+@click.command(context_settings=dict(help_option_names=["-h", "--help"]))
+@click.version_option(prog_name='PlagDef', package_name='plagdef')
+@click.option('port', '--port', '-p', type=click.IntRange(0, 65535), default=lambda: settings['daemon_port'],
+              show_default='daemon_port setting', help='Local port on which jobs are accepted.')
+@click.option('lang', '--lang', '-l', default=lambda: settings['lang'], show_default='lang setting',
+              help='Bibliographical language code of the NLP model which is loaded ahead of the first job.')
+def daemon(port: int, lang: str):
+    """
+    \b
+    Keep the NLP models, preprocessed documents and worker processes loaded and run matching jobs submitted with
+    `plagdef --daemon`. Jobs are run one after another.
+    """
+    from plagdef.daemon import serve
+    settings['daemon_port'] = port
+    serve(port, lang, _run_daemon_job, _daemon_token_path())
+
+
+def _daemon_token_path() -> Path:
+    return Path(settings['daemon_token_path']).expanduser()
+
+
+@click.command(context_settings=dict(help_option_names=["-h", "--help"]))
+@click.version_option(prog_name='PlagDef', package_name='plagdef')
+@click.argument('queue_dir', type=click.Path(exists=True, file_okay=False))
+@click.option('processes', '--processes', '-p', type=click.IntRange(1), default=lambda: os.cpu_count(),
+              show_default='one per CPU', help='Amount of worker processes.')
+@click.option('keep_waiting', '--wait', '-w', is_flag=True,
+              help='Keep waiting for new jobs instead of stopping once the queue is empty.')
+def worker(queue_dir: click.Path, processes: int, keep_waiting: bool):
+    """
+    \b
+    Match document pair shards of the queue in <QUEUE_DIR>, which is shared with the node running
+    `plagdef --shard-queue <QUEUE_DIR>`.
+    """
+    from plagdef.model.sharding import run_workers
+    run_workers(Path(str(queue_dir)), processes, keep_waiting)
+
+
+def _report_matches(matches: list[DocumentPairMatches], jsondir=None):
     if jsondir:
         if matches:
             try:
@@ -54,9 +185,28 @@ def cli(docdir: tuple[click.Path, bool], lang: str, ocr: bool, common_docdir: [c
             except NotADirectoryError as e:
                 raise UsageError(str(e)) from e
     else:
-        text_report = generate_text_report(matches)
-        click.echo(f'\n{text_report}')
-    sys.exit(0)
+        sys.stdout.write('\n')
+        write_text_report(matches, sys.stdout)
+        sys.stdout.write('\n')
+        sys.stdout.flush()
+
+
+def _write_stats(stats_file):
+    from plagdef.model.stats import stats
+    try:
+        with open(str(stats_file), 'w', encoding='utf-8') as file:
+            json.dump(stats.to_dict(), file, indent=4)
+    except OSError as e:
+        raise UsageError(f"Could not write the statistics to '{stats_file}'.") from e
+
+
+def _sweep_jsondir(jsondir, sim_th: float) -> Path:
+    sweep_dir = Path(str(jsondir)) / f'sim_{sim_th}'
+    try:
+        sweep_dir.mkdir(exist_ok=True)
+    except FileNotFoundError as e:
+        raise UsageError(f"The given path '{jsondir}' does not point to an existing directory!") from e
+    return sweep_dir
 
 
 @click.command(context_settings=dict(help_option_names=["-h", "--help"]))
@@ -76,6 +226,23 @@ def gui():
 
 
 def find_matches(docdir: tuple, archive_docdir: tuple, common_docdir: tuple) -> list[DocumentPairMatches]:
+    # The detection pipeline pulls in Stanza and Torch, so it is only imported once matching is requested
+    from plagdef import services
+    _update_tlds_in_background()
+    doc_repo, archive_repo, common_repo = _doc_repos(docdir, archive_docdir, common_docdir)
+    return services.find_matches(doc_repo, archive_repo=archive_repo, common_doc_repo=common_repo)
+
+
+def sweep_matches(docdir: tuple, archive_docdir: tuple, common_docdir: tuple, sim_thresholds: tuple[float]) \
+    -> dict[float, list[DocumentPairMatches]]:
+    from plagdef import services
+    _update_tlds_in_background()
+    doc_repo, archive_repo, common_repo = _doc_repos(docdir, archive_docdir, common_docdir)
+    return services.sweep_matches(doc_repo, list(sim_thresholds), archive_repo=archive_repo,
+                                  common_doc_repo=common_repo)
+
+
+def _doc_repos(docdir: tuple, archive_docdir: tuple, common_docdir: tuple) -> tuple:
     try:
         doc_repo = DocumentFileRepository(Path(str(docdir[0])), recursive=docdir[1])
         archive_repo = common_repo = None
@@ -86,26 +253,36 @@ def find_matches(docdir: tuple, archive_docdir: tuple, common_docdir: tuple) ->
             common_repo = DocumentFileRepository(
                 Path(str(common_docdir[0])), recursive=common_docdir[1])
         settings['last_common_docdir'] = common_docdir
-        return services.find_matches(doc_repo, archive_repo=archive_repo, common_doc_repo=common_repo)
+        return doc_repo, archive_repo, common_repo
     except NotADirectoryError as e:
         raise UsageError(str(e)) from e
 
 
 def reanalyze_pair(doc1: Document, doc2: Document, sim: float):
-    ser, last_sim = settings['ser'], settings['min_cos_sim']
-    settings.update({'ser': False, 'min_cos_sim': sim, 'min_dice_sim': sim, 'min_cluster_cos_sim': sim})
+    from plagdef import services
+    config = {**settings, 'ser': False, 'min_cos_sim': sim, 'min_dice_sim': sim, 'min_cluster_cos_sim': sim}
+    if len(doc1.sents(include_common=True)) and len(doc2.sents(include_common=True)):
+        # Sentences and common sentence flags are still there, so only matching has to be redone
+        return services.find_pair_matches(doc1, doc2, config)
+    # Documents read from JSON reports are not preprocessed
     common_repo = None
     if 'last_common_docdir' in settings and settings['last_common_docdir']:
         common_repo = DocumentFileRepository(
             Path(str(settings['last_common_docdir'][0])), recursive=settings['last_common_docdir'][1])
     doc_repo = DocumentPairRepository(Document(doc1.name, doc1.path, doc1.text),
                                       Document(doc2.name, doc2.path, doc2.text))
-    matches = services.find_matches(doc_repo, common_doc_repo=common_repo, download=False)
-    settings.update({'ser': ser, 'min_cos_sim': last_sim, 'min_dice_sim': last_sim, 'min_cluster_cos_sim': last_sim})
-    return matches
+    return services.find_matches(doc_repo, common_doc_repo=common_repo, config=config, download=False)
+
+
+def preload_nlp_model(lang: str):
+    """Load the NLP model of the given language ahead of time and release the models of other languages."""
+    from plagdef.model.pipeline.preprocessing import nlp_pipes
+    [nlp_pipes.release(loaded_lang) for loaded_lang in nlp_pipes.langs() if loaded_lang != lang]
+    nlp_pipes.get(lang)
 
 
 def write_doc_pair_matches_to_json(matches, jsondir):
+    from plagdef import services
     repo = DocumentPairMatchesJsonRepository(Path(str(jsondir)))
     services.write_json_reports(matches, repo)
 
@@ -115,6 +292,17 @@ def read_doc_pair_matches_from_json(jsondir) -> set[DocumentPairMatches]:
     return repo.list()
 
 
+def read_report_index_from_json(jsondir) -> tuple[DocumentPairMatchesJsonRepository, list[ReportEntry]]:
+    repo = DocumentPairMatchesJsonRepository(Path(str(jsondir)))
+    return repo, repo.list_index()
+
+
+def _update_tlds_in_background():
+    """Refresh the top level domains used for URL extraction while documents are being read."""
+    from plagdef.model.pipeline.preprocessing import update_tlds
+    Thread(target=update_tlds, daemon=True).start()
+
+
 if __name__ == "__main__":
     args = sys.argv
     if len(args) > 1 and args[1] == 'gui':
@@ -4,8 +4,6 @@ from ast import literal_eval
 from configparser import ConfigParser
 from pathlib import Path
 
-import pkg_resources
-
 
 def _read_config(path) -> dict:
     parser = ConfigParser()
@@ -18,11 +16,12 @@ def _read_config(path) -> dict:
 
 
 # Logging config
-logging_config = pkg_resources.resource_filename(__name__, str(Path('config/logging.ini')))
+CONFIG_DIR = Path(__file__).parent / 'config'
+logging_config = CONFIG_DIR / 'logging.ini'
 logging.config.fileConfig(logging_config, disable_existing_loggers=False)
 
 # App config
-app_config_path = pkg_resources.resource_filename(__name__, str(Path('config/app.ini')))
+app_config_path = CONFIG_DIR / 'app.ini'
 settings = _read_config(app_config_path)
 
 # Ignore warnings from Torch
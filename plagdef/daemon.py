@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+import hmac
+import http.client
+import io
+import json
+import logging
+import os
+import secrets
+import sys
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from pathlib import Path
+from threading import Lock
+from time import time
+from typing import Callable, TextIO
+
+from click import UsageError
+
+log = logging.getLogger(__name__)
+HOST = '127.0.0.1'
+
+
+class JobServer(ThreadingHTTPServer):
+    """Local HTTP endpoint of a long-running process which keeps the NLP models, preprocessed documents and worker
+    processes loaded between jobs. Jobs are run one after another by the job runner, which is passed the job's
+    parameters and a stream for its output. The output is streamed back to the client line by line.
+    Jobs read and write files with the rights of the daemon's user, so every request must carry the token which only
+    that user can read."""
+
+    daemon_threads = True
+
+    def __init__(self, port: int, job_runner: Callable[[dict, TextIO], int], token: str):
+        super().__init__((HOST, port), _JobHandler)
+        self.job_runner = job_runner
+        self.token = token
+        self.job_lock = Lock()
+        self.jobs = 0
+        self.start_time = time()
+
+
+class _JobHandler(BaseHTTPRequestHandler):
+    server: JobServer
+
+    def do_GET(self):
+        if not self._authorized():
+            return
+        if self.path != '/status':
+            self.send_error(404)
+            return
+        self._send_json({'jobs': self.server.jobs, 'busy': self.server.job_lock.locked(),
+                         'uptime': time() - self.server.start_time})
+
+    def do_POST(self):
+        if not self._authorized():
+            return
+        if self.path != '/jobs':
+            self.send_error(404)
+            return
+        try:
+            params = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        except ValueError:
+            self.send_error(400, 'Job parameters must be a JSON object.')
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.end_headers()
+        out = _StreamWriter(self.wfile)
+        # The job runner redirects the process' output to the client, so jobs must never run concurrently
+        with self.server.job_lock:
+            self.server.jobs += 1
+            exit_code = self.server.job_runner(params, out)
+        out.flush()
+        self.wfile.write(f'{json.dumps({"exit": exit_code})}\n'.encode('utf-8'))
+
+    def _authorized(self) -> bool:
+        if hmac.compare_digest(self.headers.get('Authorization', ''), f'Bearer {self.server.token}'):
+            return True
+        self.send_error(401, 'Missing or wrong daemon token.')
+        return False
+
+    def _send_json(self, obj: dict):
+        body = json.dumps(obj).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        log.debug(format, *args)
+
+
+class _StreamWriter(io.TextIOBase):
+    """Text stream which sends every complete line of output to the client as JSON line."""
+
+    def __init__(self, wfile):
+        self._wfile = wfile
+        self._buffer = ''
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, text: str) -> int:
+        self._buffer += text
+        if '\n' in self._buffer:
+            lines, self._buffer = self._buffer.rsplit('\n', 1)
+            self._send(f'{lines}\n')
+        return len(text)
+
+    def flush(self):
+        self._send(self._buffer) if self._buffer else None
+        self._buffer = ''
+
+    def _send(self, text: str):
+        try:
+            self._wfile.write(f'{json.dumps({"out": text})}\n'.encode('utf-8'))
+            self._wfile.flush()
+        except OSError:
+            log.debug('Client disconnected, discarding job output.')
+
+
+def serve(port: int, lang: str, job_runner: Callable[[dict, TextIO], int], token_path: Path):
+    """Load everything a job needs once and run jobs until the process is interrupted. A new token is written to
+    the token file, readable by the daemon's user only."""
+    from plagdef.model.detection import DocumentMatcher
+    from plagdef.repositories import DocumentPickleRepository
+    from plagdef.util import keep_pool_warm
+    DocumentPickleRepository.keep_in_memory = True
+    DocumentMatcher.keep_archive_index = True
+    keep_pool_warm()
+    try:
+        from plagdef.app import preload_nlp_model
+        preload_nlp_model(lang)
+    except Exception:
+        log.warning(f"Could not preload the NLP model for '{lang}', it is loaded by the first job.")
+        log.debug('Following error occurred:', exc_info=True)
+    token = secrets.token_hex(32)
+    _write_token(token_path, token)
+    with JobServer(port, job_runner, token) as server:
+        log.info(f'Waiting for jobs on http://{HOST}:{server.server_address[1]}/jobs')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+def _write_token(token_path: Path, token: str):
+    token_path.parent.mkdir(parents=True, exist_ok=True)
+    file_descriptor = os.open(token_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    os.chmod(token_path, 0o600)  # The file may have existed with other permissions
+    with os.fdopen(file_descriptor, 'w', encoding='utf-8') as file:
+        file.write(token)
+
+
+def submit_job(params: dict, port: int, token_path: Path, out: TextIO = None) -> int:
+    """Send a job to a running daemon, write its output as it arrives and return its exit code."""
+    out = out if out else sys.stdout
+    try:
+        token = token_path.read_text(encoding='utf-8').strip()
+    except OSError as e:
+        raise UsageError(f"Could not read the daemon token from '{token_path}', start a daemon with "
+                         f"`plagdef-daemon`.") from e
+    conn = http.client.HTTPConnection(HOST, port)
+    try:
+        conn.request('POST', '/jobs', body=json.dumps(params),
+                     headers={'Content-Type': 'application/json', 'Authorization': f'Bearer {token}'})
+        resp = conn.getresponse()
+        if resp.status != 200:
+            raise UsageError(f'The daemon rejected the job: {resp.status} {resp.reason}')
+        for line in resp:
+            msg = json.loads(line)
+            if 'exit' in msg:
+                return msg['exit']
+            out.write(msg['out'])
+            out.flush()
+        raise UsageError('The daemon closed the connection before the job finished.')
+    except ConnectionRefusedError as e:
+        raise UsageError(f'There is no daemon listening on port {port}, start one with `plagdef-daemon`.') from e
+    finally:
+        conn.close()
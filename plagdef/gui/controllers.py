@@ -7,9 +7,10 @@ import subprocess
 from click import UsageError
 
 import plagdef.gui.main as main
-from plagdef.app import write_doc_pair_matches_to_json, read_doc_pair_matches_from_json
+from plagdef.app import write_doc_pair_matches_to_json, read_doc_pair_matches_from_json, \
+    read_report_index_from_json
 from plagdef.config import settings
-from plagdef.gui.model import DocumentPairMatches
+from plagdef.gui.model import DocumentPairMatches, LazyDocumentPairMatches, Report
 from plagdef.gui.views import HomeView, LoadingView, NoResultsView, ErrorView, ResultView, \
     FileDialog, MatchesDialog, MessageDialog, SettingsDialog
 from plagdef.model import models
@@ -38,11 +39,14 @@ class HomeController:
 
     def on_select_lang(self):
         settings.update({'lang': self.view.lang})
+        main.app.preload_nlp_model(self.view.lang)
 
     def on_open_click(self):
         dialog = FileDialog()
         if dialog.open():
-            matches = read_doc_pair_matches_from_json(dialog.selected_dir)
+            repo, entries = read_report_index_from_json(dialog.selected_dir)
+            # Reports without an index are read completely
+            matches = Report(repo, entries) if len(entries) else read_doc_pair_matches_from_json(dialog.selected_dir)
             if len(matches):
                 main.app.window.switch_to(ResultView, matches)
             else:
@@ -176,8 +180,8 @@ class ResultController:
     def _on_again(self):
         main.app.window.switch_to(HomeView)
 
-    def on_select_pair(self, doc_pair_matches: DocumentPairMatches):
-        self.matches_dialog.open(doc_pair_matches)
+    def on_select_pair(self, doc_pair_matches: DocumentPairMatches | LazyDocumentPairMatches):
+        self.matches_dialog.open(doc_pair_matches.resolve())
 
     def on_prev_match(self):
         self.matches_dialog.prev_match()
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import logging
 import os
 import signal
 import sys
@@ -10,11 +11,13 @@ from PySide6.QtWidgets import QApplication
 
 # noinspection PyUnresolvedReferences
 import plagdef.gui.resources
-from plagdef.app import find_matches, reanalyze_pair
+from plagdef.app import find_matches, reanalyze_pair, preload_nlp_model
+from plagdef.config import settings
 from plagdef.gui.controllers import HomeController, LoadingController, ErrorController, NoResultsController, \
     ResultController
 from plagdef.gui.views import MainWindow
 
+log = logging.getLogger(__name__)
 app = None
 
 
@@ -28,6 +31,13 @@ class MyQtApp(QApplication):
         self.window = MainWindow(self._views)
         global app
         app = self
+        self.preload_nlp_model(settings['lang'])
+
+    def preload_nlp_model(self, lang: str):
+        worker = Worker(preload_nlp_model, lang)
+        worker.signals.error.connect(lambda error: log.debug(f'Could not preload NLP model: {error[1]}'))
+        pool = QThreadPool.globalInstance()
+        pool.start(worker)
 
     def find_matches(self, docdir: tuple[str, bool], archive_docdir: [str, bool],
                      common_docdir: [str, bool], on_success, on_error):
@@ -1,12 +1,15 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from functools import cached_property, partial
+from typing import Callable
 
 from PySide6.QtCore import QAbstractTableModel, QModelIndex, Qt
 from PySide6.QtGui import QColor
 
 from plagdef.model import models
 from plagdef.model.models import MatchType
+from plagdef.repositories import DocumentPairMatchesJsonRepository, ReportEntry
 from plagdef.util import truncate
 
 
@@ -26,14 +29,69 @@ class DocumentPairMatches:
                                        sorted(typed_matches,
                                               key=lambda m, doc1=d1: m.frag_from_doc(doc1).start_char))
 
+    def resolve(self) -> DocumentPairMatches:
+        return self
+
     def __len__(self):
         return len(self.matches)
 
 
+@dataclass(frozen=True)
+class Report:
+    """An indexed report of which only the pairs' names and match counts are read upfront."""
+    repo: DocumentPairMatchesJsonRepository
+    entries: list[ReportEntry]
+
+    def __len__(self):
+        return len(self.entries)
+
+
+@dataclass(frozen=True)
+class DocumentInfo:
+    name: str
+    path: str
+
+
+@dataclass(frozen=True)
+class LazyDocumentPairMatches:
+    """A row of an indexed report. The matches and texts are decoded once the pair is first opened and kept."""
+    doc1: DocumentInfo
+    doc2: DocumentInfo
+    match_type: MatchType
+    match_count: int
+    load: Callable[[], models.DocumentPairMatches] = field(compare=False)
+
+    @classmethod
+    def from_entry(cls, entry: ReportEntry, match_type: MatchType, repo: DocumentPairMatchesJsonRepository) \
+        -> LazyDocumentPairMatches:
+        match_count = entry.match_counts.get(str(match_type), 0)
+        if match_count:
+            d1, d2 = sorted([DocumentInfo(entry.doc1_name, entry.doc1_path),
+                             DocumentInfo(entry.doc2_name, entry.doc2_path)], key=lambda doc: doc.name)
+            return LazyDocumentPairMatches(d1, d2, match_type, match_count, partial(repo.load, entry))
+
+    @property
+    def matches(self) -> list[models.Match]:
+        return self.resolve().matches
+
+    def resolve(self) -> DocumentPairMatches:
+        return self._resolved
+
+    @cached_property
+    def _resolved(self) -> DocumentPairMatches:
+        # Frozen dataclasses allow this, cached properties are stored in the instance dict without __setattr__
+        return DocumentPairMatches.from_model(self.load(), self.match_type)
+
+    def __len__(self):
+        return self.match_count
+
+
 class ResultsTableModel(QAbstractTableModel):
-    def __init__(self, match_type: MatchType, doc_pair_matches: list[models.DocumentPairMatches]):
+    def __init__(self, match_type: MatchType, doc_pair_matches: list[models.DocumentPairMatches] | Report):
         super().__init__()
-        self._doc_pair_matches = [DocumentPairMatches.from_model(matches, match_type) for matches in doc_pair_matches]
+        self._doc_pair_matches = [LazyDocumentPairMatches.from_entry(entry, match_type, doc_pair_matches.repo)
+                                  for entry in doc_pair_matches.entries] if isinstance(doc_pair_matches, Report) \
+            else [DocumentPairMatches.from_model(matches, match_type) for matches in doc_pair_matches]
         self._doc_pair_matches = sorted(filter(None, self._doc_pair_matches), key=lambda m: m.doc1.name)
 
     def headerData(self, section: int, orientation: Qt.Orientation, role: int = Qt.DisplayRole):
@@ -57,5 +115,5 @@ class ResultsTableModel(QAbstractTableModel):
         elif role == Qt.ToolTipRole:
             return doc_pair[index.column()].path
 
-    def doc_pair_matches(self, index: QModelIndex) -> DocumentPairMatches:
+    def doc_pair_matches(self, index: QModelIndex) -> DocumentPairMatches | LazyDocumentPairMatches:
         return self._doc_pair_matches[index.row()]
@@ -3,7 +3,6 @@ from __future__ import annotations
 import sys
 from pathlib import Path
 
-import pkg_resources
 from PySide6.QtCore import QFile, QIODevice, Qt
 from PySide6.QtGui import QCursor, QMovie
 from PySide6.QtUiTools import QUiLoader
@@ -14,16 +13,17 @@ from plagdef.gui.model import ResultsTableModel, DocumentPairMatches
 from plagdef.model import models
 from plagdef.util import version, truncate
 
+UI_DIR = Path(__file__).parent / 'ui'
 UI_FILES = {
-    'main_window': pkg_resources.resource_filename(__name__, 'ui/main_window.ui'),
-    'home_widget': pkg_resources.resource_filename(__name__, 'ui/home_widget.ui'),
-    'loading_widget': pkg_resources.resource_filename(__name__, 'ui/loading_widget.ui'),
-    'error_widget': pkg_resources.resource_filename(__name__, 'ui/error_widget.ui'),
-    'no_results_widget': pkg_resources.resource_filename(__name__, 'ui/no_results_widget.ui'),
-    'results_widget': pkg_resources.resource_filename(__name__, 'ui/results_widget.ui'),
-    'matches_dialog': pkg_resources.resource_filename(__name__, 'ui/matches_dialog.ui'),
-    'msg_dialog': pkg_resources.resource_filename(__name__, 'ui/msg_dialog.ui'),
-    'settings_dialog': pkg_resources.resource_filename(__name__, 'ui/settings_dialog.ui'),
+    'main_window': UI_DIR / 'main_window.ui',
+    'home_widget': UI_DIR / 'home_widget.ui',
+    'loading_widget': UI_DIR / 'loading_widget.ui',
+    'error_widget': UI_DIR / 'error_widget.ui',
+    'no_results_widget': UI_DIR / 'no_results_widget.ui',
+    'results_widget': UI_DIR / 'results_widget.ui',
+    'matches_dialog': UI_DIR / 'matches_dialog.ui',
+    'msg_dialog': UI_DIR / 'msg_dialog.ui',
+    'settings_dialog': UI_DIR / 'settings_dialog.ui',
 }
 
 
@@ -0,0 +1,173 @@
+from __future__ import annotations
+
+import json
+from collections import Counter, OrderedDict, defaultdict
+from pathlib import Path
+
+import numpy as np
+
+from plagdef.model.models import Document, DocumentPairMatches, Fragment, Match, MatchType, Sentence, Word
+from plagdef.model.stats import timed
+
+DOC_CACHE_SIZE = 64
+# Columns of the document and sentence tables
+TEXT_START, TEXT_END, SENT_START, SENT_END, VOCAB_START, VOCAB_END = range(6)
+START_CHAR, END_CHAR, COMMON, BOW_START, BOW_END, WORD_START, WORD_END = range(7)
+ARRAYS = ('texts', 'docs', 'sents', 'sent_docs', 'bows', 'vocabs', 'words', 'lemmas', 'lemma_offsets',
+          'posting_offsets', 'posting_sents')
+
+
+class MappedCorpus:
+    """Preprocessed documents stored in flat arrays which are memory-mapped read-only. Texts are stored as one UTF-8
+    blob, sentences, words, bags of words and vocabularies as offset tables with lemma IDs. Pickling the corpus only
+    pickles its directory, so worker processes map the same files and share their pages instead of unpickling a copy
+    of every document. Documents are only materialized on access and a few of them are kept.
+    If archive documents are given, an inverted index of their sentences is stored as well, see
+    ArchiveSentenceIndex."""
+
+    def __init__(self, dir_path: Path):
+        self._dir_path = dir_path
+        self._arrays = None
+        self._meta = None
+        self._docs = OrderedDict()  # <doc position, doc>, least recently used first
+        self._lemmas = {}  # <lemma ID, lemma>
+
+    @classmethod
+    @timed('corpus_mapping')
+    def write(cls, dir_path: Path, docs: list[Document], archive_start: int = None) -> MappedCorpus:
+        """Store the documents in the given order. Documents from position archive_start on are indexed as archive."""
+        texts, doc_rows, sent_rows, sent_docs, bows, vocabs, words = bytearray(), [], [], [], [], [], []
+        lemma_ids, postings = {}, []  # <lemma, ID>, [(lemma ID, sentence ID)]
+        for doc_pos, doc in enumerate(docs):
+            text = doc.text.encode('utf-8')
+            doc_row = [len(texts), len(texts) + len(text), len(sent_rows), 0, len(vocabs), 0]
+            texts.extend(text)
+            for sent in doc.sents(include_common=True):
+                sent_lemma_ids = [lemma_ids.setdefault(lemma, len(lemma_ids)) for lemma in sent.bow]
+                postings.extend((lemma_id, len(sent_rows)) for lemma_id in sent_lemma_ids) \
+                    if archive_start is not None and doc_pos >= archive_start and not sent.common else None
+                sent_rows.append([sent.start_char, sent.end_char, sent.common, len(bows), len(bows) + len(sent.bow),
+                                  len(words), len(words) + len(sent.words)])
+                sent_docs.append(doc_pos)
+                bows.extend(zip(sent_lemma_ids, sent.bow.values()))
+                words.extend((word.start_char, word.end_char) for word in sent.words)
+            vocabs.extend((lemma_ids.setdefault(lemma, len(lemma_ids)), sent_freq)
+                          for lemma, sent_freq in doc.vocab.items())
+            doc_row[SENT_END], doc_row[VOCAB_END] = len(sent_rows), len(vocabs)
+            doc_rows.append(doc_row)
+        encoded_lemmas = [lemma.encode('utf-8') for lemma in lemma_ids]
+        postings = np.array(postings, dtype=np.int64).reshape(-1, 2)
+        postings = postings[np.argsort(postings[:, 0], kind='stable')]
+        arrays = {
+            'texts': np.frombuffer(bytes(texts), dtype=np.uint8),
+            'docs': np.array(doc_rows, dtype=np.int64).reshape(-1, 6),
+            'sents': np.array(sent_rows, dtype=np.int64).reshape(-1, 7),
+            'sent_docs': np.array(sent_docs, dtype=np.int64),
+            'bows': np.array(bows, dtype=np.int64).reshape(-1, 2),
+            'vocabs': np.array(vocabs, dtype=np.int64).reshape(-1, 2),
+            'words': np.array(words, dtype=np.int64).reshape(-1, 2),
+            'lemmas': np.frombuffer(b''.join(encoded_lemmas), dtype=np.uint8),
+            'lemma_offsets': np.cumsum([0] + [len(lemma) for lemma in encoded_lemmas], dtype=np.int64),
+            'posting_offsets': np.searchsorted(postings[:, 0], np.arange(len(lemma_ids) + 1)).astype(np.int64),
+            'posting_sents': np.ascontiguousarray(postings[:, 1])
+        }
+        dir_path.mkdir(parents=True, exist_ok=True)
+        [np.save(dir_path / f'{name}.npy', array) for name, array in arrays.items()]
+        meta = [{'name': doc.name, 'path': doc.path, 'lang': doc.lang, 'urls': sorted(doc.urls)} for doc in docs]
+        (dir_path / 'docs.json').write_text(json.dumps(meta), encoding='utf-8')
+        return cls(dir_path)
+
+    def doc(self, doc_pos: int) -> Document:
+        if doc_pos in self._docs:
+            self._docs.move_to_end(doc_pos)
+            return self._docs[doc_pos]
+        doc = self._materialize(doc_pos)
+        self._docs[doc_pos] = doc
+        self._docs.popitem(last=False) if len(self._docs) > DOC_CACHE_SIZE else None
+        return doc
+
+    def __getitem__(self, doc_pos: int) -> Document:
+        return self.doc(doc_pos)
+
+    def _materialize(self, doc_pos: int) -> Document:
+        arrays, meta = self._mapped_arrays(), self._meta[doc_pos]
+        doc_row = arrays['docs'][doc_pos]
+        doc = Document(meta['name'], meta['path'],
+                       bytes(arrays['texts'][doc_row[TEXT_START]:doc_row[TEXT_END]]).decode('utf-8'))
+        doc.lang, doc.urls = meta['lang'], set(meta['urls'])
+        doc.vocab = Counter({self._lemma(lemma_id): int(sent_freq)
+                             for lemma_id, sent_freq in arrays['vocabs'][doc_row[VOCAB_START]:doc_row[VOCAB_END]]})
+        for sent_row in arrays['sents'][doc_row[SENT_START]:doc_row[SENT_END]].tolist():
+            bow = Counter({self._lemma(lemma_id): count
+                           for lemma_id, count in arrays['bows'][sent_row[BOW_START]:sent_row[BOW_END]].tolist()})
+            sent = Sentence(sent_row[START_CHAR], sent_row[END_CHAR], bow, doc)
+            sent.common = bool(sent_row[COMMON])
+            word_rows = arrays['words'][sent_row[WORD_START]:sent_row[WORD_END]].tolist()
+            sent.words = [Word(start_char, end_char, sent) for start_char, end_char in word_rows]
+            doc.add_sent(sent)
+        return doc
+
+    @timed('archive_query')
+    def archive_candidates(self, doc_pos: int, min_dice_sim: float) -> dict[int, list[tuple[int, int]]]:
+        """Query the archive index with the document's sentences. Returns the positions of the archive documents with
+        candidate sentences and the pairs of sentence indices of each."""
+        arrays = self._mapped_arrays()
+        sents, posting_offsets, posting_sents = arrays['sents'], arrays['posting_offsets'], arrays['posting_sents']
+        doc_row = arrays['docs'][doc_pos]
+        candidates = defaultdict(list)
+        for sent_id in range(doc_row[SENT_START], doc_row[SENT_END]):
+            if sents[sent_id, COMMON]:
+                continue
+            lemma_ids = arrays['bows'][sents[sent_id, BOW_START]:sents[sent_id, BOW_END], 0]
+            hits = [posting_sents[posting_offsets[lemma_id]:posting_offsets[lemma_id + 1]] for lemma_id in lemma_ids]
+            archive_sent_ids, common_lemmas = np.unique(
+                np.concatenate(hits) if len(hits) else np.empty(0, dtype=np.int64), return_counts=True)
+            bow_lens = sents[archive_sent_ids, BOW_END] - sents[archive_sent_ids, BOW_START]
+            sent_bow_len = sents[sent_id, BOW_END] - sents[sent_id, BOW_START]
+            for archive_sent_id in archive_sent_ids[2 * common_lemmas / (sent_bow_len + bow_lens) > min_dice_sim]:
+                archive_doc_pos = int(arrays['sent_docs'][archive_sent_id])
+                candidates[archive_doc_pos].append((int(sent_id - doc_row[SENT_START]),
+                                                    int(archive_sent_id - arrays['docs'][archive_doc_pos, SENT_START])))
+        return candidates
+
+    def _lemma(self, lemma_id: int) -> str:
+        if lemma_id not in self._lemmas:
+            start, end = self._arrays['lemma_offsets'][lemma_id:lemma_id + 2]
+            self._lemmas[lemma_id] = bytes(self._arrays['lemmas'][start:end]).decode('utf-8')
+        return self._lemmas[lemma_id]
+
+    def _mapped_arrays(self) -> dict[str, np.ndarray]:
+        if self._arrays is None:
+            self._arrays = {name: np.load(self._dir_path / f'{name}.npy', mmap_mode='r') for name in ARRAYS}
+            self._meta = json.loads((self._dir_path / 'docs.json').read_text(encoding='utf-8'))
+        return self._arrays
+
+    def __len__(self):
+        return len(self._mapped_arrays()['docs'])
+
+    def __getstate__(self):
+        return self._dir_path
+
+    def __setstate__(self, dir_path: Path):
+        self.__init__(dir_path)
+
+
+def encode_doc_pair_matches(doc_pair_matches: DocumentPairMatches, doc1_pos: int, doc2_pos: int) -> tuple:
+    """Encode the matches by character offsets, so that they can be sent between processes without the documents."""
+    doc1, doc2 = doc_pair_matches.doc1, doc_pair_matches.doc2
+    matches = []
+    for match_type in MatchType:
+        for match in doc_pair_matches.list(match_type):
+            frag1, frag2 = match.frag_from_doc(doc1), match.frag_from_doc(doc2)
+            matches.append((match_type.value, frag1.start_char, frag1.end_char, frag2.start_char, frag2.end_char))
+    return doc1_pos, doc2_pos, matches, sorted(doc_pair_matches.exceeded_budgets)
+
+
+def decode_doc_pair_matches(encoded: tuple, docs: list[Document]) -> DocumentPairMatches:
+    doc1_pos, doc2_pos, matches, exceeded_budgets = encoded
+    doc1, doc2 = docs[doc1_pos], docs[doc2_pos]
+    doc_pair_matches = DocumentPairMatches(doc1, doc2, [
+        Match(MatchType(type_value), Fragment(start1, end1, doc1), Fragment(start2, end2, doc2))
+        for type_value, start1, end1, start2, end2 in matches])
+    doc_pair_matches.exceeded_budgets.update(exceeded_budgets)
+    return doc_pair_matches
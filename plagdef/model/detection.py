@@ -1,24 +1,41 @@
 from __future__ import annotations
 
+import cProfile
+import hashlib
+import json
 import logging
+from collections.abc import Iterable
+from functools import partial
 from itertools import combinations, product
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter
 
 from tqdm import tqdm
+from werkzeug.utils import secure_filename
 
 from plagdef.model import matching
-from plagdef.model.matching import PipeComponents, VerbatimMatcher
+from plagdef.model.corpus import MappedCorpus, DOC_CACHE_SIZE, encode_doc_pair_matches, decode_doc_pair_matches
+from plagdef.model.matching import PipeComponents, VerbatimMatcher, PairBudgets
 from plagdef.model.models import Document, DocumentPairMatches
 from plagdef.model.pipeline.extension import ClusterBuilder
 from plagdef.model.pipeline.filtering import ClusterFilter
+from plagdef.model.pipeline.near_duplicates import NearDuplicateMatcher
 from plagdef.model.pipeline.preprocessing import Preprocessor
-from plagdef.model.pipeline.seeding import SeedFinder
+from plagdef.model.pipeline.seeding import SeedFinder, ArchiveSentenceIndex
+from plagdef.model.sharding import find_matches_sharded
+from plagdef.model.stats import stats
 from plagdef.util import parallelize
 
 log = logging.getLogger(__name__)
 
 
 class DocumentMatcher:
+    keep_archive_index = False  # Long-running processes reuse the index as long as the archive documents are the same
+    _kept_archive_index = (frozenset(), None)  # <(archive document ids, index)>
+
     def __init__(self, config: dict):
+        self._config = config
         self._preprocessor = Preprocessor(config['min_sent_len'], config['rem_stop_words'])
         self._seeder = SeedFinder(config['min_cos_sim'], config['min_dice_sim'])
         self._verbatim_matcher = VerbatimMatcher(config['min_verbatim_match_char_len'])
@@ -27,26 +44,219 @@ class DocumentMatcher:
         self._summary_cb = ClusterBuilder(config['adjacent_sents_gap_summary'], config['min_adjacent_sents_gap'],
                                           config['min_sent_number'], config['min_cluster_cos_sim'])
         self._cluster_filter = ClusterFilter(config['min_cluster_char_len'])
+        self._budgets = PairBudgets.from_config(config)
+        self._near_dup_matcher = NearDuplicateMatcher(config['near_duplicate_sim'],
+                                                      config['min_verbatim_match_char_len'])
+        self._archive_index = None
+        self._corpus = None
+
+    def preprocess(self, lang: str, docs: set[Document], common_docs=None, common_index=None):
+        self._preprocessor.preprocess(lang, docs, common_docs, common_index)
 
-    def preprocess(self, lang: str, docs: set[Document], common_docs=None):
-        self._preprocessor.preprocess(lang, docs, common_docs)
+    def common_index(self, lang: str, common_docs: list[Document]):
+        return self._preprocessor.common_index(lang, common_docs)
 
     def find_matches(self, docs: set[Document], archive_docs=None) -> list[DocumentPairMatches]:
-        doc_combs = set(combinations(docs, 2))
-        if archive_docs:
-            doc_overlap = docs.intersection(archive_docs)
-            log.warning(f'The following documents have counterparts with identical contents in the archive: '
-                        f'[{str(doc_overlap)[1:-1]}]') if len(doc_overlap) else None
-            doc_combs.update(product(docs, archive_docs.difference(doc_overlap)))
-        return parallelize(self._find_matches, list(doc_combs))
+        """Documents are matched among each other and with the archive documents. If the archive index is enabled,
+        each document queries an index of all archive sentences once instead of being matched with every archive
+        document, and only archive documents with candidate sentences are matched."""
+        if self._config['shard_queue_path']:
+            return find_matches_sharded(self._config, list(_doc_combs(docs, archive_docs)))
+        # The mapped corpus is written per run, a kept archive index is cheaper to reuse
+        if self._config['mapped_corpus'] and len(docs) + len(archive_docs if archive_docs else ()) > 2 \
+            and not (archive_docs and self._config['archive_index'] and self.keep_archive_index):
+            return self._find_matches_mapped(docs, archive_docs)
+        if not archive_docs or not self._config['archive_index']:
+            return parallelize(self._find_matches, list(_doc_combs(docs, archive_docs)))
+        matches = parallelize(self._find_matches, list(_doc_combs(docs)))
+        self._archive_index = self._build_archive_index(_archive_docs_without(docs, archive_docs))
+        try:
+            return matches + parallelize(self._query_archive, list(docs))
+        finally:
+            self._archive_index = None
+
+    def _find_matches_mapped(self, docs: set[Document], archive_docs=None) -> list[DocumentPairMatches]:
+        """Match with a memory-mapped copy of the documents, so that worker processes are sent document positions
+        instead of documents and share the mapped pages. Matches are sent back by character offsets."""
+        use_archive_index = archive_docs and self._config['archive_index']
+        docs, archive_docs = list(docs), list(_archive_docs_without(docs, archive_docs)) if archive_docs else []
+        with TemporaryDirectory(prefix='plagdef_corpus_') as corpus_dir:
+            self._corpus = MappedCorpus.write(Path(corpus_dir), docs + archive_docs,
+                                              len(docs) if use_archive_index else None)
+            try:
+                doc_pos_pairs = list(combinations(range(len(docs)), 2))
+                doc_pos_pairs.extend(product(range(len(docs)), range(len(docs), len(docs) + len(archive_docs)))) \
+                    if not use_archive_index else None
+                encoded_matches = parallelize(self._find_mapped_matches, doc_pos_pairs)
+                encoded_matches.extend(parallelize(self._query_mapped_archive, list(range(len(docs))))) \
+                    if use_archive_index else None
+            finally:
+                self._corpus = None
+        return [decode_doc_pair_matches(encoded, docs + archive_docs) for encoded in encoded_matches]
+
+    def _find_mapped_matches(self, doc_pos_pairs, pos=0) -> list[tuple]:
+        matches, fingerprints = [], {}
+        for doc1_pos, doc2_pos in tqdm(doc_pos_pairs, desc='Matching', unit='pair', total=len(doc_pos_pairs),
+                                       position=pos, leave=False):
+            # Fingerprints would keep every materialized document alive
+            fingerprints.clear() if len(fingerprints) > DOC_CACHE_SIZE else None
+            doc_pair_matches = self._match_pair(self._corpus.doc(doc1_pos), self._corpus.doc(doc2_pos), fingerprints)
+            matches.append(encode_doc_pair_matches(doc_pair_matches, doc1_pos, doc2_pos)) \
+                if len(doc_pair_matches) else None
+        return matches
+
+    def _query_mapped_archive(self, doc_positions, pos=0) -> list[tuple]:
+        matches, fingerprints = [], {}
+        for doc_pos in tqdm(doc_positions, desc='Matching with archive', unit='doc', total=len(doc_positions),
+                            position=pos, leave=False):
+            candidates = self._corpus.archive_candidates(doc_pos, self._config['min_dice_sim'])
+            for archive_doc_pos, sent_idx_pairs in candidates.items():
+                fingerprints.clear() if len(fingerprints) > DOC_CACHE_SIZE else None
+                doc, archive_doc = self._corpus.doc(doc_pos), self._corpus.doc(archive_doc_pos)
+                sents, archive_sents = doc.sents(include_common=True), archive_doc.sents(include_common=True)
+                sent_pairs = [(sents[sent_idx], archive_sents[archive_sent_idx])
+                              for sent_idx, archive_sent_idx in sent_idx_pairs]
+                doc_pair_matches = self._match_pair(doc, archive_doc, fingerprints, sent_pairs)
+                matches.append(encode_doc_pair_matches(doc_pair_matches, doc_pos, archive_doc_pos)) \
+                    if len(doc_pair_matches) else None
+        return matches
+
+    def _build_archive_index(self, archive_docs: set[Document]) -> ArchiveSentenceIndex:
+        # The kept index references its documents, so their ids cannot be reused by other documents meanwhile
+        doc_ids = frozenset(map(id, archive_docs))
+        if self.keep_archive_index and DocumentMatcher._kept_archive_index[0] == doc_ids:
+            return DocumentMatcher._kept_archive_index[1]
+        archive_index = ArchiveSentenceIndex(archive_docs)
+        DocumentMatcher._kept_archive_index = (doc_ids, archive_index) if self.keep_archive_index \
+            else (frozenset(), None)
+        return archive_index
+
+    def sweep(self, docs: set[Document], sim_thresholds: Iterable[float], archive_docs=None) \
+        -> dict[float, list[DocumentPairMatches]]:
+        """Find the matches for several similarity thresholds at once. Each threshold is used as minimum cosine,
+        dice and cluster cosine similarity. Seeds are only computed once per pair for the lowest threshold and then
+        filtered for the higher ones."""
+        sim_thresholds = sorted(set(sim_thresholds))
+        threshold_matches = parallelize(partial(self._sweep_matches, sim_thresholds=sim_thresholds),
+                                        list(_doc_combs(docs, archive_docs)))
+        sweep_results = {sim_th: [] for sim_th in sim_thresholds}
+        [sweep_results[sim_th].append(doc_pair_matches) for sim_th, doc_pair_matches in threshold_matches]
+        return sweep_results
+
+    def match_pairs(self, doc_pairs: list[tuple[Document, Document]]) -> list[DocumentPairMatches]:
+        return self._find_matches(doc_pairs)
 
     def _find_matches(self, doc_combs, pos=0) -> list[DocumentPairMatches]:
-        matches = []
+        matches, fingerprints = [], {}
         for doc1, doc2 in tqdm(doc_combs, desc='Matching', unit='pair', total=len(doc_combs), position=pos,
                                leave=False):
-            pipe = matching.Pipeline(doc1, doc2,
-                                     PipeComponents(self._seeder, self._verbatim_matcher, self._intelligent_cb,
-                                                    self._summary_cb, self._cluster_filter))
-            doc_pair_matches = pipe.find_matches()
+            doc_pair_matches = self._match_pair(doc1, doc2, fingerprints)
             matches.append(doc_pair_matches) if len(doc_pair_matches) else None
         return matches
+
+    def _query_archive(self, docs, pos=0) -> list[DocumentPairMatches]:
+        matches, fingerprints = [], {}
+        for doc in tqdm(docs, desc='Matching with archive', unit='doc', total=len(docs), position=pos, leave=False):
+            for archive_doc, sent_pairs in self._archive_index.candidates(doc, self._config['min_dice_sim']).items():
+                doc_pair_matches = self._match_pair(doc, archive_doc, fingerprints, sent_pairs)
+                matches.append(doc_pair_matches) if len(doc_pair_matches) else None
+        return matches
+
+    def _match_pair(self, doc1: Document, doc2: Document, fingerprints: dict[Document, frozenset],
+                    sent_pairs: list = None) -> DocumentPairMatches:
+        if self._near_duplicates(doc1, doc2, fingerprints):
+            return self._near_dup_matcher.align(doc1, doc2)
+        pipe = matching.Pipeline(doc1, doc2, self._default_pipe_components())
+        start = perf_counter()
+        doc_pair_matches = self._run_pipe(pipe, doc1, doc2, sent_pairs)
+        seconds = perf_counter() - start
+        stats.record_pair(doc1.name, doc2.name, seconds, **pipe.pair_stats)
+        profile_pair_time = self._config['profile_pair_time']
+        self._profile_pair(doc1, doc2, seconds, sent_pairs) \
+            if profile_pair_time is not None and seconds > profile_pair_time else None
+        return doc_pair_matches
+
+    def _run_pipe(self, pipe: matching.Pipeline, doc1: Document, doc2: Document,
+                  sent_pairs: list = None) -> DocumentPairMatches:
+        """Sentence pairs found by the archive index are seeded directly instead of comparing all sentences."""
+        seeds = self._seeder.seed(doc1, doc2, sent_pairs) if sent_pairs is not None else None
+        return pipe.find_matches(seeds)
+
+    def _near_duplicates(self, doc1: Document, doc2: Document, fingerprints: dict[Document, frozenset]) -> bool:
+        """Near duplicates skip the pipeline. Fingerprints are computed once per document and matching run."""
+        if not self._near_dup_matcher.enabled:
+            return False
+        for doc in (doc1, doc2):
+            fingerprints.update({doc: self._near_dup_matcher.fingerprint(doc)}) if doc not in fingerprints else None
+        if self._near_dup_matcher.near_duplicates(fingerprints[doc1], fingerprints[doc2]):
+            stats.count('near_duplicate_pairs')
+            return True
+        return False
+
+    def _profile_pair(self, doc1: Document, doc2: Document, seconds: float, sent_pairs: list = None):
+        """Match a slow pair again the same way under the profiler. The profile is stored together with the pair's
+        statistics so that the case can be reproduced. Documents of the same name from different directories get
+        different files."""
+        pipe = matching.Pipeline(doc1, doc2, self._default_pipe_components())
+        profiler = cProfile.Profile()
+        profiler.runcall(self._run_pipe, pipe, doc1, doc2, sent_pairs)
+        profile_dir = Path(self._config['profile_path'])
+        profile_dir.mkdir(parents=True, exist_ok=True)
+        path_digest = hashlib.blake2b(f'{doc1.path}\0{doc2.path}'.encode('utf-8'), digest_size=4).hexdigest()
+        file_name = secure_filename(f'{doc1.name}-{doc2.name}-{path_digest}')
+        profiler.dump_stats(profile_dir / f'{file_name}.prof')
+        with (profile_dir / f'{file_name}.json').open('w', encoding='utf-8') as file:
+            json.dump({'doc1': doc1.path, 'doc2': doc2.path, 'seconds': seconds,
+                       'sentences': [len(list(doc1.sents())), len(list(doc2.sents()))], **pipe.pair_stats}, file,
+                      indent=4)
+        log.info(f"Matching '{doc1.name}' and '{doc2.name}' took {seconds:.1f} seconds, wrote its profile to "
+                 f"'{profile_dir}'.")
+
+    def _default_pipe_components(self) -> PipeComponents:
+        return PipeComponents(self._seeder, self._verbatim_matcher, self._intelligent_cb, self._summary_cb,
+                              self._cluster_filter, self._budgets)
+
+    def _sweep_matches(self, doc_combs, pos=0, sim_thresholds=()) -> list[tuple[float, DocumentPairMatches]]:
+        pipe_comps = {sim_th: self._pipe_components(sim_th) for sim_th in sim_thresholds}
+        lowest_seeder = pipe_comps[sim_thresholds[0]].seeder
+        matches, fingerprints = [], {}
+        for doc1, doc2 in tqdm(doc_combs, desc='Matching', unit='pair', total=len(doc_combs), position=pos,
+                               leave=False):
+            if self._near_duplicates(doc1, doc2, fingerprints):
+                doc_pair_matches = self._near_dup_matcher.align(doc1, doc2)
+                matches.extend((sim_th, doc_pair_matches) for sim_th in sim_thresholds) \
+                    if len(doc_pair_matches) else None
+                continue
+            start = perf_counter()
+            candidate_seeds = lowest_seeder.seed(doc1, doc2)
+            verbatim_cache, pair_stats = {}, {}
+            for sim_th, comps in pipe_comps.items():
+                pipe = matching.Pipeline(doc1, doc2, comps)
+                doc_pair_matches = pipe.find_matches(comps.seeder.filter(candidate_seeds), verbatim_cache)
+                # The pair is recorded once, its counts are kept apart by threshold
+                pair_stats.update({f'{counter}@{sim_th}': number for counter, number in pipe.pair_stats.items()})
+                matches.append((sim_th, doc_pair_matches)) if len(doc_pair_matches) else None
+            stats.record_pair(doc1.name, doc2.name, perf_counter() - start, **pair_stats)
+        return matches
+
+    def _pipe_components(self, sim_th: float) -> PipeComponents:
+        intelligent_cb = ClusterBuilder(self._config['adjacent_sents_gap'], self._config['min_adjacent_sents_gap'],
+                                        self._config['min_sent_number'], sim_th)
+        summary_cb = ClusterBuilder(self._config['adjacent_sents_gap_summary'],
+                                    self._config['min_adjacent_sents_gap'], self._config['min_sent_number'], sim_th)
+        return PipeComponents(SeedFinder(sim_th, sim_th), self._verbatim_matcher, intelligent_cb, summary_cb,
+                              self._cluster_filter, self._budgets)
+
+
+def _doc_combs(docs: set[Document], archive_docs: set[Document] = None) -> set[tuple[Document, Document]]:
+    doc_combs = set(combinations(docs, 2))
+    if archive_docs:
+        doc_combs.update(product(docs, _archive_docs_without(docs, archive_docs)))
+    return doc_combs
+
+
+def _archive_docs_without(docs: set[Document], archive_docs: set[Document]) -> set[Document]:
+    doc_overlap = docs.intersection(archive_docs)
+    log.warning(f'The following documents have counterparts with identical contents in the archive: '
+                f'[{str(doc_overlap)[1:-1]}]') if len(doc_overlap) else None
+    return archive_docs.difference(doc_overlap)
@@ -1,46 +1,195 @@
 from __future__ import annotations
 
+import bz2
 import logging
-import os
-from functools import partial
+import socket
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError, wait
+from dataclasses import dataclass, field
+from hashlib import blake2b
 from mimetypes import guess_extension
 from pathlib import Path
+from pickle import dump, load, UnpicklingError
+from threading import Event, Lock, BoundedSemaphore
+from time import monotonic
 from urllib.parse import urlparse
 
 import requests
 from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
 from requests.exceptions import RequestException
-from tqdm.contrib.concurrent import thread_map
+from tqdm import tqdm
+from urllib3 import Retry
 from werkzeug.utils import secure_filename
 
 from plagdef.config import settings
 from plagdef.model.models import Document, File
 
 log = logging.getLogger(__name__)
+DOWNLOAD_WORKERS = 32
+RESOLVE_WORKERS = 32
+UNRESOLVED_HOST_TTL = 300
+_resolved_hosts = {}  # <host name, (resolvable, lookup time)>
+_resolved_hosts_lock = Lock()
 
 
-def download_all_external_sources(docs: set[Document], target_dir: Path) -> set[File]:
+def download_all_external_sources(docs: set[Document], target_dir: Path, cache_dir: Path = None) -> set[File]:
     urls = {url for doc in docs for url in doc.urls}
-    files = filter(None, thread_map(partial(_download_page, target_dir=target_dir), urls, max_workers=os.cpu_count(),
-                                    total=len(urls), desc='Downloading', unit='external sources'))
-    return set(files)
+    return Downloader(cache_dir).download(urls, target_dir)
 
 
-def download_external_sources(doc: Document, target_dir: Path) -> set[File]:
-    files = filter(None, thread_map(partial(_download_page, target_dir=target_dir), doc.urls,
-                                    max_workers=os.cpu_count(), total=len(doc.urls), desc='Downloading',
-                                    unit='external sources'))
-    return set(files)
+def download_external_sources(doc: Document, target_dir: Path, cache_dir: Path = None) -> set[File]:
+    return Downloader(cache_dir).download(doc.urls, target_dir)
 
 
-def _download_page(url: str, target_dir: Path) -> File:
+def resolvable_urls(urls: set[str], timeout: float = None) -> set[str]:
+    """Keep the URLs whose host names resolve. Resolvable hosts are only looked up once per process, hosts which did
+    not resolve are looked up again after a while, e.g. by a long-running daemon. All lookups run concurrently and
+    hosts which do not resolve within the timeout are dropped."""
+    timeout = timeout if timeout else settings['resolve_timeout']
+    hosts = {urlparse(url).hostname for url in urls} - {None}
+    with _resolved_hosts_lock:
+        unknown_hosts = {host for host in hosts if host not in _resolved_hosts or not _resolved_hosts[host][0]
+                         and monotonic() - _resolved_hosts[host][1] > UNRESOLVED_HOST_TTL}
+    if len(unknown_hosts):
+        executor = ThreadPoolExecutor(max_workers=RESOLVE_WORKERS)
+        futures = {executor.submit(_resolves, host): host for host in unknown_hosts}
+        done, not_done = wait(futures, timeout=timeout)
+        executor.shutdown(wait=False, cancel_futures=True)
+        with _resolved_hosts_lock:
+            _resolved_hosts.update({futures[future]: (future.result(), monotonic()) for future in done})
+        log.debug(f'Could not resolve {len(not_done)} host names within {timeout} seconds.') if len(not_done) else None
+    with _resolved_hosts_lock:
+        return {url for url in urls if _resolved_hosts.get(urlparse(url).hostname, (False,))[0]}
+
+
+def _resolves(host: str) -> bool:
+    try:
+        socket.getaddrinfo(host, None)
+        return True
+    except (socket.gaierror, UnicodeError):
+        return False
+
+
+class Downloader:
+    """Downloads pages concurrently through a shared connection pool. Connections per host are limited, every request
+    times out and the whole download phase is stopped after a total timeout. If a cache directory is given, responses
+    are revalidated with their ETag/Last-Modified headers instead of being downloaded again. Once stopped, the session
+    is closed and downloads still running store nothing."""
+
+    def __init__(self, cache_dir: Path = None, timeout: float = None, total_timeout: float = None,
+                 conns_per_host: int = None):
+        self._timeout = timeout if timeout else settings['download_timeout']
+        self._total_timeout = total_timeout if total_timeout else settings['download_total_timeout']
+        conns_per_host = conns_per_host if conns_per_host else settings['download_conns_per_host']
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=DOWNLOAD_WORKERS, pool_maxsize=conns_per_host,
+                              max_retries=Retry(total=2, read=0, backoff_factor=0.5, status_forcelist=(502, 503, 504)))
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+        self._host_slots = defaultdict(lambda: BoundedSemaphore(conns_per_host))
+        self._lock = Lock()
+        self._cache = HttpCache(cache_dir) if cache_dir else None
+        self._stopped = Event()
+
+    def download(self, urls: set[str], target_dir: Path) -> set[File]:
+        return set(self.download_by_url(urls, target_dir).values())
+
+    def download_by_url(self, urls: set[str], target_dir: Path) -> dict[str, File]:
+        files = {}
+        executor = ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS)
+        futures = {executor.submit(_download_page, url, target_dir, self): url for url in urls}
+        with tqdm(total=len(futures), desc='Downloading', unit='external sources') as progress:
+            try:
+                for future in as_completed(futures, timeout=self._total_timeout):
+                    file = future.result()
+                    files.update({futures[future]: file}) if file else None
+                    progress.update()
+            except TimeoutError:
+                skipped = sum(not future.done() for future in futures)
+                log.warning(f'Stopped downloading after {self._total_timeout} seconds, skipped {skipped} external '
+                            f'sources.')
+                self._stopped.set()
+                self._session.close()
+            finally:
+                executor.shutdown(wait=False, cancel_futures=True)
+        return files
+
+    def get(self, url: str) -> requests.Response | CachedResponse:
+        cached_resp = self._cache.get(url) if self._cache else None
+        headers = cached_resp.validators() if cached_resp else {}
+        with self._host_slot(urlparse(url).netloc):
+            self._raise_if_stopped(url)
+            resp = self._session.get(url, headers=headers, timeout=self._timeout)
+        if cached_resp and resp.status_code == 304:
+            return cached_resp
+        resp.raise_for_status()
+        self._raise_if_stopped(url)
+        self._cache.save(url, resp) if self._cache else None
+        return resp
+
+    def _raise_if_stopped(self, url: str):
+        if self._stopped.is_set():
+            raise RequestException(f'Stopped downloading "{url}" after the total timeout.')
+
+    def _host_slot(self, host: str) -> BoundedSemaphore:
+        with self._lock:
+            return self._host_slots[host]
+
+
+@dataclass(frozen=True)
+class CachedResponse:
+    headers: dict
+    content: bytes
+    encoding: str = None
+    status_code: int = field(default=200, compare=False)
+
+    @property
+    def text(self) -> str:
+        return self.content.decode(self.encoding if self.encoding else 'utf-8', errors='replace')
+
+    def validators(self) -> dict:
+        validators = {}
+        validators.update({'If-None-Match': self.headers['etag']}) if 'etag' in self.headers else None
+        validators.update({'If-Modified-Since': self.headers['last-modified']}) \
+            if 'last-modified' in self.headers else None
+        return validators
+
+
+class HttpCache:
+    """Stores responses which can be revalidated, i.e. those with an ETag or a Last-Modified header, keyed by URL."""
+
+    def __init__(self, dir_path: Path):
+        dir_path.mkdir(parents=True, exist_ok=True)
+        self._dir_path = dir_path
+
+    def save(self, url: str, resp: requests.Response):
+        headers = {key.lower(): value for key, value in resp.headers.items()}
+        if 'etag' in headers or 'last-modified' in headers:
+            with bz2.open(self._file_path(url), 'wb') as file:
+                dump(CachedResponse(headers, resp.content, resp.encoding), file)
+
+    def get(self, url: str) -> CachedResponse | None:
+        file_path = self._file_path(url)
+        if file_path.exists():
+            try:
+                with bz2.open(file_path, 'rb') as file:
+                    return load(file)
+            except (UnpicklingError, EOFError, OSError):
+                log.debug(f'Could not read cached response of "{url}".', exc_info=True)
+
+    def _file_path(self, url: str) -> Path:
+        return self._dir_path / f'{blake2b(url.encode(), digest_size=16).hexdigest()}.pdef'
+
+
+def _download_page(url: str, target_dir: Path, downloader: Downloader = None) -> File:
+    downloader = downloader if downloader else Downloader()
     parsed_url = urlparse(url)
     url_path = parsed_url.path.rstrip("/")
     filename = parsed_url.netloc if not url_path else f'{url_path[url_path.rindex("/") + 1:]}_from_{parsed_url.netloc}'
     filename = secure_filename(filename)
     try:
-        resp = requests.get(url)
-        resp.raise_for_status()
+        resp = downloader.get(url)
         mime_type = resp.headers['content-type'] if 'content-type' in resp.headers else 'text/html'
         binary = not mime_type.startswith('text')
         content = resp.content if binary else resp.text
@@ -1,11 +1,27 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from time import perf_counter
 
-from plagdef.model.models import Document, DocumentPairMatches, Match, MatchType, Cluster, Fragment
-from plagdef.model.pipeline.extension import ClusterBuilder
+from plagdef.model.models import Document, DocumentPairMatches, Match, MatchType, Cluster, Fragment, Seed
+from plagdef.model.pipeline.extension import ClusterBuilder, DeadlineExceeded
 from plagdef.model.pipeline.filtering import ClusterFilter
 from plagdef.model.pipeline.seeding import SeedFinder
+from plagdef.model.stats import stats, timed
+
+
+@dataclass(frozen=True)
+class PairBudgets:
+    """Limits of the work spent on a single document pair, None meaning no limit."""
+    max_seeds: int = None
+    max_cluster_sents: int = None
+    max_verbatim_cells: int = None
+    deadline: float = None
+
+    @classmethod
+    def from_config(cls, config: dict) -> PairBudgets:
+        return PairBudgets(config['max_pair_seeds'], config['max_cluster_sents'], config['max_verbatim_cells'],
+                           config['pair_deadline'])
 
 
 @dataclass(frozen=True)
@@ -15,6 +31,7 @@ class PipeComponents:
     intelligent_cb: ClusterBuilder
     summary_cb: ClusterBuilder
     cf: ClusterFilter
+    budgets: PairBudgets = field(default_factory=PairBudgets)
 
 
 class Pipeline:
@@ -22,16 +39,36 @@ class Pipeline:
         self._doc1 = doc1
         self._doc2 = doc2
         self._pipe_comps = pipe_comps
+        self.pair_stats = {}
 
-    def find_matches(self) -> DocumentPairMatches:
+    def find_matches(self, seeds: set[Seed] = None, verbatim_cache: dict = None) -> DocumentPairMatches:
+        """Find the matches of the document pair. Precomputed seeds can be passed to skip seeding, e.g. when
+        sweeping over several thresholds. Verbatim matches found for a cluster are stored in verbatim_cache if given
+        so that identical clusters are not matched twice.
+        If the pair exceeds one of its budgets, cheaper results are reported instead: Only the most similar seeds
+        are used, clusters too large for a verbatim breakdown are only reported as intelligent matches and the
+        remaining stages are skipped once the deadline has passed. The deadline is checked between stages and while
+        seeds are joined to clusters, a cluster extension which is cut off yields no clusters. The exceeded budgets
+        are flagged in the result."""
+        start = perf_counter()
+        budgets = self._pipe_comps.budgets
         doc_pair_matches = DocumentPairMatches(self._doc1, self._doc2)
-        seeds = self._pipe_comps.seeder.seed(self._doc1, self._doc2)
-        clusters = self._build_clusters(seeds, self._pipe_comps.intelligent_cb)
-        verbatim_matches = intelligent_matches = summary_matches = set()
+        if seeds is None:
+            seeds = self._pipe_comps.seeder.seed(self._doc1, self._doc2)
+        if budgets.max_seeds is not None and len(seeds) > budgets.max_seeds:
+            seeds = set(sorted(seeds, key=lambda seed: (seed.cos_sim, seed.dice_sim),
+                               reverse=True)[:budgets.max_seeds])
+            doc_pair_matches.exceeded_budgets.add('seeds')
+        clusters = self._build_clusters(seeds, self._pipe_comps.intelligent_cb, start, doc_pair_matches)
+        verbatim_matches = intelligent_matches = summary_matches = summary_clusters = set()
         if len(clusters):
-            verbatim_matches = self._pipe_comps.verbatim_matcher.find_verbatim_matches(clusters)
             intelligent_matches = {Match.from_cluster(MatchType.INTELLIGENT, cluster) for cluster in clusters}
-        summary_clusters = self._build_clusters(seeds, self._pipe_comps.summary_cb)
+            if not self._past_deadline(start, doc_pair_matches):
+                verbatim_clusters = self._verbatim_clusters(clusters, doc_pair_matches)
+                verbatim_matches = self._pipe_comps.verbatim_matcher.find_verbatim_matches(verbatim_clusters,
+                                                                                           verbatim_cache)
+        if not self._past_deadline(start, doc_pair_matches):
+            summary_clusters = self._build_clusters(seeds, self._pipe_comps.summary_cb, start, doc_pair_matches)
         if len(summary_clusters):
             sum_cluster_len_doc1, sum_cluster_len_doc2 = \
                 tuple(map(sum, zip(*(cluster.char_lengths() for cluster in summary_clusters))))
@@ -39,10 +76,39 @@ class Pipeline:
                 or sum_cluster_len_doc2 >= 3 * sum_cluster_len_doc1:
                 summary_matches = {Match.from_cluster(MatchType.SUMMARY, cluster) for cluster in summary_clusters}
         doc_pair_matches.update({*verbatim_matches, *intelligent_matches, *summary_matches})
+        self.pair_stats = {'seeds': len(seeds), 'clusters': len(clusters), 'summary_clusters': len(summary_clusters),
+                           'verbatim_cells': sum(VerbatimMatcher.table_cells(cluster) for cluster in clusters)}
+        stats.count('degraded_pairs') if len(doc_pair_matches.exceeded_budgets) else None
         return doc_pair_matches
 
-    def _build_clusters(self, seeds, cluster_builder: ClusterBuilder):
-        clusters = cluster_builder.extend(seeds)
+    def _past_deadline(self, start: float, doc_pair_matches: DocumentPairMatches) -> bool:
+        deadline = self._pipe_comps.budgets.deadline
+        if deadline is not None and perf_counter() - start > deadline:
+            doc_pair_matches.exceeded_budgets.add('deadline')
+            return True
+        return False
+
+    def _verbatim_clusters(self, clusters: set[Cluster], doc_pair_matches: DocumentPairMatches) -> set[Cluster]:
+        budgets, verbatim_clusters = self._pipe_comps.budgets, set()
+        for cluster in clusters:
+            if budgets.max_cluster_sents is not None \
+                and len(cluster.sents_doc1) + len(cluster.sents_doc2) > budgets.max_cluster_sents:
+                doc_pair_matches.exceeded_budgets.add('cluster_sents')
+            elif budgets.max_verbatim_cells is not None \
+                and VerbatimMatcher.table_cells(cluster) > budgets.max_verbatim_cells:
+                doc_pair_matches.exceeded_budgets.add('verbatim_cells')
+            else:
+                verbatim_clusters.add(cluster)
+        return verbatim_clusters
+
+    def _build_clusters(self, seeds, cluster_builder: ClusterBuilder, start: float,
+                        doc_pair_matches: DocumentPairMatches):
+        deadline = self._pipe_comps.budgets.deadline
+        try:
+            clusters = cluster_builder.extend(seeds, deadline=start + deadline if deadline is not None else None)
+        except DeadlineExceeded:
+            doc_pair_matches.exceeded_budgets.add('deadline')
+            return set()
         clusters = self._pipe_comps.cf.filter(clusters)
         return clusters
 
@@ -51,11 +117,17 @@ class VerbatimMatcher:
     def __init__(self, min_verbatim_match_char_len: int):
         self._min_verbatim_match_char_len = min_verbatim_match_char_len
 
-    def find_verbatim_matches(self, clusters: set[Cluster]) -> set[Match]:
+    @timed('verbatim_matching')
+    def find_verbatim_matches(self, clusters: set[Cluster], cache: dict = None) -> set[Match]:
         matches = set()
         for cluster in clusters:
-            cluster_matches = self._common_words(cluster)
-            matches.update(VerbatimMatcher._resolve_match_overlaps(cluster_matches))
+            if cache is not None and cluster in cache:
+                matches.update(cache[cluster])
+                continue
+            cluster_matches = VerbatimMatcher._resolve_match_overlaps(self._common_words(cluster))
+            if cache is not None:
+                cache[cluster] = cluster_matches
+            matches.update(cluster_matches)
         return matches
 
     def _common_words(self, cluster: Cluster) -> set[Match]:
@@ -80,6 +152,12 @@ class VerbatimMatcher:
                         verbatim_matches.add(Match(MatchType.VERBATIM, frag1, frag2))
         return verbatim_matches
 
+    @classmethod
+    def table_cells(cls, cluster: Cluster) -> int:
+        """Size of the lookup table of common words built for the cluster."""
+        words1, words2 = (sum(len(sent.words) for sent in sents) for sents in (cluster.sents_doc1, cluster.sents_doc2))
+        return (words1 + 1) * (words2 + 1)
+
     @classmethod
     def _resolve_match_overlaps(cls, matches: set[Match]) -> set[Match]:
         non_ol_matches = set()
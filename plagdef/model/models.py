@@ -302,10 +302,13 @@ class Match:
 
 
 class DocumentPairMatches:
+    exceeded_budgets = frozenset()  # Default of pairs from reports of former versions
+
     def __init__(self, doc1: Document, doc2: Document, matches: Iterable = None):
         self.doc1 = doc1
         self.doc2 = doc2
         self._matches = defaultdict(set)
+        self.exceeded_budgets = set()
         if matches:
             self.update(matches)
 
@@ -336,6 +339,13 @@ class DocumentPairMatches:
             return self._matches[str(match_type)]
         return set()
 
+    def frags_in_pair_order(self, match: Match) -> tuple[Fragment, Fragment]:
+        """Fragments of the match, the one of doc1 first."""
+        frag1, frag2 = match.frag_pair
+        # Compare by identity first, comparing documents by equality means comparing their texts
+        in_order = frag1.doc is self.doc1 or frag2.doc is self.doc2 or frag1.doc == self.doc1
+        return (frag1, frag2) if in_order else (frag2, frag1)
+
     def __len__(self):
         return sum(len(m) for m in self._matches.values())
 
@@ -2,7 +2,6 @@ import filecmp
 import tempfile
 from pathlib import Path
 
-import pkg_resources
 from PyPDF2 import PdfReader
 from fpdf import FPDF
 from selenium import webdriver
@@ -35,7 +34,7 @@ def translate_doc(doc: Document, target_lang: str):
 
 def _save_to_pdf(doc: Document, target_path: str):
     pdf = FPDF()
-    font_file = pkg_resources.resource_filename(__name__, str(Path('../../res/DejaVuSansCondensed.ttf')))
+    font_file = str(Path(__file__).parents[2] / 'res' / 'DejaVuSansCondensed.ttf')
     pdf.add_font('DejaVu', fname=font_file)
     pdf.set_font('DejaVu', size=12)
     pdf.add_page()
@@ -1,6 +1,9 @@
 from __future__ import annotations
 
+from time import perf_counter
+
 from plagdef.model.models import Seed, Cluster
+from plagdef.model.stats import timed
 
 
 class ClusterBuilder:
@@ -11,36 +14,45 @@ class ClusterBuilder:
         self._min_sent_number = min_sent_number
         self._min_cluster_cos_sim = min_cluster_cos_sim
 
-    def extend(self, seeds: set[Seed], adjacent_sents_gap: int = None) -> set[Cluster]:
+    @timed('extension')
+    def extend(self, seeds: set[Seed], adjacent_sents_gap: int = None, deadline: float = None) -> set[Cluster]:
+        """Join adjacent seeds to clusters. If a deadline is given as perf_counter time, DeadlineExceeded is raised
+        once it has passed."""
         if adjacent_sents_gap is None:
             adjacent_sents_gap = self._adjacent_sents_gap
-        clusters = _build_clusters(seeds, adjacent_sents_gap)
-        return self._validate(clusters, adjacent_sents_gap)
+        clusters = _build_clusters(seeds, adjacent_sents_gap, deadline)
+        return self._validate(clusters, adjacent_sents_gap, deadline)
 
-    def _validate(self, clusters: set[Cluster], adjacent_sents_gap: int) -> set[Cluster]:
+    def _validate(self, clusters: set[Cluster], adjacent_sents_gap: int, deadline: float = None) -> set[Cluster]:
         valid_clusters = set()
         for cluster in clusters:
             if cluster.cos_sim > self._min_cluster_cos_sim:
                 valid_clusters.add(cluster)
             elif adjacent_sents_gap > self._min_adjacent_sents_gap:
-                cluster_detections = self.extend(set(cluster.seeds), adjacent_sents_gap - 1)
+                cluster_detections = self.extend(set(cluster.seeds), adjacent_sents_gap - 1, deadline)
                 valid_clusters.update(cluster_detections)
         return valid_clusters
 
 
-def _build_clusters(seeds: set[Seed], adjacent_sents_gap: int) -> set[Cluster]:
-    doc1_clusters = _join_seeds(seeds, adjacent_sents_gap, first=True)
+class DeadlineExceeded(Exception):
+    pass
+
+
+def _build_clusters(seeds: set[Seed], adjacent_sents_gap: int, deadline: float = None) -> set[Cluster]:
+    doc1_clusters = _join_seeds(seeds, adjacent_sents_gap, first=True, deadline=deadline)
     clusters = set()
     for cluster in doc1_clusters:
-        clusters.update(_join_seeds(cluster.seeds, adjacent_sents_gap, first=False))
+        clusters.update(_join_seeds(cluster.seeds, adjacent_sents_gap, first=False, deadline=deadline))
     return clusters
 
 
-def _join_seeds(seeds: set[Seed], adjacent_sents_gap: int, first: bool) -> set[Cluster]:
+def _join_seeds(seeds: set[Seed], adjacent_sents_gap: int, first: bool, deadline: float = None) -> set[Cluster]:
     sorted_seeds = sorted(seeds, key=lambda s: s.sent1.start_char if first else s.sent2.start_char)
     clusters = set()
     seed_iter: enumerate = enumerate(sorted_seeds)
     for seed_idx, seed in seed_iter:
+        if deadline is not None and perf_counter() > deadline:
+            raise DeadlineExceeded()
         cluster_seeds = [seed]  # Cluster contains at least first seed
         for adj_seed in sorted_seeds[seed_idx + 1:]:  # For following seeds
             sent1 = cluster_seeds[-1].sent1 if first else cluster_seeds[-1].sent2
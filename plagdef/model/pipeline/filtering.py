@@ -3,12 +3,14 @@ from __future__ import annotations
 from networkx import Graph, articulation_points, is_empty
 
 from plagdef.model.models import Cluster, RatedCluster
+from plagdef.model.stats import timed
 
 
 class ClusterFilter:
     def __init__(self, min_cluster_char_len: int):
         self._min_cluster_char_len = min_cluster_char_len
 
+    @timed('filtering')
     def filter(self, clusters: set[Cluster]):
         resolved_clusters = _resolve_overlaps(clusters)
         return self._remove_small_clusters(resolved_clusters)
@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+from difflib import SequenceMatcher
+
+from plagdef.model.models import Document, DocumentPairMatches, Fragment, Match, MatchType, Word
+from plagdef.model.stats import timed
+
+SHINGLE_LEN = 5
+
+
+class NearDuplicateMatcher:
+    """Detects document pairs which are almost entirely identical by the Jaccard similarity of their word shingles
+    and aligns them by diffing their word sequences, which is far cheaper than seeding and clustering them."""
+
+    def __init__(self, min_jaccard_sim: float | None, min_verbatim_match_char_len: int):
+        self._min_jaccard_sim = min_jaccard_sim
+        self._min_verbatim_match_char_len = min_verbatim_match_char_len
+
+    @property
+    def enabled(self) -> bool:
+        return self._min_jaccard_sim is not None
+
+    def fingerprint(self, doc: Document) -> frozenset[int]:
+        word_texts = [word.text.lower() for word in _words(doc)]
+        return frozenset(hash(tuple(word_texts[idx:idx + SHINGLE_LEN]))
+                         for idx in range(max(len(word_texts) - SHINGLE_LEN + 1, min(len(word_texts), 1))))
+
+    def near_duplicates(self, fingerprint1: frozenset[int], fingerprint2: frozenset[int]) -> bool:
+        if not len(fingerprint1) or not len(fingerprint2):
+            return False
+        return len(fingerprint1 & fingerprint2) / len(fingerprint1 | fingerprint2) >= self._min_jaccard_sim
+
+    @timed('near_duplicate_alignment')
+    def align(self, doc1: Document, doc2: Document) -> DocumentPairMatches:
+        """Report each long run of identical words as verbatim match and the aligned content as a whole as
+        intelligent match."""
+        words1, words2 = _words(doc1), _words(doc2)
+        word_ids = {}
+        seq1 = [word_ids.setdefault(word.text.lower(), len(word_ids)) for word in words1]
+        seq2 = [word_ids.setdefault(word.text.lower(), len(word_ids)) for word in words2]
+        blocks = [block for block in SequenceMatcher(None, seq1, seq2, autojunk=False).get_matching_blocks()
+                  if block.size]
+        doc_pair_matches = DocumentPairMatches(doc1, doc2)
+        for idx1, idx2, size in blocks:
+            if sum(len(word) for word in words1[idx1:idx1 + size]) >= self._min_verbatim_match_char_len:
+                doc_pair_matches.add(_match(MatchType.VERBATIM, words1[idx1:idx1 + size], words2[idx2:idx2 + size]))
+        if len(blocks):
+            (first1, first2, _), (last1, last2, last_size) = blocks[0], blocks[-1]
+            match = _match(MatchType.INTELLIGENT, words1[first1:last1 + last_size], words2[first2:last2 + last_size])
+            doc_pair_matches.add(match) if match not in doc_pair_matches.list(MatchType.VERBATIM) else None
+        return doc_pair_matches
+
+
+def _words(doc: Document) -> list[Word]:
+    return [word for sent in doc.sents() for word in sent.words]
+
+
+def _match(match_type: MatchType, words1: list[Word], words2: list[Word]) -> Match:
+    return Match(match_type, Fragment(words1[0].start_char, words1[-1].end_char, words1[0].doc),
+                 Fragment(words2[0].start_char, words2[-1].end_char, words2[0].doc))
@@ -2,24 +2,57 @@ from __future__ import annotations
 
 import os
 import string
-from collections import Counter
+from collections import Counter, defaultdict
+from collections.abc import Iterable
 from functools import partial
+from threading import Lock
+from typing import TYPE_CHECKING
 from urllib.parse import urlparse
 
-import stanza
-from stanza import Pipeline
 from tqdm.contrib.concurrent import thread_map
 from urlextract import URLExtract
 
 from plagdef.model import stopwords
 from plagdef.model.models import Document, Sentence, Word
+from plagdef.model.stats import stats, timed
+
+if TYPE_CHECKING:
+    from stanza import Pipeline
 
 PRCS = 'tokenize,mwt,pos,lemma'
 PIPE_LVL = 'WARN'
 LOAD_LVL = 'INFO'
+TLD_MAX_AGE_DAYS = 7
+COMMON_LINE_BATCH_SIZE = 1000
+
+
+class NlpPipelineRegistry:
+    """Process-wide cache of Stanza pipelines so that model weights are loaded once per language and processors
+    rather than once per preprocessing call."""
+
+    def __init__(self):
+        self._pipes = {}  # <(lang, processors), Pipeline>
+        self._lock = Lock()
+
+    def get(self, lang: str, processors: str = PRCS) -> Pipeline:
+        with self._lock:
+            if (lang, processors) not in self._pipes:
+                import stanza
+                self._pipes[(lang, processors)] = stanza.Pipeline(lang, processors=processors,
+                                                                  logging_level=PIPE_LVL)
+            return self._pipes[(lang, processors)]
+
+    def release(self, lang: str = None):
+        """Drop the pipelines of the given language or all pipelines if no language is given."""
+        with self._lock:
+            for key in [key for key in self._pipes if lang is None or key[0] == lang]:
+                del self._pipes[key]
 
-# Update TLDs
-URLExtract().update_when_older(7)
+    def langs(self) -> set[str]:
+        return {lang for lang, _ in self._pipes}
+
+
+nlp_pipes = NlpPipelineRegistry()
 
 
 class Preprocessor:
@@ -27,15 +60,23 @@ class Preprocessor:
         self._min_sent_len = min_sent_len
         self._rem_stop_words = rem_stop_words
 
-    def preprocess(self, lang: str, docs: set[Document], common_docs: list[Document] = None):
+    @timed('preprocessing')
+    def preprocess(self, lang: str, docs: set[Document], common_docs: list[Document] = None,
+                   common_index: CommonContentIndex = None):
         nlp_model = _nlp_pipe(lang)
         stop_words = stopwords.ENGLISH if lang == 'en' else stopwords.GERMAN
-        common_word_lists = _common_word_lists(nlp_model, common_docs) if common_docs else []
-        thread_map(partial(self._preprocess, nlp_model=nlp_model, common_word_lists=common_word_lists,
+        if common_index is None:
+            common_index = CommonContentIndex(_common_word_lists(nlp_model, common_docs) if common_docs else [])
+        thread_map(partial(self._preprocess, nlp_model=nlp_model, common_index=common_index,
                            stop_words=stop_words), docs, max_workers=os.cpu_count(),
                    total=len(docs), desc='Preprocessing', unit='doc')
+        stats.count('preprocessed_docs', len(docs))
+
+    @timed('common_index')
+    def common_index(self, lang: str, common_docs: list[Document]) -> CommonContentIndex:
+        return CommonContentIndex(_common_word_lists(_nlp_pipe(lang), common_docs))
 
-    def _preprocess(self, doc: Document, nlp_model: Pipeline, common_word_lists: list[list[str]], stop_words: set[str]):
+    def _preprocess(self, doc: Document, nlp_model: Pipeline, common_index: CommonContentIndex, stop_words: set[str]):
         sents = nlp_model(doc.text).sentences
         for sent_idx, sent in enumerate(sents):
             filtered_words = _word_filter(sent.words)
@@ -49,7 +90,7 @@ class Preprocessor:
                 sentence.words = [Word(word.parent.start_char, word.parent.end_char, sentence)
                                   for word in filtered_words]
                 doc.add_sent(sentence)
-                if _sent_contains_common_words(sentence.words, common_word_lists):
+                if common_index.contains_line_of(word.text.lower() for word in sentence.words):
                     sentence.common = True
                 else:
                     for lemma in lemma_count.keys():
@@ -91,8 +132,40 @@ class Preprocessor:
         doc.vocab += Counter()  # Remove zero counts
 
 
-def _extract_urls(doc: Document, extractor=URLExtract()):
-    urls = extractor.find_urls(doc.text, only_unique=True, check_dns=True)
+_extractor = None
+_extractor_lock = Lock()
+_tlds_updated = False
+
+
+def update_tlds(max_age_days=TLD_MAX_AGE_DAYS) -> bool:
+    """Refresh the cached list of top level domains used for URL extraction if it is older than max_age_days, at
+    most once per process. A separate extractor is refreshed and then replaces the shared one, so that extraction
+    running meanwhile keeps using a consistent list."""
+    global _extractor, _tlds_updated
+    with _extractor_lock:
+        if _tlds_updated:
+            return False
+        _tlds_updated = True
+    extractor = URLExtract()
+    updated = extractor.update_when_older(max_age_days)
+    with _extractor_lock:
+        _extractor = extractor
+    return updated
+
+
+def _url_extractor() -> URLExtract:
+    global _extractor
+    with _extractor_lock:
+        if _extractor is None:
+            _extractor = URLExtract()
+        return _extractor
+
+
+def _extract_urls(doc: Document, extractor: URLExtract = None):
+    if extractor is None:
+        extractor = _url_extractor()
+    # Syntactic extraction only, host names are resolved in bulk before downloading (see download.resolvable_urls)
+    urls = extractor.find_urls(doc.text, only_unique=True)
     for url in urls:
         url = url[:-1] if url[-1] in string.punctuation else url
         parsed_url = urlparse(url, "https")
@@ -101,17 +174,16 @@ def _extract_urls(doc: Document, extractor=URLExtract()):
 
 
 def _nlp_pipe(lang: str) -> Pipeline:
-        return stanza.Pipeline(lang, processors=PRCS, logging_level=PIPE_LVL)
+    return nlp_pipes.get(lang)
 
 
 def _common_word_lists(pipe: Pipeline, common_docs: list[Document]) -> list[list[str]]:
+    lines = [line for doc in common_docs for line in doc.text.splitlines() if line.strip()]
     common_word_lists = []
-    for doc in common_docs:
-        for line in doc.text.splitlines():
-            parsed_line = pipe(line)
-            line_words = []
-            for sent in parsed_line.sentences:
-                [line_words.append(word.text.lower()) for word in _word_filter(sent.words)]
+    for batch_start in range(0, len(lines), COMMON_LINE_BATCH_SIZE):
+        # Every line is a separate stanza document so that sentences do not span multiple lines
+        for parsed_line in pipe.bulk_process(lines[batch_start:batch_start + COMMON_LINE_BATCH_SIZE]):
+            line_words = [word.text.lower() for sent in parsed_line.sentences for word in _word_filter(sent.words)]
             common_word_lists.append(line_words) if len(line_words) else None
     return common_word_lists
 
@@ -120,9 +192,23 @@ def _word_filter(stanza_words: list) -> list:
     return [word for word in stanza_words if word.upos != 'PUNCT' and word.text.isalnum() and len(word.text) > 1]
 
 
-def _sent_contains_common_words(sent_words: list[Word], common_word_lists: list[list[str]]) -> bool:
-    sent_word_texts = [word.text.lower() for word in sent_words]
-    for common_word_list in common_word_lists:
-        if all(common_word in sent_word_texts for common_word in common_word_list):
-            return True
-    return False
+class CommonContentIndex:
+    """Inverted index over the word sets of all lines in the common documents.
+    A sentence is common if it contains every word of at least one line. Such a line's rarest word in particular must
+    be part of the sentence, so each line is only indexed under its rarest word. A sentence then merely has to check the
+    few lines indexed under its own words instead of every common line."""
+
+    def __init__(self, common_word_lists: list[list[str]]):
+        self._lines = list({frozenset(word_list) for word_list in common_word_lists if len(word_list)})
+        word_freqs = Counter(word for line in self._lines for word in line)
+        self._line_ids = defaultdict(list)  # <rarest word, line ids>
+        for line_id, line in enumerate(self._lines):
+            self._line_ids[min(line, key=lambda word: (word_freqs[word], word))].append(line_id)
+
+    def contains_line_of(self, sent_words: Iterable[str]) -> bool:
+        sent_words = set(sent_words)
+        return any(self._lines[line_id] <= sent_words
+                   for word in sent_words if word in self._line_ids for line_id in self._line_ids[word])
+
+    def __len__(self):
+        return len(self._lines)
@@ -1,11 +1,13 @@
 from __future__ import annotations
 
 import math
+from collections import Counter, defaultdict
+from collections.abc import Iterable
 from typing import Union
 
 from plagdef import util
-from plagdef.model.models import Seed
-from plagdef.model.pipeline.preprocessing import Sentence, Document
+from plagdef.model.models import Seed, Sentence, Document
+from plagdef.model.stats import timed
 
 
 class SeedFinder:
@@ -13,16 +15,23 @@ class SeedFinder:
         self._min_cos_sim = min_cos_sim
         self._min_dice_sim = min_dice_sim
 
-    def seed(self, doc1: Document, doc2: Document) -> set[Seed]:
+    @timed('seeding')
+    def seed(self, doc1: Document, doc2: Document, sent_pairs: list[tuple[Sentence, Sentence]] = None) -> set[Seed]:
+        """Compare all sentences of both documents, or only the given candidate sentence pairs."""
         _vectorize_sents(doc1, doc2)
         seeds = set()
-        for doc1_sent in doc1.sents():
-            for doc2_sent in doc2.sents():
-                seed = self._match(doc1_sent, doc2_sent)
-                if seed:
-                    seeds.add(seed)
+        if sent_pairs is None:
+            sent_pairs = ((doc1_sent, doc2_sent) for doc1_sent in doc1.sents() for doc2_sent in doc2.sents())
+        for doc1_sent, doc2_sent in sent_pairs:
+            seed = self._match(doc1_sent, doc2_sent)
+            if seed:
+                seeds.add(seed)
         return seeds
 
+    def filter(self, seeds: set[Seed]) -> set[Seed]:
+        """Keep the seeds which also satisfy this seeder's thresholds, e.g. seeds found with lower thresholds."""
+        return {seed for seed in seeds if seed.cos_sim > self._min_cos_sim and seed.dice_sim > self._min_dice_sim}
+
     def _match(self, sent1: Sentence, sent2: Sentence) -> Union[Seed, None]:
         cos_sim = util.cos_sim(sent1.tf_isf_bow, sent2.tf_isf_bow)
         dice_sim = util.dice_sim(sent1.tf_isf_bow, sent2.tf_isf_bow)
@@ -30,6 +39,39 @@ class SeedFinder:
             return Seed(sent1, sent2, cos_sim, dice_sim)
 
 
+class ArchiveSentenceIndex:
+    """Inverted index of the archive's sentences, mapping each lemma to the sentences containing it. A document
+    queries it once to get the sentence pairs of all archive documents which can reach the minimum dice similarity.
+    The dice similarity only depends on the number of common lemmas, so no other sentence pair can become a seed."""
+
+    def __init__(self, archive_docs: Iterable[Document]):
+        # The documents must be pickled before their sentences, they restore their sentences' state
+        self._docs = list(archive_docs)
+        self._postings = defaultdict(list)  # <lemma, [sentence]>
+        for doc in self._docs:
+            for sent in doc.sents():
+                [self._postings[lemma].append(sent) for lemma in sent.bow]
+
+    @timed('archive_query')
+    def candidates(self, doc: Document, min_dice_sim: float) -> dict[Document, list[tuple[Sentence, Sentence]]]:
+        candidates = defaultdict(list)
+        for sent in doc.sents():
+            common_lemmas, archive_sents = Counter(), {}  # Keyed by identity, comparing sentences compares texts
+            for lemma in sent.bow:
+                for archive_sent in self._postings.get(lemma, ()):
+                    common_lemmas[id(archive_sent)] += 1
+                    archive_sents[id(archive_sent)] = archive_sent
+            for sent_id, common_lemma_count in common_lemmas.items():
+                archive_sent = archive_sents[sent_id]
+                if 2 * common_lemma_count / (len(sent.bow) + len(archive_sent.bow)) > min_dice_sim:
+                    candidates[archive_sent.doc].append((sent, archive_sent))
+        return candidates
+
+    def __len__(self):
+        return len(self._postings)
+
+
+@timed('vectorization')
 def _vectorize_sents(doc1: Document, doc2: Document):
     """
     Compute the tf-isf = tf x ln(N/sf), N being the number of sentences in corpus
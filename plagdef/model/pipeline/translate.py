@@ -1,73 +1,206 @@
 from __future__ import annotations
 
-import concurrent
 import logging
+import os
 import re
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from functools import partial
-from time import sleep
+from collections import OrderedDict
+from collections.abc import MutableMapping, Callable
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from hashlib import blake2b
+from queue import Queue
+from time import sleep, monotonic
 
 import requests
 from deep_translator import GoogleTranslator
 from deep_translator.exceptions import RequestError, TooManyRequests
-from langdetect import detect, LangDetectException
+from langdetect import detect, LangDetectException, DetectorFactory
 from tqdm import tqdm
 
 from plagdef.model.models import Document
-from plagdef.model.pipeline.doc_translate import translate_doc, TranslationError
 
 WEBSHARE_PROXIES = "https://proxy.webshare.io/proxy/list/download/rzeoaimkyxecclzdabargzhwodnrgicaedlyppgc/-/http" \
                    "/username/direct/"
+# The limit of Google Translate Web is less than 5000 chars per request
+TRANSLATION_CHUNK_LEN = 4999
+MAX_TRANSLATION_ATTEMPTS = 5
+MIN_BACKOFF, MAX_BACKOFF = 0.5, 60.
+# Languages are detected on a few evenly spaced samples, which is a lot faster for long documents
+LANG_SAMPLE_COUNT, LANG_SAMPLE_LEN = 3, 1000
+LANG_DETECT_PARALLEL_MIN = 16
+LANG_CACHE_SIZE = 10000
 
 log = logging.getLogger(__name__)
+_detected_langs = OrderedDict()  # <(detector, text digest), language>, least recently used first
+
+
+def detect_lang(docs: set[Document], detector: Callable[[str], str | None] = None) -> None:
+    """Detect the documents' languages on a few samples of their texts. Documents are processed in parallel and
+    results of the most recently seen texts are cached by text digest. Any function which maps a text to a language
+    code can serve as detector."""
+    detector = detector if detector else langdetect_lang
+    docs = list(docs)
+    keys = [(detector, blake2b(doc.text.encode(), digest_size=16).hexdigest()) for doc in docs]
+    detected_langs = {key: _detected_langs[key] for key in keys if key in _detected_langs}
+    [_detected_langs.move_to_end(key) for key in detected_langs]
+    unknown_docs = {key: doc for key, doc in zip(keys, docs) if key not in detected_langs}
+    samples = [_lang_sample(doc.text) for doc in unknown_docs.values()]
+    if len(samples) < LANG_DETECT_PARALLEL_MIN:
+        langs = list(map(detector, samples))
+    else:
+        with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+            langs = list(executor.map(detector, samples, chunksize=max(1, len(samples) // os.cpu_count())))
+    detected_langs.update(zip(unknown_docs.keys(), langs))
+    _detected_langs.update(zip(unknown_docs.keys(), langs))
+    while len(_detected_langs) > LANG_CACHE_SIZE:
+        _detected_langs.popitem(last=False)
+    for key, doc in zip(keys, docs):
+        lang = detected_langs[key]
+        doc.lang = lang if lang or not doc.text else doc.lang
+
+
+def langdetect_lang(text: str) -> str | None:
+    # Without a fixed seed langdetect may return different languages for the same text
+    DetectorFactory.seed = 0
+    try:
+        return detect(text) if text else None
+    except LangDetectException:
+        return None
 
 
-def detect_lang(docs: set[Document]) -> None:
-    for doc in docs:
-        try:
-            doc.lang = detect(doc.text) if doc.text else None
-        except LangDetectException:
-            continue
+def _lang_sample(text: str) -> str:
+    if len(text) <= LANG_SAMPLE_COUNT * LANG_SAMPLE_LEN:
+        return text
+    step = (len(text) - LANG_SAMPLE_LEN) // (LANG_SAMPLE_COUNT - 1)
+    return "\n".join(text[idx * step:idx * step + LANG_SAMPLE_LEN] for idx in range(LANG_SAMPLE_COUNT))
 
 
 def docs_in_other_langs(docs: set[Document], expected_lang: str) -> set[Document]:
     return {doc for doc in docs if doc.lang != expected_lang}
 
 
-def translate(docs: set[Document], target_lang: str) -> set[Document]:
-    proxies = _get_proxies()
+def translate(docs: set[Document], target_lang: str, backend: GoogleTranslatorBackend = None,
+              cache: MutableMapping = None) -> set[Document]:
+    """Translate the documents which are not in the target language. Translations are looked up in and added to the
+    cache, chunk by chunk for regular documents and as a whole for large documents. Returns the translated documents,
+    documents which could not be translated keep their language and are skipped by the callers."""
+    cache = cache if cache is not None else {}
+    foreign_docs = {doc for doc in docs if doc.lang != target_lang}
+    small_docs = {doc for doc in foreign_docs if len(doc.text) < 50000}
     translated = set()
-    for doc in tqdm(docs, desc='Translating', unit='doc'):
-        if doc.lang != target_lang:
-            if len(doc.text) < 50000:
-                _translate(doc, target_lang, proxies)
+    if len(small_docs):
+        with TranslationScheduler(backend if backend else GoogleTranslatorBackend(), cache) as scheduler:
+            translated = scheduler.translate(small_docs, target_lang)
+    large_docs = foreign_docs.difference(small_docs)
+    for doc in tqdm(large_docs, desc='Translating large documents', unit='doc') if len(large_docs) else []:
+        key = _chunk_key(doc.text, target_lang)
+        if key in cache:
+            doc.text, doc.lang = cache[key], target_lang
+            continue
+        _translate_large_doc(doc, target_lang)
+        cache.update({key: doc.text}) if doc.lang == target_lang else None
+    return translated.union(doc for doc in large_docs if doc.lang == target_lang)
+
+
+class GoogleTranslatorBackend:
+    """Translates via Google Translate Web, each slot sends its requests through another proxy. The proxies are only
+    fetched once a translation is actually requested."""
+
+    def __init__(self, proxies: list[str] = None):
+        self._proxies = proxies
+
+    @property
+    def slots(self) -> int:
+        if self._proxies is None:
+            self._proxies = _get_proxies()
+        return len(self._proxies)
+
+    def translate(self, text: str, target_lang: str, slot: int) -> str:
+        return GoogleTranslator(target=target_lang, proxies={"https": self._proxies[slot]}).translate(text=text)
+
+
+class TranslationScheduler:
+    """Translates the chunks of many documents concurrently on one pool with a worker per backend slot. Slots which
+    are rate limited back off exponentially, successful requests shrink their delay again. Translated chunks are
+    cached by text hash and target language, so equal chunks are only translated once."""
+
+    def __init__(self, backend, cache: MutableMapping = None):
+        self._backend = backend
+        self._cache = cache if cache is not None else {}
+        self._slots = Queue()
+        self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._executor.shutdown(wait=True, cancel_futures=True) if self._executor else None
+
+    def translate(self, docs: set[Document], target_lang: str) -> set[Document]:
+        doc_chunks = {doc: [(_chunk_key(chunk, target_lang), chunk)
+                            for chunk in _split_text_at_punct(doc.text, TRANSLATION_CHUNK_LEN)] for doc in docs}
+        pending = {key: chunk for chunks in doc_chunks.values() for key, chunk in chunks if key not in self._cache}
+        futures = {self._pool().submit(self._translate_chunk, chunk, target_lang): key
+                   for key, chunk in pending.items()}
+        for future in tqdm(as_completed(futures), desc='Translating', unit='chunk', total=len(futures)):
+            translation = future.result()
+            self._cache.update({futures[future]: translation}) if translation is not None else None
+        translated = set()
+        for doc, chunks in doc_chunks.items():
+            if all(key in self._cache for key, _ in chunks):
+                doc.text = "".join(self._cache[key] for key, _ in chunks)
+                doc.lang = target_lang
                 translated.add(doc)
             else:
-                _translate_large_doc(doc, target_lang)
-    return translated
-
-
-def _translate(doc: Document, target_lang: str, proxies: list[str]) -> None:
-    # The limit of Google Translate Web is less than 5000 chars per request
-    chunks = {(i, chunk) for i, chunk in enumerate(_split_text_at_punct(doc.text, 4999))}
-    translated = set()
-    while len(chunks) > len(translated):
-        chunks = chunks.difference(translated)
-        executor = ThreadPoolExecutor(len(proxies))
-        futures = [executor.submit(partial(_translate_chunk, target_lang=target_lang,
-                                           proxy=proxies[i % len(proxies)]), chunk) for i, chunk in enumerate(chunks)]
-        try:
-            for future in as_completed(futures, timeout=30):
-                result = future.result()
-                if result:
-                    translated.add(result)
-        except concurrent.futures.TimeoutError:
-            pass
-        finally:
-            executor.shutdown(wait=False, cancel_futures=True)
-    chunk_texts = [chunk[1] for chunk in sorted(translated, key=lambda chunk: chunk[0])]
-    doc.text = "".join(chunk_texts)
-    doc.lang = target_lang
+                log.warning(f"Could not translate '{doc.name}', it is skipped.")
+        return translated
+
+    def _pool(self) -> ThreadPoolExecutor:
+        # Created on first use, so that runs which are fully cached do not need the backend at all
+        if self._executor is None:
+            [self._slots.put(_Slot(idx)) for idx in range(self._backend.slots)]
+            self._executor = ThreadPoolExecutor(max_workers=self._backend.slots)
+        return self._executor
+
+    def _translate_chunk(self, chunk: str, target_lang: str) -> str | None:
+        if not chunk.strip():
+            return chunk
+        for _ in range(MAX_TRANSLATION_ATTEMPTS):
+            slot = self._slots.get()
+            try:
+                slot.wait()
+                translation = self._backend.translate(chunk, target_lang, slot.idx)
+                slot.succeeded()
+                return translation if translation is not None else chunk
+            except TooManyRequests:
+                slot.rate_limited()
+            except RequestError:
+                log.debug('Translation request failed.', exc_info=True)
+            finally:
+                self._slots.put(slot)
+
+
+class _Slot:
+    def __init__(self, idx: int):
+        self.idx = idx
+        self._delay = 0.
+        self._not_before = 0.
+
+    def wait(self):
+        sleep(max(0., self._not_before - monotonic()))
+
+    def rate_limited(self):
+        self._delay = min(MAX_BACKOFF, max(MIN_BACKOFF, self._delay * 2))
+        self._not_before = monotonic() + self._delay
+
+    def succeeded(self):
+        self._delay = self._delay / 2 if self._delay > MIN_BACKOFF else 0.
+
+
+def _chunk_key(chunk: str, target_lang: str) -> tuple[str, str]:
+    return blake2b(chunk.encode(), digest_size=16).hexdigest(), target_lang
 
 
 def _split_text_at_punct(text: str, max_len: int, chunks: list[str] = None) -> list[str]:
@@ -81,14 +214,6 @@ def _split_text_at_punct(text: str, max_len: int, chunks: list[str] = None) -> l
     return _split_text_at_punct(text[match.end() if match else max_len:], max_len, chunks)
 
 
-def _translate_chunk(chunk: tuple[int, str], target_lang: str, proxy: str):
-    try:
-        sleep(1)
-        return chunk[0], GoogleTranslator(target=target_lang, proxies={"https": proxy}).translate(text=chunk[1])
-    except (RequestError, TooManyRequests):
-        return None
-
-
 def _get_proxies() -> list[str]:
     proxies = []
     for proxy in requests.get(WEBSHARE_PROXIES).text.splitlines():
@@ -98,6 +223,8 @@ def _get_proxies() -> list[str]:
 
 
 def _translate_large_doc(doc: Document, target_lang: str):
+    # Selenium and its web driver manager are only needed for large documents
+    from plagdef.model.pipeline.doc_translate import translate_doc, TranslationError
     try:
         translate_doc(doc, target_lang)
     except TranslationError as e:
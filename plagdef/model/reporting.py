@@ -1,28 +1,46 @@
 from __future__ import annotations
 
+from collections import defaultdict
+from io import StringIO
+from typing import TextIO
+
 from plagdef.model.models import DocumentPairMatches, MatchType
 
+REPORT_CHUNK_LINES = 10000
+
 
 def generate_text_report(matches: list[DocumentPairMatches]) -> str:
-    report = ''
-    for match_type in MatchType:
-        wrote_heading = False
-        for doc_pair_matches in matches:
+    report = StringIO()
+    write_text_report(matches, report)
+    return report.getvalue()
+
+
+def write_text_report(matches: list[DocumentPairMatches], stream: TextIO, chunk_lines=REPORT_CHUNK_LINES):
+    """Write the report to the stream in chunks of lines, so that large reports are never held in memory as a
+    whole."""
+    pairs_by_type = defaultdict(list)
+    for doc_pair_matches in matches:
+        for match_type in MatchType:
             typed_matches = doc_pair_matches.list(match_type)
-            if len(typed_matches):
-                if not wrote_heading:
-                    report += f'{str(match_type).capitalize()} matches:\n'
-                    wrote_heading = True
-                report += f"  Pair('{doc_pair_matches.doc1.path}', '{doc_pair_matches.doc2.path}'):\n"
-                for match in sorted(typed_matches, key=lambda m: m.frag_from_doc(doc_pair_matches.doc1).start_char):
-                    frag1, frag2 = match.frag_from_doc(doc_pair_matches.doc1), match.frag_from_doc(
-                        doc_pair_matches.doc2)
-                    report += f'    Match(Fragment({frag1.start_char}, {frag1.end_char}), Fragment(' \
-                              f'{frag2.start_char}, {frag2.end_char}))\n'
-    intro = 'No matches found.'
-    if report:
-        intro = f'Found {len(matches) if len(matches) else "no"} suspicious document pair' \
-                f'{"s" if len(matches) > 1 else ""}.\n' \
-                'Reporting matches for each pair like this:\n' \
-                f'  Match(Fragment(start_char, end_char), Fragment(start_char, end_char))\n\n'
-    return intro + report
+            pairs_by_type[match_type].append((doc_pair_matches, typed_matches)) if len(typed_matches) else None
+    if not len(pairs_by_type):
+        stream.write('No matches found.')
+        return
+    lines = [f'Found {len(matches)} suspicious document pair{"s" if len(matches) > 1 else ""}.\n',
+             'Reporting matches for each pair like this:\n',
+             '  Match(Fragment(start_char, end_char), Fragment(start_char, end_char))\n\n']
+    for match_type in filter(lambda t: t in pairs_by_type, MatchType):
+        lines.append(f'{str(match_type).capitalize()} matches:\n')
+        for doc_pair_matches, typed_matches in pairs_by_type[match_type]:
+            exceeded_budgets = doc_pair_matches.exceeded_budgets
+            budget_note = f" [incomplete, exceeded budgets: {', '.join(sorted(exceeded_budgets))}]" \
+                if len(exceeded_budgets) else ''
+            lines.append(f"  Pair('{doc_pair_matches.doc1.path}', '{doc_pair_matches.doc2.path}'){budget_note}:\n")
+            for frag1, frag2 in sorted((doc_pair_matches.frags_in_pair_order(match) for match in typed_matches),
+                                       key=lambda frags: frags[0].start_char):
+                lines.append(f'    Match(Fragment({frag1.start_char}, {frag1.end_char}), Fragment('
+                             f'{frag2.start_char}, {frag2.end_char}))\n')
+                if len(lines) >= chunk_lines:
+                    stream.write(''.join(lines))
+                    lines.clear()
+    stream.write(''.join(lines))
@@ -0,0 +1,260 @@
+from __future__ import annotations
+
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import socket
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from threading import Event, Thread
+from time import sleep, time
+from uuid import uuid4
+
+from plagdef.model.corpus import MappedCorpus, encode_doc_pair_matches, decode_doc_pair_matches
+from plagdef.model.models import Document, DocumentPairMatches
+from plagdef.model.stats import Stats, stats, run_collecting_stats
+
+log = logging.getLogger(__name__)
+POLL_INTERVAL = 0.5
+
+
+@dataclass(frozen=True)
+class Shard:
+    name: str
+    path: Path
+    pairs: list[list[int]]
+    attempts: int
+
+
+class ShardQueue:
+    """Queue of the document pair shards of one job in a directory which all nodes can access, e.g. a network share.
+    Every job has its own subdirectory, so several coordinators can share a queue directory. A job consists of its
+    matching config and its preprocessed documents stored as mapped corpus, shards refer to documents by their
+    position in it. Everything in the queue directory is stored as JSON or plain arrays, never pickled, so workers
+    cannot be made to run code by anyone who can write to the directory. Shards are claimed by moving their file,
+    which is atomic, so any number of workers on any number of nodes can pull from the queue. A shard whose worker
+    fails or stops renewing its claim is put back until it has been attempted too often."""
+
+    def __init__(self, queue_dir: Path, job_id: str):
+        self.job_id = job_id
+        self._dir_path = queue_dir / 'jobs' / job_id
+        self._job_info = None
+
+    @classmethod
+    def submit(cls, queue_dir: Path, config: dict, docs: list[Document], pairs: list[tuple[int, int]]) -> ShardQueue:
+        if not queue_dir.is_dir():
+            raise NotADirectoryError(f"The given path '{queue_dir}' does not point to an existing directory!")
+        queue = cls(queue_dir, uuid4().hex)
+        for sub_dir in ('pending', 'claimed', 'results', 'failed'):
+            (queue._dir_path / sub_dir).mkdir(parents=True)
+        MappedCorpus.write(queue._dir_path / 'corpus', docs)
+        _write_atomically(queue._dir_path / 'config.json', lambda file: file.write(json.dumps(config).encode('utf-8')))
+        for shard_idx, start in enumerate(range(0, len(pairs), config['shard_size'])):
+            shard = {'pairs': pairs[start:start + config['shard_size']], 'attempts': 0}
+            _write_atomically(queue._dir_path / 'pending' / f'shard_{shard_idx:06d}.json',
+                              lambda file: file.write(json.dumps(shard).encode('utf-8')))
+        # Workers only pick up jobs whose info file exists, so it is written last
+        queue._job_info = {'lease_time': config['shard_lease_time'], 'max_attempts': config['shard_attempts']}
+        _write_atomically(queue._dir_path / 'job.json',
+                          lambda file: file.write(json.dumps(queue._job_info).encode('utf-8')))
+        return queue
+
+    @staticmethod
+    def open_jobs(queue_dir: Path) -> list[str]:
+        return sorted(path.parent.name for path in (queue_dir / 'jobs').glob('*/job.json'))
+
+    def job(self) -> tuple[dict, MappedCorpus]:
+        config = json.loads((self._dir_path / 'config.json').read_text(encoding='utf-8'))
+        return config, MappedCorpus(self._dir_path / 'corpus')
+
+    def claim(self, worker_id: str) -> Shard | None:
+        self._load_job_info()
+        for path in sorted((self._dir_path / 'pending').glob('*.json')):
+            claimed_path = self._dir_path / 'claimed' / f'{path.stem}@{worker_id}.json'
+            try:
+                os.rename(path, claimed_path)
+            except FileNotFoundError:  # Claimed by another worker
+                continue
+            content = json.loads(claimed_path.read_text(encoding='utf-8'))
+            return Shard(path.stem, claimed_path, content['pairs'], content['attempts'])
+
+    @contextmanager
+    def lease(self, shard: Shard):
+        """Renew the claim of the shard while it is being matched."""
+        stopped = Event()
+
+        def renew():
+            while not stopped.wait(self._job_info['lease_time'] / 3):
+                try:
+                    os.utime(shard.path)
+                except FileNotFoundError:
+                    return
+
+        Thread(target=renew, daemon=True).start()
+        try:
+            yield
+        finally:
+            stopped.set()
+
+    def complete(self, shard: Shard, encoded_matches: list[tuple], worker_stats: Stats):
+        result = {'matches': encoded_matches, 'stats': worker_stats.encode()}
+        _write_atomically(self._dir_path / 'results' / f'{shard.name}.json',
+                          lambda file: file.write(json.dumps(result).encode('utf-8')))
+        shard.path.unlink(missing_ok=True)
+
+    def retry(self, shard: Shard):
+        content = {'pairs': shard.pairs, 'attempts': shard.attempts + 1}
+        target_dir = 'pending' if content['attempts'] < self._job_info['max_attempts'] else 'failed'
+        log.warning(f"Giving up on {shard.name} after {content['attempts']} attempts.") if target_dir == 'failed' \
+            else None
+        # The shard is written back before its claim is removed, so the job never looks done meanwhile
+        _write_atomically(self._dir_path / target_dir / f'{shard.name}.json',
+                          lambda file: file.write(json.dumps(content).encode('utf-8')))
+        shard.path.unlink(missing_ok=True)
+
+    def requeue_expired(self):
+        """Put back shards whose workers stopped renewing their claim, e.g. because their node went down."""
+        self._load_job_info()
+        for path in (self._dir_path / 'claimed').glob('*.json'):
+            try:
+                if time() - path.stat().st_mtime < self._job_info['lease_time']:
+                    continue
+                expired_path = path.with_suffix('.expired')
+                os.rename(path, expired_path)
+            except FileNotFoundError:  # Completed or requeued meanwhile
+                continue
+            content = json.loads(expired_path.read_text(encoding='utf-8'))
+            log.debug(f'Claim of {path.stem} expired, putting it back.')
+            self.retry(Shard(path.stem.split('@')[0], expired_path, content['pairs'], content['attempts']))
+
+    def done(self) -> bool:
+        # Expired claims stay in the claimed directory until they are put back
+        return not any((self._dir_path / 'pending').glob('*.json')) \
+            and not any((self._dir_path / 'claimed').iterdir())
+
+    def results(self) -> list[tuple[list[tuple], Stats]]:
+        results = []
+        for path in sorted((self._dir_path / 'results').glob('*.json')):
+            result = json.loads(path.read_text(encoding='utf-8'))
+            results.append((result['matches'], Stats.decode(result['stats'])))
+        return results
+
+    def failed_pairs(self) -> int:
+        return sum(len(json.loads(path.read_text(encoding='utf-8'))['pairs'])
+                   for path in (self._dir_path / 'failed').glob('*.json'))
+
+    def close(self):
+        """Stop workers from picking up the job, its files are kept."""
+        (self._dir_path / 'job.json').unlink(missing_ok=True)
+
+    def remove(self):
+        self.close()
+        shutil.rmtree(self._dir_path, ignore_errors=True)
+
+    def _load_job_info(self):
+        if self._job_info is None:
+            self._job_info = json.loads((self._dir_path / 'job.json').read_text(encoding='utf-8'))
+
+    def __str__(self):
+        return str(self._dir_path)
+
+
+def find_matches_sharded(config: dict, doc_pairs: list[tuple[Document, Document]]) -> list[DocumentPairMatches]:
+    """Queue the document pairs in shards, match them with local and remote workers and merge their results."""
+    queue_dir = Path(config['shard_queue_path'])
+    queue_dir.mkdir(parents=True, exist_ok=True)
+    docs = list({id(doc): doc for pair in doc_pairs for doc in pair}.values())
+    doc_positions = {id(doc): pos for pos, doc in enumerate(docs)}
+    queue = ShardQueue.submit(queue_dir, config, docs, [(doc_positions[id(doc1)], doc_positions[id(doc2)])
+                                                        for doc1, doc2 in doc_pairs])
+    worker_count = config['shard_workers'] if config['shard_workers'] else os.cpu_count()
+    processes = [multiprocessing.Process(target=work, args=(queue_dir,), kwargs={'job_id': queue.job_id},
+                                         daemon=True) for _ in range(worker_count - 1)]
+    [process.start() for process in processes]
+    # The coordinating process works as well, so the job is finished even if all other workers fail
+    work(queue_dir, job_id=queue.job_id, job=(config, docs))
+    [process.join() for process in processes]
+    matches = []
+    for encoded_matches, worker_stats in queue.results():
+        stats.merge(worker_stats)
+        matches.extend(decode_doc_pair_matches(encoded, docs) for encoded in encoded_matches)
+    failed_pairs = queue.failed_pairs()
+    if failed_pairs:
+        log.error(f'Could not match {failed_pairs} document pairs, see the failed shards in {queue}.')
+        queue.close()
+    else:
+        queue.remove()
+    return matches
+
+
+def work(queue_dir: Path, keep_waiting=False, job_id: str = None, job: tuple[dict, list[Document]] = None) -> int:
+    """Match the shards of the queued jobs, or only those of the given job, until none are left, or keep waiting for
+    new jobs. Returns the number of matched shards."""
+    from plagdef.model.detection import DocumentMatcher
+    worker_id = f'{socket.gethostname()}-{os.getpid()}'
+    shard_count, loaded_job_id, doc_matcher, docs = 0, None, None, []
+    while True:
+        queues = [ShardQueue(queue_dir, open_job_id) for open_job_id in ShardQueue.open_jobs(queue_dir)
+                  if job_id is None or open_job_id == job_id]
+        shard = queue = None
+        for queue in queues:
+            try:
+                shard = queue.claim(worker_id)
+            except FileNotFoundError:  # Removed by its coordinator meanwhile
+                continue
+            if shard:
+                break
+        if shard:
+            try:
+                if queue.job_id != loaded_job_id:
+                    config, docs = job if job and queue.job_id == job_id else queue.job()
+                    loaded_job_id, doc_matcher = queue.job_id, DocumentMatcher(config)
+                with queue.lease(shard):
+                    doc_pairs = [(docs[pos1], docs[pos2]) for pos1, pos2 in shard.pairs]
+                    # The corpus materializes documents on access, so positions are looked up per shard
+                    doc_positions = {id(doc): pos for doc_pair, pos_pair in zip(doc_pairs, shard.pairs)
+                                     for doc, pos in zip(doc_pair, pos_pair)}
+                    matches, worker_stats = run_collecting_stats(doc_matcher.match_pairs, doc_pairs)
+                queue.complete(shard, [encode_doc_pair_matches(dpm, doc_positions[id(dpm.doc1)],
+                                                               doc_positions[id(dpm.doc2)])
+                                       for dpm in matches], worker_stats)
+                shard_count += 1
+            except FileNotFoundError:
+                log.debug(f'The job of {shard.name} was finished by other workers meanwhile.')
+            except Exception:
+                log.warning(f'Could not match {shard.name}, putting it back.')
+                log.debug('Following error occurred:', exc_info=True)
+                queue.retry(shard)
+            continue
+        for queue in queues:
+            try:
+                queue.requeue_expired()
+            except FileNotFoundError:
+                continue
+        if not keep_waiting and all(_done(queue) for queue in queues):
+            return shard_count
+        sleep(POLL_INTERVAL)
+
+
+def _done(queue: ShardQueue) -> bool:
+    try:
+        return queue.done()
+    except FileNotFoundError:  # Removed by its coordinator
+        return True
+
+
+def run_workers(queue_dir: Path, process_count: int, keep_waiting=False):
+    processes = [multiprocessing.Process(target=work, args=(queue_dir, keep_waiting)) for _ in range(process_count)]
+    [process.start() for process in processes]
+    [process.join() for process in processes]
+
+
+def _write_atomically(path: Path, write, opener=open):
+    """Write to a temporary file first, so other workers never read a partially written file."""
+    tmp_path = path.with_name(f'.{path.name}.{uuid4().hex}.tmp')
+    with opener(tmp_path, 'wb') as file:
+        write(file)
+    os.replace(tmp_path, path)
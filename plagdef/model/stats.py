@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+import heapq
+from contextlib import contextmanager
+from functools import wraps
+from threading import RLock, local
+from time import perf_counter
+from typing import Callable
+
+SLOWEST_PAIR_COUNT = 10
+
+
+class Stats:
+    """Registry of the wall time and call count of pipeline stages, of counters and of per pair statistics. The
+    registry of each worker process is sent back and merged into the one of the main process. Stages record their
+    whole time and their own time, which excludes the stages they call, e.g. seeding excludes vectorization.
+    Threads may record into the same registry."""
+
+    def __init__(self):
+        self._lock = RLock()
+        self._active = local()  # Stack of [stage, seconds of nested stages] per thread
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.stages = {}  # <stage, [calls, seconds, own seconds]>
+            self.counters = {}
+            self.pair_maxima = {}
+            self.slowest_pairs = []  # Min heap of (seconds, doc1 name, doc2 name, counts)
+
+    @contextmanager
+    def timer(self, stage: str):
+        active = self._active.__dict__.setdefault('timers', [])
+        active.append([stage, 0.0])
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            seconds = perf_counter() - start
+            _, nested_seconds = active.pop()
+            if len(active):
+                active[-1][1] += seconds
+            self._add_stage(stage, 1, seconds, seconds - nested_seconds)
+
+    def count(self, counter: str, number=1):
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + number
+
+    def record_pair(self, doc1_name: str, doc2_name: str, seconds: float, **counts: int):
+        with self._lock:
+            self.count('pairs')
+            for counter, number in counts.items():
+                self.count(counter, number)
+                self.pair_maxima[counter] = max(self.pair_maxima.get(counter, 0), number)
+            self._push_pair((seconds, doc1_name, doc2_name, tuple(sorted(counts.items()))))
+
+    def merge(self, other: Stats):
+        with other._lock:
+            stages = {stage: list(calls_seconds) for stage, calls_seconds in other.stages.items()}
+            counters = dict(other.counters)
+            pair_maxima, slowest_pairs = dict(other.pair_maxima), list(other.slowest_pairs)
+        with self._lock:
+            [self._add_stage(stage, *calls_seconds) for stage, calls_seconds in stages.items()]
+            [self.count(counter, number) for counter, number in counters.items()]
+            self.pair_maxima.update({counter: max(self.pair_maxima.get(counter, 0), number)
+                                     for counter, number in pair_maxima.items()})
+            [self._push_pair(pair) for pair in slowest_pairs]
+
+    def encode(self) -> dict:
+        """Encode the stats as JSON serializable dict, e.g. to send them to another node."""
+        with self._lock:
+            return {'stages': self.stages, 'counters': self.counters, 'pair_maxima': self.pair_maxima,
+                    'slowest_pairs': self.slowest_pairs}
+
+    @classmethod
+    def decode(cls, encoded: dict) -> Stats:
+        decoded = cls()
+        decoded.stages, decoded.counters = encoded['stages'], encoded['counters']
+        decoded.pair_maxima = encoded['pair_maxima']
+        # JSON turns tuples into lists, pairs must stay tuples to be comparable with the ones recorded locally
+        decoded.slowest_pairs = [(seconds, doc1_name, doc2_name, tuple(map(tuple, counts)))
+                                 for seconds, doc1_name, doc2_name, counts in encoded['slowest_pairs']]
+        return decoded
+
+    def _add_stage(self, stage: str, calls: int, seconds: float, own_seconds: float):
+        with self._lock:
+            calls_seconds = self.stages.setdefault(stage, [0, 0.0, 0.0])
+            calls_seconds[0] += calls
+            calls_seconds[1] += seconds
+            calls_seconds[2] += own_seconds
+
+    def _push_pair(self, pair: tuple):
+        if len(self.slowest_pairs) < SLOWEST_PAIR_COUNT:
+            heapq.heappush(self.slowest_pairs, pair)
+        elif pair[0] > self.slowest_pairs[0][0]:
+            heapq.heapreplace(self.slowest_pairs, pair)
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return self._to_dict()
+
+    def _to_dict(self) -> dict:
+        pairs = self.counters.get('pairs', 0)
+        return {
+            'stages': {stage: {'calls': calls, 'seconds': seconds, 'own_seconds': own_seconds}
+                       for stage, (calls, seconds, own_seconds) in self.stages.items()},
+            'counters': dict(self.counters),
+            'per_pair': {counter: {'mean': self.counters[counter] / pairs, 'max': maximum}
+                         for counter, maximum in self.pair_maxima.items()},
+            'slowest_pairs': [{'doc1': doc1_name, 'doc2': doc2_name, 'seconds': seconds, **dict(counts)}
+                              for seconds, doc1_name, doc2_name, counts in sorted(self.slowest_pairs, reverse=True)]
+        }
+
+    def __getstate__(self):
+        with self._lock:
+            return self.stages, self.counters, self.pair_maxima, self.slowest_pairs
+
+    def __setstate__(self, state):
+        self._lock, self._active = RLock(), local()
+        self.stages, self.counters, self.pair_maxima, self.slowest_pairs = state
+
+
+stats = Stats()
+
+
+def timed(stage: str) -> Callable:
+    """Decorate a function to record its calls in the process' stats under the given stage."""
+
+    def decorator(fun: Callable) -> Callable:
+        @wraps(fun)
+        def wrapper(*args, **kwargs):
+            with stats.timer(stage):
+                return fun(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def run_collecting_stats(fun: Callable, *args) -> tuple[object, Stats]:
+    """Run the function, e.g. in a worker process, and return its result together with the stats recorded meanwhile.
+    The stats recorded before are kept, so that the collected ones can be merged back without counting them twice."""
+    prev_stats = Stats()
+    prev_stats.merge(stats)
+    stats.reset()
+    try:
+        result = fun(*args)
+        collected_stats = Stats()
+        collected_stats.merge(stats)
+        return result, collected_stats
+    finally:
+        stats.reset()
+        stats.merge(prev_stats)
@@ -1,34 +1,34 @@
 from __future__ import annotations
 
 import bz2
+import json
 import logging
 import os
 import re
-from collections import Counter, defaultdict
-from copy import deepcopy
+import tracemalloc
+from collections import defaultdict, OrderedDict
+from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from hashlib import blake2b
 from io import BytesIO
 from json import JSONDecodeError
 from multiprocessing import Lock
 from pathlib import Path
 from pickle import dump, load, UnpicklingError
+from time import perf_counter
 from unicodedata import normalize
 from urllib.parse import urlparse
 
 import jsonpickle
 import magic
-import pdfplumber
 from magic import MagicException
-from ocrmypdf import ocr, EncryptedPdfError
-from pdfminer.pdfdocument import PDFPasswordIncorrect
-from sortedcontainers import SortedSet
 from tqdm.contrib.concurrent import process_map
 
 from plagdef.config import settings
 from plagdef.model import models
 
 log = logging.getLogger(__name__)
-jsonpickle.set_encoder_options('json', indent=4)
 lock = Lock()
 
 
@@ -43,14 +43,9 @@ class FileRepository:
         files = list()
         f_gen = self.base_path.rglob('*') if self._recursive else self.base_path.iterdir()
         for f in f_gen:
-            if f.is_file():
-                binary = not magic.Magic(mime=True).from_buffer(open(f, 'rb').read(2048)).startswith("text")
-                try:
-                    content = f.read_bytes() if binary else self._read_text(f)
-                    files.append(models.File(f, content, binary))
-                except UnsupportedFileFormatError as e:
-                    log.error(e)
-                    log.debug('Following error occurred:', exc_info=True)
+            if f.is_file() and f.suffix.lower() != '.pdef':
+                file = self.get(f)
+                files.append(file) if file else None
         file_groups = defaultdict(list)
         [file_groups[f].append(f) for f in files]
         duplicate_files = list(filter(lambda file_group: len(file_group) > 1, file_groups.values()))
@@ -58,6 +53,15 @@ class FileRepository:
                     f'identical contents: {str(duplicate_files)}') if len(files) != len(file_groups) else None
         return set(file_groups.keys())
 
+    def get(self, file_path: Path) -> models.File | None:
+        binary = not magic.Magic(mime=True).from_buffer(open(file_path, 'rb').read(2048)).startswith("text")
+        try:
+            content = file_path.read_bytes() if binary else self._read_text(file_path)
+            return models.File(file_path, content, binary)
+        except UnsupportedFileFormatError as e:
+            log.error(e)
+            log.debug('Following error occurred:', exc_info=True)
+
     def _read_text(self, file_path: Path):
         try:
             detect_enc = magic.Magic(mime_encoding=True)
@@ -69,8 +73,9 @@ class FileRepository:
             raise UnsupportedFileFormatError(
                 f"The file '{file_path.name}' has an unsupported encoding and cannot be read.")
 
-    def save_all(self, files: set[models.File]):
-        existing_files = self.list()
+    def save_all(self, files: set[models.File], existing_files: set[models.File] = None):
+        """Existing files are listed to skip identical contents unless the caller already knows them."""
+        existing_files = set(existing_files) if existing_files is not None else self.list()
         for file in files:
             try:
                 self._save(file, existing_files)
@@ -108,21 +113,30 @@ class DocumentFileRepository:
         self._file_repo = FileRepository(dir_path, recursive)
         self.lang = lang if lang else settings['lang']
         self._use_ocr = use_ocr if use_ocr else settings['ocr']
+        self._max_pdf_pages = settings['max_pdf_pages']
+        self._max_pdf_chars = settings['max_pdf_chars']
 
     @property
     def base_path(self):
         return self._file_repo.base_path
 
     def list(self) -> set[models.Document]:
-        files = list(filter(lambda f: f.path.suffix.lower() != '.pdef', self._file_repo.list()))
+        files = list(self._file_repo.list())
         docs = process_map(self._create_doc, files, desc=f"Reading documents in '{self.base_path}'",
                            unit='doc', total=len(files), max_workers=os.cpu_count())
         return set(filter(None, docs))
 
+    def get(self, file_path: Path) -> models.Document | None:
+        file = self._file_repo.get(file_path)
+        return self._create_doc(file) if file else None
+
     def _create_doc(self, file: models.File) -> models.Document:
         if file.path.suffix.lower() == '.pdf':
+            # The PDF toolchain is expensive to import and only needed for PDFs
+            from ocrmypdf import EncryptedPdfError
+            from pdfminer.pdfdocument import PDFPasswordIncorrect
             try:
-                reader = PdfReader(file.path, self.lang, self._use_ocr)
+                reader = PdfReader(file.path, self.lang, self._use_ocr, self._max_pdf_pages, self._max_pdf_chars)
                 text = reader.extract_text()
                 doc = models.Document(file.path.stem, str(file.path), text)
                 urls = reader.extract_urls()
@@ -146,6 +160,80 @@ class DocumentFileRepository:
         self._file_repo.remove_all(files)
 
 
+class ExternalSourceRepository:
+    """Downloaded external sources with an index of URL to content digest to file name. Contents which are already
+    stored are recognized by their digest instead of re-reading all saved files, and only the sources of the requested
+    URLs are read."""
+
+    def __init__(self, dir_path: Path, lang=None, use_ocr=None):
+        self._doc_repo = DocumentFileRepository(dir_path, lang=lang, use_ocr=use_ocr)
+        self._file_repo = FileRepository(dir_path)
+        self._index_path = dir_path / '.sources.pdef'
+        self._urls, self._files = self._load_index()  # <url, digest>, <digest, file name>
+
+    @property
+    def base_path(self):
+        return self._file_repo.base_path
+
+    @property
+    def lang(self):
+        return self._doc_repo.lang
+
+    def save_all(self, files: dict[str, models.File]):
+        new_files = {}
+        for url, file in files.items():
+            digest = _content_digest(file.content)
+            new_files.setdefault(digest, file) if not self._stored(digest) else None
+            self._urls[url] = digest
+        self._file_repo.save_all(set(new_files.values()), existing_files=set())
+        self._files.update({digest: file.path.name for digest, file in new_files.items()})
+        self._save_index()
+
+    def save_translations(self, docs: set[models.Document]):
+        """Replace the files of translated sources with their translation, which stays indexed under the digest of
+        the downloaded content so that it is not translated again."""
+        digests = {file_name: digest for digest, file_name in self._files.items()}
+        self._doc_repo.remove_all(docs)
+        for doc in docs:
+            digest = digests.get(Path(doc.path).name)
+            doc.path = str(Path(doc.path).with_name(f'{doc.name}_trans.txt'))
+            self._files.update({digest: Path(doc.path).name}) if digest else None
+        self._doc_repo.save_all(docs)
+        self._save_index()
+
+    def paths(self, urls: set[str] = None) -> set[Path]:
+        digests = self._files.keys() if urls is None else {self._urls[url] for url in urls if url in self._urls}
+        return {self.base_path / self._files[digest] for digest in digests if self._stored(digest)}
+
+    def list(self, paths: set[Path]) -> set[models.Document]:
+        docs = process_map(self._doc_repo.get, paths, desc=f"Reading documents in '{self.base_path}'", unit='doc',
+                           total=len(paths), max_workers=os.cpu_count()) if len(paths) else []
+        return set(filter(None, docs))
+
+    def _save_index(self):
+        with bz2.open(self._index_path, 'wb') as file:
+            dump((self._urls, self._files), file)
+
+    def _stored(self, digest: str) -> bool:
+        return digest in self._files and (self.base_path / self._files[digest]).exists()
+
+    def _load_index(self) -> tuple[dict[str, str], dict[str, str]]:
+        if self._index_path.exists():
+            try:
+                with bz2.open(self._index_path, 'rb') as file:
+                    return load(file)
+            except (UnpicklingError, EOFError, OSError):
+                log.warning(f"Could not deserialize source index, '{self._index_path.name}' seems to be corrupted.")
+                log.debug('Following error occurred:', exc_info=True)
+        # Index files which were downloaded before the index existed once
+        return {}, {_content_digest(file.content): file.path.name for file in self._file_repo.list()}
+
+
+def _content_digest(content: str | bytes) -> str:
+    return blake2b(content if isinstance(content, (bytes, bytearray)) else content.encode(),
+                   digest_size=16).hexdigest()
+
+
 class DocumentPairRepository:
     def __init__(self, doc1: models.Document, doc2: models.Document, lang=None):
         self._docs = {doc1, doc2}
@@ -156,36 +244,169 @@ class DocumentPairRepository:
 
 
 class DocumentPairMatchesJsonRepository:
+    """Stores reports in a compact schema: One line per document pair in matches.jsonl containing only the document
+    references and match offsets, and each document's text once in docs/<digest>.json. The index file lists every
+    pair's names, match counts and position in matches.jsonl, so a report can be browsed without decoding the
+    matches and texts. save() only appends, a pair which is saved again supersedes its former lines, which are
+    dropped once the report is replaced with save_all(). Reports written by former versions, one jsonpickle file per
+    document pair, can still be listed as long as the directory contains no report of the compact schema."""
+    MATCHES_FILE = 'matches.jsonl'
+    INDEX_FILE = 'index.jsonl'
+    DOCS_DIR = 'docs'
+
     def __init__(self, out_path: Path):
         if not out_path.is_dir():
             raise NotADirectoryError(f"The given path '{out_path}' does not point to an existing directory!")
         self._out_path = out_path
-
-    def save(self, doc_pair_matches):
-        clone = deepcopy(doc_pair_matches)
-        clone.doc1.vocab, clone.doc2.vocab = Counter(), Counter()
-        clone.doc1._sents, clone.doc2._sents = SortedSet(), SortedSet()
-        file_name = Path(f'{clone.doc1.name}-{clone.doc2.name}.json')
-        file_path = self._out_path / file_name
-        with file_path.open('w', encoding='utf-8') as f:
-            text = jsonpickle.encode(clone)
-            f.write(text)
+        self._docs = {}
+
+    def save(self, doc_pair_matches: models.DocumentPairMatches):
+        self._write([doc_pair_matches], mode='a')
+
+    def save_all(self, doc_pair_matches: Iterable[models.DocumentPairMatches]):
+        """Replace the report in the output directory by the given document pairs."""
+        self._write(list(doc_pair_matches), mode='w')
+
+    def _write(self, doc_pair_matches: list[models.DocumentPairMatches], mode: str):
+        (self._out_path / self.DOCS_DIR).mkdir(exist_ok=True)
+        docs = {_doc_id(doc): doc for dpm in doc_pair_matches for doc in (dpm.doc1, dpm.doc2)}
+        # Threads only write the document files, encoding the matches is CPU-bound and done inline
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as pool:
+            doc_writes = pool.map(self._save_doc, docs.keys(), docs.values())
+            with (self._out_path / self.MATCHES_FILE).open(f'{mode}b') as matches_file, \
+                (self._out_path / self.INDEX_FILE).open(mode, encoding='utf-8') as index_file:
+                offset = matches_file.tell()
+                for line, entry in _encode_doc_pair_matches(doc_pair_matches):
+                    matches_file.write(line)
+                    index_file.write(f"{json.dumps({**entry, 'offset': offset, 'length': len(line)})}\n")
+                    offset += len(line)
+            list(doc_writes)
+        if mode == 'w':
+            [doc_file.unlink() for doc_file in (self._out_path / self.DOCS_DIR).glob('*.json')
+             if doc_file.stem not in docs]
+
+    def _save_doc(self, doc_id: str, doc: models.Document):
+        # Written on every save, the language and URLs of a document may have been detected again
+        with (self._out_path / self.DOCS_DIR / f'{doc_id}.json').open('w', encoding='utf-8') as file:
+            json.dump({'name': doc.name, 'path': doc.path, 'lang': doc.lang, 'urls': sorted(doc.urls),
+                       'text': doc.text}, file, ensure_ascii=False)
 
     def list(self) -> set[models.DocumentPairMatches]:
         doc_pair_matches_list = set()
+        matches_file, docs = self._out_path / self.MATCHES_FILE, {}
+        if matches_file.is_file():
+            latest = {}  # <pair key, pair>, pairs saved again supersede their former lines
+            with matches_file.open(encoding='utf-8') as file:
+                for line in file:
+                    try:
+                        dpm = self._decode_doc_pair_matches(json.loads(line), docs)
+                        latest[_pair_key((dpm.doc1.name, dpm.doc2.name), (dpm.doc1.path, dpm.doc2.path))] = dpm
+                    except (JSONDecodeError, KeyError, OSError):
+                        log.error(f"A document pair in '{matches_file.name}' could not be read.")
+                        log.debug('Following error occurred:', exc_info=True)
+            return set(latest.values())
         for file in self._out_path.iterdir():
             if file.is_file() and file.suffix == '.json':
                 try:
-                    text = file.read_text(encoding='utf-8')
-                    doc_pair_matches = jsonpickle.decode(text)
+                    doc_pair_matches = jsonpickle.decode(file.read_text(encoding='utf-8'))
+                    if not isinstance(doc_pair_matches, models.DocumentPairMatches):
+                        raise JSONDecodeError('Not a document pair', '', 0)
                     doc_pair_matches_list.add(doc_pair_matches)
                 except (UnicodeDecodeError, JSONDecodeError):
                     log.error(f"The file '{file.name}' could not be read.")
                     log.debug('Following error occurred:', exc_info=True)
         return doc_pair_matches_list
 
+    def list_index(self) -> list[ReportEntry]:
+        """Read the pairs' names, paths and match counts only. Reports without an index have no entries."""
+        entries, index_file = {}, self._out_path / self.INDEX_FILE  # <pair key, entry>
+        if index_file.is_file():
+            with index_file.open(encoding='utf-8') as file:
+                for line in file:
+                    try:
+                        fields = json.loads(line)
+                        key = _pair_key(fields['names'], fields['paths'])
+                        entries.pop(key, None)
+                        entries[key] = ReportEntry(*fields['names'], *fields['paths'], fields['counts'],
+                                                   fields['offset'], fields['length'])
+                    except (JSONDecodeError, KeyError, TypeError):
+                        log.error(f"A document pair in '{index_file.name}' could not be read.")
+                        log.debug('Following error occurred:', exc_info=True)
+        return list(entries.values())
+
+    def load(self, entry: ReportEntry) -> models.DocumentPairMatches:
+        """Decode the matches and documents of a single indexed pair. Documents stay shared between loaded pairs."""
+        with (self._out_path / self.MATCHES_FILE).open('rb') as file:
+            file.seek(entry.offset)
+            return self._decode_doc_pair_matches(json.loads(file.read(entry.length)), self._docs)
+
+    def _decode_doc_pair_matches(self, record: dict, docs: dict[str, models.Document]) \
+        -> models.DocumentPairMatches:
+        doc1, doc2 = self._load_doc(record['doc1'], docs), self._load_doc(record['doc2'], docs)
+        doc_pair_matches = models.DocumentPairMatches(doc1, doc2, [
+            models.Match(models.MatchType[match_type.upper()], models.Fragment(start1, end1, doc1),
+                         models.Fragment(start2, end2, doc2))
+            for match_type, offsets in record['matches'].items() for start1, end1, start2, end2 in offsets])
+        doc_pair_matches.exceeded_budgets.update(record.get('exceeded_budgets', ()))
+        return doc_pair_matches
+
+    def _load_doc(self, doc_id: str, docs: dict[str, models.Document]) -> models.Document:
+        """Documents are decoded once and shared by all their pairs."""
+        if doc_id not in docs:
+            with (self._out_path / self.DOCS_DIR / f'{doc_id}.json').open(encoding='utf-8') as file:
+                fields = json.load(file)
+            doc = models.Document(fields['name'], fields['path'], fields['text'])
+            doc.lang, doc.urls = fields['lang'], set(fields['urls'])
+            docs[doc_id] = doc
+        return docs[doc_id]
+
+
+@dataclass(frozen=True)
+class ReportEntry:
+    doc1_name: str
+    doc2_name: str
+    doc1_path: str
+    doc2_path: str
+    match_counts: dict[str, int]
+    offset: int
+    length: int
+
+
+def _doc_id(doc: models.Document) -> str:
+    """Documents with the same text but different names or paths are stored separately."""
+    return blake2b('\0'.join((doc.name, str(doc.path), doc.text)).encode(), digest_size=16).hexdigest()
+
+
+def _pair_key(names, paths) -> frozenset:
+    return frozenset(zip(names, map(str, paths)))
+
+
+def _encode_doc_pair_matches(doc_pair_matches: list[models.DocumentPairMatches]) -> list[tuple[bytes, dict]]:
+    """Encode each pair to a line of matches.jsonl and its entry of the index, lacking the line's position."""
+    lines = []
+    for dpm in doc_pair_matches:
+        matches = {}
+        for match_type in models.MatchType:
+            offsets = []
+            for match in dpm.list(match_type):
+                frag1, frag2 = dpm.frags_in_pair_order(match)
+                offsets.append((frag1.start_char, frag1.end_char, frag2.start_char, frag2.end_char))
+            matches.update({str(match_type): sorted(offsets)}) if len(offsets) else None
+        names, record = [dpm.doc1.name, dpm.doc2.name], {}
+        record.update({'exceeded_budgets': sorted(dpm.exceeded_budgets)}) if len(dpm.exceeded_budgets) else None
+        line = json.dumps({'doc1': _doc_id(dpm.doc1), 'doc2': _doc_id(dpm.doc2), 'names': names, 'matches': matches,
+                           **record})
+        lines.append((f'{line}\n'.encode(), {'names': names, 'paths': [dpm.doc1.path, dpm.doc2.path],
+                                              'counts': {match_type: len(offsets)
+                                                         for match_type, offsets in matches.items()}, **record}))
+    return lines
+
 
 class DocumentPickleRepository:
+    keep_in_memory = False  # Long-running processes keep deserialized documents until their file changes
+    KEPT_FILES = 4
+    _loaded = OrderedDict()  # <file path, (modification time, docs)>, least recently used first
+
     def __init__(self, dir_path: Path, common_dir_path: Path = None):
         if not dir_path.is_dir():
             raise NotADirectoryError(f"The given path '{dir_path}' does not point to an existing directory!")
@@ -195,28 +416,106 @@ class DocumentPickleRepository:
     def save(self, docs: set[models.Document]):
         with bz2.open(self.file_path, 'wb') as file:
             dump(docs, file)
+        self._keep(self.file_path.stat().st_mtime_ns, set(docs)) if self.keep_in_memory else None
+
+    def _keep(self, mtime: int, docs: set[models.Document]):
+        self._loaded[self.file_path] = (mtime, docs)
+        self._loaded.move_to_end(self.file_path)
+        self._loaded.popitem(last=False) if len(self._loaded) > self.KEPT_FILES else None
 
     def list(self) -> set[models.Document]:
         if self.file_path.exists():
+            mtime = self.file_path.stat().st_mtime_ns
+            if self.keep_in_memory and self._loaded.get(self.file_path, (None,))[0] == mtime:
+                self._loaded.move_to_end(self.file_path)
+                return set(self._loaded[self.file_path][1])
             log.info('Found preprocessing file. Deserializing...')
             try:
                 with bz2.open(self.file_path, 'rb') as file:
-                    return load(file)
+                    docs = load(file)
+                self._keep(mtime, docs) if self.keep_in_memory else None
+                return set(docs) if self.keep_in_memory else docs
             except (UnpicklingError, EOFError):
                 log.warning(f"Could not deserialize preprocessing file, '{self.file_path.name}' seems to be corrupted.")
                 log.debug('Following error occurred:', exc_info=True)
         return set()
 
 
+class CommonIndexPickleRepository:
+    """Persists the common content index next to the common documents, keyed by a digest of their content."""
+
+    def __init__(self, dir_path: Path):
+        if not dir_path.is_dir():
+            raise NotADirectoryError(f"The given path '{dir_path}' does not point to an existing directory!")
+        self._dir_path = dir_path
+
+    def save(self, digest: str, common_index):
+        for stale_file in self._dir_path.glob('.common_*.pdef'):
+            stale_file.unlink()
+        with bz2.open(self._file_path(digest), 'wb') as file:
+            dump(common_index, file)
+
+    def get(self, digest: str):
+        file_path = self._file_path(digest)
+        if file_path.exists():
+            try:
+                with bz2.open(file_path, 'rb') as file:
+                    return load(file)
+            except (UnpicklingError, EOFError, OSError):
+                log.warning(f"Could not deserialize common index file, '{file_path.name}' seems to be corrupted.")
+                log.debug('Following error occurred:', exc_info=True)
+
+    def _file_path(self, digest: str) -> Path:
+        return self._dir_path / f'.common_{digest}.pdef'
+
+
+class TranslationCacheRepository:
+    """Persists translations keyed by source text digest and target language, so that unchanged documents are not
+    translated again and partially failed translations resume with the missing chunks."""
+
+    def __init__(self, dir_path: Path):
+        if not dir_path.is_dir():
+            raise NotADirectoryError(f"The given path '{dir_path}' does not point to an existing directory!")
+        self.file_path = dir_path / '.translations.pdef'
+
+    def save(self, translations: dict[tuple[str, str], str]):
+        with bz2.open(self.file_path, 'wb') as file:
+            dump(translations, file)
+
+    def load(self) -> dict[tuple[str, str], str]:
+        if self.file_path.exists():
+            try:
+                with bz2.open(self.file_path, 'rb') as file:
+                    return load(file)
+            except (UnpicklingError, EOFError, OSError):
+                log.warning(f"Could not deserialize translations, '{self.file_path.name}' seems to be corrupted.")
+                log.debug('Following error occurred:', exc_info=True)
+        return {}
+
+
+@dataclass(frozen=True)
+class ExtractionStats:
+    pages: int
+    chars: int
+    seconds: float
+    peak_mem: int = None  # bytes, only traced if debug logging is enabled
+    truncated: bool = False
+
+
 class PdfReader:
     ERROR_HEURISTIC = '¨[aou]|ﬀ|\(cid:\d+\)|[a-zA-Z]{50}'
+    HYPHEN_AT_PAGE_END = '(?<=\w)-\s?$'
 
-    def __init__(self, file, lang, use_ocr):
+    def __init__(self, file, lang, use_ocr, max_pages: int = None, max_chars: int = None):
         self._file = file
         self._lang = 'eng' if lang == 'en' else 'deu'
         self._use_ocr = use_ocr
+        self._max_pages = max_pages
+        self._max_chars = max_chars
+        self.stats = None
 
     def extract_urls(self) -> set[str]:
+        import pdfplumber
         # Temporary fix for: https://github.com/jsvine/pdfplumber/issues/463
         try:
             with pdfplumber.open(self._file) as pdf:
@@ -229,6 +528,7 @@ class PdfReader:
     def extract_text(self):
         text = self._extract()
         if self._use_ocr and self._poor_extraction(text):
+            from ocrmypdf import ocr
             log.warning(f"Poor text extraction in '{self._file.name}' detected! Using OCR...")
             with BytesIO() as ocr_file:
                 with lock:
@@ -238,12 +538,56 @@ class PdfReader:
         return text
 
     def _extract(self, file=None) -> str:
+        import pdfplumber
         if file is None:
             file = self._file
-        with pdfplumber.open(file) as pdf:
-            text = ' '.join(filter(None, (page.extract_text() for page in pdf.pages)))
-            normalized_text = normalize('NFC', text)
-            return re.sub('-\s?\n', '', normalized_text)  # Merge hyphenated words
+        trace_mem = log.isEnabledFor(logging.DEBUG) and not tracemalloc.is_tracing()
+        tracemalloc.start() if trace_mem else None
+        start = perf_counter()
+        try:
+            with pdfplumber.open(file) as pdf:
+                text, page_count, truncated = self._join_pages(pdf.pages)
+            peak_mem = tracemalloc.get_traced_memory()[1] if trace_mem else None
+        finally:
+            tracemalloc.stop() if trace_mem else None
+        self.stats = ExtractionStats(page_count, len(text), perf_counter() - start, peak_mem, truncated)
+        self._log_stats(file)
+        return text
+
+    def _join_pages(self, pages) -> tuple[str, int, bool]:
+        """Extract and normalize the text page by page so that each page's layout objects can be released before
+        the next one is parsed. Hyphenated words are merged within pages and across page boundaries."""
+        page_texts, char_count, page_count = [], 0, 0
+        for page in pages:
+            if self._max_pages is not None and page_count >= self._max_pages:
+                return ''.join(page_texts), page_count, True
+            page_text = page.extract_text()
+            page.close()
+            page_count += 1
+            if not page_text:
+                continue
+            page_text = re.sub('-\s?\n', '', normalize('NFC', page_text))  # Merge hyphenated words
+            if page_texts and re.search(PdfReader.HYPHEN_AT_PAGE_END, page_texts[-1]):
+                merged_text = re.sub(PdfReader.HYPHEN_AT_PAGE_END, '', page_texts[-1])
+                char_count -= len(page_texts[-1]) - len(merged_text)
+                page_texts[-1] = merged_text
+            elif page_texts:
+                page_text = f' {page_text}'
+            if self._max_chars is not None and char_count + len(page_text) > self._max_chars:
+                page_texts.append(page_text[:self._max_chars - char_count])
+                return ''.join(page_texts), page_count, True
+            page_texts.append(page_text)
+            char_count += len(page_text)
+        return ''.join(page_texts), page_count, False
+
+    def _log_stats(self, file):
+        name = self._file.name if file is self._file else f'{self._file.name} (OCR)'
+        if self.stats.truncated:
+            log.warning(f"Stopped text extraction of '{name}' after {self.stats.pages} pages and "
+                        f"{self.stats.chars} characters because the extraction budget was exceeded.")
+        peak_mem = f', peak memory {self.stats.peak_mem / 2 ** 20:.1f} MiB' if self.stats.peak_mem is not None else ''
+        log.debug(f"Extracted {self.stats.pages} pages ({self.stats.chars} chars) from '{name}' in "
+                  f"{self.stats.seconds:.2f}s{peak_mem}.")
 
     def _poor_extraction(self, text: str) -> bool:
         return not len(text.strip()) or bool(re.search(PdfReader.ERROR_HEURISTIC, text))
@@ -3,17 +3,19 @@ from __future__ import annotations
 import logging
 import os
 import shutil
+from hashlib import blake2b
 from pathlib import Path
 
 from click import UsageError
 
 from plagdef.config import settings
 from plagdef.model.detection import DocumentMatcher
-from plagdef.model.download import download_all_external_sources
+from plagdef.model.download import Downloader, resolvable_urls
 from plagdef.model.models import DocumentPairMatches, Document
+from plagdef.model.stats import stats
 from plagdef.model.pipeline.translate import translate, detect_lang, docs_in_other_langs
 from plagdef.repositories import UnsupportedFileFormatError, DocumentPickleRepository, DocumentFileRepository, \
-    FileRepository
+    CommonIndexPickleRepository, ExternalSourceRepository, TranslationCacheRepository
 
 log = logging.getLogger(__name__)
 
@@ -22,57 +24,130 @@ def find_matches(doc_repo, archive_repo=None, common_doc_repo=None, config=setti
     -> list[DocumentPairMatches]:
     try:
         doc_matcher = DocumentMatcher(config)
-        archive_docs = None
-        if archive_repo:
-            archive_docs = _preprocess_docs(doc_matcher, config['ser'], archive_repo, common_doc_repo)
-        docs = _preprocess_docs(doc_matcher, config['ser'], doc_repo, common_doc_repo)
-        if download and config['download_path']:
-            _save_all_external_sources(docs, config['download_path'])
-            ext_docs = _preprocess_docs(doc_matcher,
-                                        config['ser'],
-                                        DocumentFileRepository(Path(config['download_path']), recursive=True),
-                                        common_doc_repo, trans=config['transl'])
-            archive_docs = archive_docs.union(ext_docs) if archive_docs else ext_docs
-        doc_pair_matches = doc_matcher.find_matches(docs, archive_docs)
+        with stats.timer('preparation'):
+            docs, archive_docs = _prepare_docs(doc_matcher, doc_repo, archive_repo, common_doc_repo, config, download)
+        with stats.timer('matching'):
+            doc_pair_matches = doc_matcher.find_matches(docs, archive_docs)
         return doc_pair_matches
     except UnsupportedFileFormatError as e:
         raise UsageError(str(e)) from e
 
 
-def _preprocess_docs(doc_matcher, use_serialization, doc_repo, common_doc_repo=None, trans=False) -> set[Document]:
+def sweep_matches(doc_repo, sim_thresholds: list[float], archive_repo=None, common_doc_repo=None, config=settings,
+                  download=True) -> dict[float, list[DocumentPairMatches]]:
+    try:
+        doc_matcher = DocumentMatcher(config)
+        with stats.timer('preparation'):
+            docs, archive_docs = _prepare_docs(doc_matcher, doc_repo, archive_repo, common_doc_repo, config, download)
+        with stats.timer('matching'):
+            return doc_matcher.sweep(docs, sim_thresholds, archive_docs)
+    except UnsupportedFileFormatError as e:
+        raise UsageError(str(e)) from e
+
+
+def _prepare_docs(doc_matcher, doc_repo, archive_repo, common_doc_repo, config, download) \
+    -> tuple[set[Document], set[Document]]:
+    archive_docs = None
+    if archive_repo:
+        archive_docs = _preprocess_docs(doc_matcher, config['ser'], archive_repo, common_doc_repo)
+    docs = _preprocess_docs(doc_matcher, config['ser'], doc_repo, common_doc_repo)
+    if download and config['download_path']:
+        source_repo = ExternalSourceRepository(Path(config['download_path']), doc_repo.lang)
+        ext_docs = _preprocess_external_sources(doc_matcher, docs, source_repo, common_doc_repo, config)
+        archive_docs = archive_docs.union(ext_docs) if archive_docs else ext_docs
+    return docs, archive_docs
+
+
+def find_pair_matches(doc1: Document, doc2: Document, config=settings) -> list[DocumentPairMatches]:
+    """Match two already preprocessed documents again, e.g. with different thresholds.
+    Reading, preprocessing and common sentence detection are skipped."""
+    doc_matcher = DocumentMatcher(config)
+    return doc_matcher.find_matches({doc1, doc2})
+
+
+def _preprocess_docs(doc_matcher, use_serialization, doc_repo, common_doc_repo=None) -> set[Document]:
     common_dir_path = common_doc_repo.base_path if common_doc_repo else None
-    common_docs = common_doc_repo.list() if common_doc_repo else None
-    docs = _translate_docs(doc_repo) if trans else _move_foreign_lang_docs(doc_repo)
+    docs = _move_foreign_lang_docs(doc_repo)
     if use_serialization:
         doc_ser = DocumentPickleRepository(doc_repo.base_path, common_dir_path)
-        prep_docs = {d for d in doc_ser.list() if d in docs}
+        stored_docs = doc_ser.list()
+        prep_docs = {d for d in stored_docs if d in docs}
         unprep_docs = docs.difference(prep_docs)
-        doc_matcher.preprocess(doc_repo.lang, unprep_docs, common_docs)
+        common_index = _common_index(doc_matcher, doc_repo.lang, common_doc_repo, use_serialization) \
+            if common_doc_repo and unprep_docs else None
+        doc_matcher.preprocess(doc_repo.lang, unprep_docs, common_index=common_index)
         preprocessed_docs = prep_docs.union(unprep_docs)
-        doc_ser.save(preprocessed_docs)
+        doc_ser.save(preprocessed_docs) if len(unprep_docs) or len(prep_docs) < len(stored_docs) else None
     else:
-        doc_matcher.preprocess(doc_repo.lang, docs, common_docs)
+        common_index = _common_index(doc_matcher, doc_repo.lang, common_doc_repo, use_serialization) \
+            if common_doc_repo and docs else None
+        doc_matcher.preprocess(doc_repo.lang, docs, common_index=common_index)
         preprocessed_docs = docs
     return preprocessed_docs
 
 
-def _save_all_external_sources(docs, download_path):
-    external_sources = download_all_external_sources(docs, Path(download_path))
-    external_sources_repo = FileRepository(Path(download_path))
-    external_sources_repo.save_all(external_sources)
-
-
-def _translate_docs(doc_repo: DocumentFileRepository) -> set[Document]:
-    docs = doc_repo.list()
-    detect_lang(docs)
-    translated_docs = translate(docs_in_other_langs(docs, doc_repo.lang), doc_repo.lang)
-    if len(translated_docs):
-        for doc in translated_docs:
-            new_path = str(Path(doc.path).with_name(f"{doc.name}_trans.txt"))
-            doc_repo.remove_all({doc})
-            doc.path = new_path
-        doc_repo.save_all(translated_docs)
-    return {doc for doc in docs if doc.lang == doc_repo.lang}
+def _common_index(doc_matcher, lang: str, common_doc_repo, use_serialization):
+    common_docs = common_doc_repo.list()
+    if not use_serialization:
+        return doc_matcher.common_index(lang, common_docs)
+    digest = _common_docs_digest(lang, common_docs)
+    index_ser = CommonIndexPickleRepository(common_doc_repo.base_path)
+    common_index = index_ser.get(digest)
+    if common_index is None:
+        common_index = doc_matcher.common_index(lang, common_docs)
+        index_ser.save(digest, common_index)
+    return common_index
+
+
+def _common_docs_digest(lang: str, common_docs) -> str:
+    digest = blake2b(lang.encode(), digest_size=16)
+    for text in sorted(doc.text for doc in common_docs):
+        digest.update(blake2b(text.encode(), digest_size=16).digest())
+    return digest.hexdigest()
+
+
+def _preprocess_external_sources(doc_matcher, docs: set[Document], source_repo, common_doc_repo, config) \
+    -> set[Document]:
+    """Download the sources referenced in the documents. Only sources with new contents are read and preprocessed,
+    sources which were preprocessed before, e.g. for other submissions, are deserialized. Translated sources replace
+    their downloaded files, so they are only translated once. Sources which could not be translated are skipped."""
+    urls = {url for doc in docs for url in doc.urls}
+    urls = resolvable_urls(urls) if config['resolve_hosts'] else urls
+    source_repo.save_all(Downloader(source_repo.base_path / '.cache').download_by_url(urls, source_repo.base_path))
+    source_paths = {str(path) for path in source_repo.paths(urls)}
+    if not len(source_paths):
+        return set()
+    prep_docs = set()
+    if config['ser']:
+        common_dir_path = common_doc_repo.base_path if common_doc_repo else None
+        doc_ser = DocumentPickleRepository(source_repo.base_path, common_dir_path)
+        stored_paths = {str(path) for path in source_repo.paths()}
+        stored_docs = doc_ser.list()
+        prep_docs = {doc for doc in stored_docs if doc.path in stored_paths}
+    new_docs = source_repo.list({Path(path) for path in source_paths.difference(doc.path for doc in prep_docs)})
+    detect_lang(new_docs)
+    if config['transl']:
+        source_repo.save_translations(_translate_cached(docs_in_other_langs(new_docs, source_repo.lang),
+                                                        source_repo.lang, source_repo.base_path))
+        new_docs = {doc for doc in new_docs if doc.lang == source_repo.lang}
+        source_paths = {str(path) for path in source_repo.paths(urls)}
+    common_index = _common_index(doc_matcher, source_repo.lang, common_doc_repo, config['ser']) \
+        if common_doc_repo and new_docs else None
+    doc_matcher.preprocess(source_repo.lang, new_docs, common_index=common_index)
+    doc_ser.save(prep_docs.union(new_docs)) if config['ser'] and (len(new_docs) or len(prep_docs) < len(stored_docs)) \
+        else None
+    return {doc for doc in prep_docs.union(new_docs) if doc.path in source_paths}
+
+
+def _translate_cached(docs: set[Document], target_lang: str, cache_dir: Path) -> set[Document]:
+    cache_repo = TranslationCacheRepository(cache_dir)
+    cache = cache_repo.load()
+    cache_size = len(cache)
+    try:
+        return translate(docs, target_lang, cache=cache)
+    finally:
+        # Also keeps the chunks of partially failed translations
+        cache_repo.save(cache) if len(cache) != cache_size else None
 
 
 def _move_foreign_lang_docs(doc_repo: DocumentFileRepository) -> set[Document]:
@@ -90,4 +165,4 @@ def _move_foreign_lang_docs(doc_repo: DocumentFileRepository) -> set[Document]:
 
 
 def write_json_reports(matches: list[DocumentPairMatches], repo):
-    [repo.save(m) for m in matches]
+    repo.save_all(matches)
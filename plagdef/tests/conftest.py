@@ -13,7 +13,11 @@ def config():
         'min_cos_sim': 0.3, 'min_dice_sim': 0.33, 'min_cluster_cos_sim': 0.34,
         'adjacent_sents_gap': 4, 'min_adjacent_sents_gap': 0, 'adjacent_sents_gap_summary': 24,
         'min_verbatim_match_char_len': 256, 'min_sent_number': 1, 'min_sent_len': 3, 'min_cluster_char_len': 15,
-        'rem_stop_words': False, 'download_path': '', 'dl_api_key': 'xxx'
+        'rem_stop_words': False, 'download_path': '', 'dl_api_key': 'xxx', 'profile_pair_time': None,
+        'profile_path': 'profiles', 'max_pair_seeds': None, 'max_cluster_sents': None, 'max_verbatim_cells': None,
+        'pair_deadline': None, 'near_duplicate_sim': None,
+        'archive_index': False, 'shard_queue_path': None, 'shard_size': 1000, 'shard_workers': None,
+        'shard_lease_time': 600, 'shard_attempts': 3, 'mapped_corpus': False
     }
 
 
@@ -1,8 +1,11 @@
 from __future__ import annotations
 
+import re
+from collections import Counter
 from pathlib import Path
 
-from plagdef.model.models import Document
+from plagdef.model.models import Document, Sentence, Word
+from plagdef.model.pipeline.preprocessing import CommonContentIndex
 
 
 class DocumentFakeRepository:
@@ -17,19 +20,44 @@ class DocumentFakeRepository:
 
 class FakeDocumentMatcher:
     def __init__(self):
-        self.lang = self.preprocessed_docs = self.common_docs = None
+        self.lang = self.preprocessed_docs = self.common_docs = self.used_common_index = None
+        self.common_index_builds = 0
 
-    def preprocess(self, lang, docs, common_docs):
+    def preprocess(self, lang, docs, common_docs=None, common_index=None):
         self.lang = lang
         self.preprocessed_docs = docs
         self.common_docs = common_docs
+        self.used_common_index = common_index
+
+    def common_index(self, lang, common_docs):
+        self.common_index_builds += 1
+        return CommonContentIndex([doc.text.lower().split() for doc in common_docs])
+
+
+class FakePreprocessor:
+    """Splits sentences at punctuation and uses lowercase words as lemmas so that tests do not need NLP models."""
+
+    def preprocess(self, lang, docs, common_docs=None, common_index=None):
+        for doc in docs:
+            for sent_match in re.finditer(r'[^.!?]+[.!?]?', doc.text):
+                word_matches = list(re.finditer(r'\w\w+', sent_match.group()))
+                if not len(word_matches):
+                    continue
+                lemmas = Counter(word_match.group().lower() for word_match in word_matches)
+                sent_start = sent_match.start() + len(sent_match.group()) - len(sent_match.group().lstrip())
+                sent = Sentence(sent_start, sent_match.end(), lemmas, doc)
+                sent.words = [Word(sent_match.start() + w.start(), sent_match.start() + w.end(), sent)
+                              for w in word_matches]
+                doc.add_sent(sent)
+                doc.vocab.update(lemmas.keys())
 
 
 class FakeResponse:
-    def __init__(self, headers: dict, content: bytes, text: str):
+    def __init__(self, headers: dict, content: bytes, text: str, status_code=200):
         self.headers = headers
         self.content = content
         self.text = text
+        self.status_code = status_code
 
     def raise_for_status(self):
         pass
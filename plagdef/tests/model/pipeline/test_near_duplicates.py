@@ -0,0 +1,68 @@
+from plagdef.model.detection import DocumentMatcher
+from plagdef.model.models import Document, DocumentPairMatches, MatchType
+from plagdef.model.pipeline.near_duplicates import NearDuplicateMatcher
+from plagdef.tests.fakes import FakePreprocessor
+
+TEXT = 'This is the first sentence of a thesis about plagiarism. It explains how documents are compared. ' \
+       'Sentences are split into words and lemmas. Similar sentences are clustered. Clusters are reported as ' \
+       'matches. The last sentence concludes the thesis.'
+
+
+def _docs(text1: str, text2: str) -> tuple[Document, Document]:
+    doc1, doc2 = Document('doc1', 'path/to/doc1', text1), Document('doc2', 'path/to/doc2', text2)
+    FakePreprocessor().preprocess('en', {doc1, doc2})
+    return doc1, doc2
+
+
+def test_near_duplicates():
+    doc1, doc2 = _docs(TEXT, TEXT.replace('thesis', 'paper', 1))
+    matcher = NearDuplicateMatcher(0.7, 50)
+    assert matcher.near_duplicates(matcher.fingerprint(doc1), matcher.fingerprint(doc2))
+
+
+def test_different_docs_are_no_near_duplicates():
+    doc1, doc2 = _docs(TEXT, 'A completely different text. It shares a few words with the thesis.')
+    matcher = NearDuplicateMatcher(0.7, 50)
+    assert not matcher.near_duplicates(matcher.fingerprint(doc1), matcher.fingerprint(doc2))
+
+
+def test_empty_docs_are_no_near_duplicates():
+    matcher = NearDuplicateMatcher(0.7, 50)
+    assert not matcher.near_duplicates(frozenset(), frozenset())
+
+
+def test_align():
+    doc1, doc2 = _docs(TEXT, f"Preface. {TEXT.replace('thesis', 'paper', 1)}")
+    doc_pair_matches = NearDuplicateMatcher(0.7, 50).align(doc1, doc2)
+    verbatim_frags = {frozenset((frag.doc.name, frag.text) for frag in match.frag_pair)
+                      for match in doc_pair_matches.list(MatchType.VERBATIM)}
+    assert frozenset({('doc1', TEXT[TEXT.index('about'):len(TEXT) - 1]),
+                      ('doc2', TEXT[TEXT.index('about'):len(TEXT) - 1])}) in verbatim_frags
+    intelligent_match, = doc_pair_matches.list(MatchType.INTELLIGENT)
+    assert intelligent_match.frag_from_doc(doc1).text == TEXT[:-1]
+
+
+def test_align_covers_same_words_as_pipeline(config):
+    doc1, doc2 = _docs(TEXT, TEXT.replace('thesis', 'paper', 1))
+    for doc in (doc1, doc2):
+        list(doc.sents())[2].common = True
+    pipeline_matches, = DocumentMatcher({**config, 'min_verbatim_match_char_len': 50})._find_matches([(doc1, doc2)])
+    near_dup_matches = NearDuplicateMatcher(0.7, 50).align(doc1, doc2)
+    for match_type in (MatchType.VERBATIM, MatchType.INTELLIGENT):
+        assert _covered_words(near_dup_matches, match_type) == _covered_words(pipeline_matches, match_type)
+
+
+def _covered_words(doc_pair_matches: DocumentPairMatches, match_type: MatchType) -> set:
+    doc1, doc2 = doc_pair_matches.doc1, doc_pair_matches.doc2
+    return {tuple(tuple(word.text for sent in doc.sents(include_common=True) for word in sent.words
+                        if frag.start_char <= word.start_char and word.end_char <= frag.end_char)
+                  for doc, frag in ((doc1, match.frag_from_doc(doc1)), (doc2, match.frag_from_doc(doc2))))
+            for match in doc_pair_matches.list(match_type)}
+
+
+def test_find_matches_aligns_near_duplicates_without_pipeline(config):
+    doc1, doc2 = _docs(TEXT, TEXT.replace('thesis', 'paper', 1))
+    doc_matcher = DocumentMatcher({**config, 'near_duplicate_sim': 0.7, 'min_verbatim_match_char_len': 50})
+    doc_pair_matches, = doc_matcher._find_matches([(doc1, doc2)])
+    assert doc_pair_matches.list(MatchType.VERBATIM)
+    assert not any(sent.tf_isf_bow for sent in doc1.sents())
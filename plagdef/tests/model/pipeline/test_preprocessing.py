@@ -1,8 +1,10 @@
 from collections import Counter
+from types import SimpleNamespace
+from unittest.mock import patch, MagicMock
 
 import pytest
 from plagdef.model.pipeline.preprocessing import Document, Preprocessor, _nlp_pipe, \
-    _extract_urls
+    _extract_urls, NlpPipelineRegistry, CommonContentIndex, _common_word_lists
 
 
 def test_nlp_model():
@@ -17,6 +19,33 @@ def test_nlp_model_with_wrong_lang():
         _nlp_pipe('fre')
 
 
+@patch('stanza.Pipeline')
+def test_nlp_pipe_registry_reuses_pipeline(pipe_mock):
+    registry = NlpPipelineRegistry()
+    assert registry.get('en') is registry.get('en')
+    pipe_mock.assert_called_once()
+
+
+@patch('stanza.Pipeline')
+def test_nlp_pipe_registry_distinguishes_langs_and_processors(pipe_mock):
+    registry = NlpPipelineRegistry()
+    registry.get('en'), registry.get('de'), registry.get('en', 'tokenize')
+    assert pipe_mock.call_count == 3
+    assert registry.langs() == {'en', 'de'}
+
+
+@patch('stanza.Pipeline')
+def test_nlp_pipe_registry_release(pipe_mock):
+    registry = NlpPipelineRegistry()
+    registry.get('en'), registry.get('de')
+    registry.release('en')
+    assert registry.langs() == {'de'}
+    registry.get('en')
+    assert pipe_mock.call_count == 3
+    registry.release()
+    assert registry.langs() == set()
+
+
 def test_ger_sent_seg(nlp_ger):
     doc = nlp_ger('Das ist ein schöner deutscher Text. Besteht aus zwei Sätzen.')
     sent1_words, sent2_words = doc.sentences[0].words, doc.sentences[1].words
@@ -294,6 +323,13 @@ def test_extract_urls_if_urls_present(preprocessor):
     assert doc1.urls == {"https://www.bing.de", "https://www.google.de/search?q=python"}
 
 
+def test_extract_urls_does_not_resolve_hosts():
+    doc = Document("doc", "path/to/doc", "This host does not exist: www.no-such-host-for-plagdef-tests.de/page")
+    with patch('socket.getaddrinfo', side_effect=AssertionError('No lookups during extraction')):
+        _extract_urls(doc)
+    assert doc.urls == {"https://www.no-such-host-for-plagdef-tests.de/page"}
+
+
 def test_extract_urls_with_subpath():
     doc = Document("doc", "path/to/doc", "This is an URL: www.google.de/search?q=python")
     _extract_urls(doc)
@@ -324,3 +360,52 @@ def test_extract_urls_ignores_irrelevant_schemes():
                    "mailto:max.muster@fh-dortmund.de and httpfail://www.google.de")
     _extract_urls(doc)
     assert not len(doc.urls)
+
+
+def test_common_index_contains_sent_with_all_words_of_line():
+    index = CommonContentIndex([['last', 'sentence', 'is', 'common'], ['another', 'line']])
+    assert index.contains_line_of(['the', 'last', 'sentence', 'really', 'is', 'common'])
+    assert not index.contains_line_of(['the', 'last', 'sentence', 'is', 'not'])
+
+
+def test_common_index_ignores_duplicate_lines():
+    index = CommonContentIndex([['some', 'line'], ['line', 'some'], ['some', 'line', 'line']])
+    assert len(index) == 1
+
+
+def test_common_index_equals_linear_scan():
+    lines = [['a', 'b'], ['b', 'c', 'd'], ['d'], ['e', 'f', 'a'], ['b', 'g']]
+    index = CommonContentIndex(lines)
+    sents = [['a'], ['a', 'b'], ['c', 'd'], ['b', 'c'], ['e', 'a'], ['f', 'e', 'a', 'x'], ['g', 'x', 'b'], []]
+    for sent in sents:
+        assert index.contains_line_of(sent) == any(all(word in sent for word in line) for line in lines)
+
+
+def test_common_index_without_lines():
+    assert not CommonContentIndex([]).contains_line_of(['word'])
+
+
+def test_common_word_lists_are_parsed_in_one_batch():
+    def bulk_process(lines):
+        return [SimpleNamespace(sentences=[SimpleNamespace(words=[SimpleNamespace(text=text, upos='NOUN')
+                                                                  for text in line.split()])]) for line in lines]
+
+    pipe = MagicMock()
+    pipe.bulk_process.side_effect = bulk_process
+    common_docs = [Document('doc1', 'path/to/doc1', 'First Line\n\nSecond line\n'),
+                   Document('doc2', 'path/to/doc2', 'Third line\n! ?')]
+    assert _common_word_lists(pipe, common_docs) == [['first', 'line'], ['second', 'line'], ['third', 'line']]
+    pipe.bulk_process.assert_called_once()
+    pipe.assert_not_called()
+
+
+def test_update_tlds_refreshes_separate_extractor_once_per_process(monkeypatch):
+    from plagdef.model.pipeline import preprocessing
+    monkeypatch.setattr(preprocessing, '_tlds_updated', False)
+    monkeypatch.setattr(preprocessing, '_extractor', None)
+    shared_extractor = preprocessing._url_extractor()
+    with patch.object(preprocessing.URLExtract, 'update_when_older', return_value=True) as update_mock:
+        assert preprocessing.update_tlds()
+        assert not preprocessing.update_tlds()
+    update_mock.assert_called_once()
+    assert preprocessing._url_extractor() is not shared_extractor
@@ -1,7 +1,8 @@
 from collections import Counter
 
 from plagdef.model.models import Document
-from plagdef.model.pipeline.seeding import Seed, _vectorize_sents
+from plagdef.model.pipeline.seeding import Seed, _vectorize_sents, ArchiveSentenceIndex
+from plagdef.tests.fakes import FakePreprocessor
 
 
 def test_match_returns_nothing_if_not_similar(preprocessor, seeder):
@@ -45,3 +46,18 @@ def test_vectorize_sents(preprocessed_docs):
                      'restrict': 1.791759469228055, 'by': 1.791759469228055, 'without': 1.791759469228055,
                      'consent': 1.791759469228055, 'infringement': 0.6931471805599453,
                      'be': 0.5469646703818638, 'the': 0.1823215567939546})]
+
+
+def test_archive_index_candidates_yield_same_seeds(seeder):
+    doc = Document('doc', 'path/to/doc', 'This is an awesome document. And some text in it. Nothing else.')
+    archive_docs = [Document('arch1', 'path/to/arch1', 'It is a great one. This is an awesome document. More text.'),
+                    Document('arch2', 'path/to/arch2', 'Totally unrelated. Some text in it. This is an awesome paper.'),
+                    Document('arch3', 'path/to/arch3', 'Completely different words here.')]
+    FakePreprocessor().preprocess('en', [doc, *archive_docs])
+    candidates = ArchiveSentenceIndex(archive_docs).candidates(doc, 0.33)
+    assert archive_docs[2] not in candidates
+    for archive_doc in archive_docs[:2]:
+        seeds = {(seed.sent1.idx, seed.sent2.idx) for seed in seeder.seed(doc, archive_doc)}
+        assert len(seeds)
+        assert {(seed.sent1.idx, seed.sent2.idx) for seed in seeder.seed(doc, archive_doc, candidates[archive_doc])} \
+               == seeds
@@ -1,10 +1,14 @@
-from unittest.mock import patch, call
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic, sleep
+from unittest.mock import patch, call, MagicMock
 
 from deep_translator import GoogleTranslator
-from deep_translator.exceptions import TooManyRequests
+from deep_translator.exceptions import TooManyRequests, RequestError
 
 from plagdef.model.models import Document
-from plagdef.model.pipeline.translate import detect_lang, docs_in_other_langs, translate, _split_text_at_punct
+from plagdef.model.pipeline.translate import detect_lang, docs_in_other_langs, translate, _split_text_at_punct, \
+    TranslationScheduler, LANG_SAMPLE_COUNT, LANG_SAMPLE_LEN
 
 
 def test_detect_lang():
@@ -27,6 +31,62 @@ def test_detect_lang_with_empty_doc():
     assert doc.lang is None
 
 
+def _first_word_lang(text):
+    return text.split()[0].lower() if text else None
+
+
+def test_detect_lang_with_custom_detector():
+    docs = [Document(f'doc{idx}', f'path/to/doc{idx}', f'{lang} text {idx}.') for idx, lang in enumerate(['EN', 'DE'])]
+    detect_lang(docs, _first_word_lang)
+    assert [doc.lang for doc in docs] == ['en', 'de']
+
+
+def test_detect_lang_caches_by_text():
+    detector = MagicMock(return_value='en')
+    detect_lang({Document('doc1', 'path/to/doc1', 'Same text.')}, detector)
+    doc = Document('doc2', 'path/to/doc2', 'Same text.')
+    detect_lang({doc}, detector)
+    detector.assert_called_once()
+    assert doc.lang == 'en'
+
+
+
+def test_detect_lang_keeps_recent_texts_only():
+    detector = MagicMock(side_effect=lambda sample: sample.split()[0].lower())
+    docs = [Document(f'doc{idx}', f'path/to/doc{idx}', f'{lang} text.') for idx, lang in enumerate(['EN', 'DE', 'FR'])]
+    with patch('plagdef.model.pipeline.translate.LANG_CACHE_SIZE', 2), \
+            patch('plagdef.model.pipeline.translate._detected_langs', OrderedDict()) as detected_langs:
+        detect_lang(docs, detector)
+        assert [doc.lang for doc in docs] == ['en', 'de', 'fr']
+        assert len(detected_langs) == 2
+        detect_lang(docs[:1], detector)
+    assert detector.call_count == 4
+
+
+def test_detect_lang_samples_long_docs():
+    detector = MagicMock(return_value='en')
+    detect_lang({Document('doc', 'path/to/doc', 'Start ' + 'x' * 100000 + ' end')}, detector)
+    sample = detector.call_args.args[0]
+    assert len(sample) < LANG_SAMPLE_COUNT * (LANG_SAMPLE_LEN + 1)
+    assert sample.startswith('Start') and sample.endswith('end')
+
+
+def test_detect_lang_is_deterministic():
+    text = 'Der Text ist kurz.'
+    langs = set()
+    for idx in range(5):
+        doc = Document('doc', 'path/to/doc', text + ' ' * idx)
+        detect_lang({doc})
+        langs.add(doc.lang)
+    assert langs == {'de'}
+
+
+def test_detect_lang_with_many_docs_in_parallel():
+    docs = [Document(f'doc{idx}', f'path/to/doc{idx}', f'{"EN" if idx % 2 else "DE"} text {idx}.') for idx in range(40)]
+    detect_lang(docs, _first_word_lang)
+    assert [doc.lang for doc in docs] == ['de' if idx % 2 == 0 else 'en' for idx in range(40)]
+
+
 def test_docs_in_other_langs():
     doc0 = Document('doc0', 'path/to/doc0', '')
     doc1 = Document('doc1', 'path/to/doc1', 'This is an English document.')
@@ -77,7 +137,7 @@ def test_translate_with_long_doc(t_mock, p_mock):
 
 @patch("plagdef.model.pipeline.translate._get_proxies", return_value=['localhost'])
 @patch("plagdef.model.pipeline.translate._translate_large_doc")
-@patch("plagdef.model.pipeline.translate._translate")
+@patch.object(TranslationScheduler, "translate")
 def test_translate_with_extremely_long_doc(t_mock, tl_mock, p_mock):
     doc = Document('doc', 'path/to/doc', "Hello Joe!" * 5001)
     doc.lang = "en"
@@ -88,7 +148,7 @@ def test_translate_with_extremely_long_doc(t_mock, tl_mock, p_mock):
 
 
 @patch("plagdef.model.pipeline.translate._get_proxies", return_value=['localhost'])
-@patch("plagdef.model.pipeline.translate._translate")
+@patch.object(TranslationScheduler, "translate")
 def test_translate_with_same_source_lang(t_mock, p_mock):
     doc = Document('doc', 'path/to/doc', "Hello World!")
     doc.lang = "en"
@@ -105,6 +165,111 @@ def test_translate_retries_on_proxy_error(prox_mock, gtr_mock):
     assert gtr_mock.call_count == 2
 
 
+class FakeTranslatorBackend:
+    def __init__(self, slots=2, rate_limited_requests=0, latency=0., fail_on=None):
+        self.slots = slots
+        self._fail_on = fail_on
+        self.requests = []
+        self._rate_limited_requests = rate_limited_requests
+        self._latency = latency
+        self._lock = Lock()
+
+    def translate(self, text, target_lang, slot):
+        with self._lock:
+            self.requests.append((text, slot, monotonic()))
+            if len(self.requests) <= self._rate_limited_requests:
+                raise TooManyRequests()
+        if self._fail_on and self._fail_on in text:
+            raise RequestError()
+        sleep(self._latency)
+        return text.upper()
+
+
+def test_translate_chunks_of_multiple_docs_concurrently():
+    docs = [Document(f'doc{idx}', f'path/to/doc{idx}', f'Document {idx}. ' * 600) for idx in range(3)]
+    backend = FakeTranslatorBackend(slots=4, latency=0.05)
+    translated = translate(set(docs), 'de', backend)
+    assert sorted(doc.name for doc in translated) == ['doc0', 'doc1', 'doc2']
+    assert {slot for _, slot, _ in backend.requests} == {0, 1, 2, 3}
+    assert all(doc.text == doc.text.upper() and doc.lang == 'de' for doc in docs)
+
+
+def test_translate_chunk_cache_skips_equal_chunks():
+    doc1 = Document('doc1', 'path/to/doc1', 'Same content.')
+    doc2 = Document('doc2', 'path/to/doc2', 'Same content.')
+    backend, cache = FakeTranslatorBackend(), {}
+    translate({doc1}, 'de', backend, cache)
+    translate({doc2}, 'de', backend, cache)
+    assert len(backend.requests) == 1
+    assert doc2.text == 'SAME CONTENT.'
+
+
+def test_translate_backs_off_if_rate_limited():
+    doc = Document('doc', 'path/to/doc', 'Content.')
+    backend = FakeTranslatorBackend(slots=1, rate_limited_requests=2)
+    translate({doc}, 'de', backend)
+    times = [time for _, _, time in backend.requests]
+    assert len(times) == 3
+    assert times[2] - times[1] > times[1] - times[0] > 0.4
+
+
+def test_translate_gives_up_after_max_attempts():
+    doc = Document('doc', 'path/to/doc', 'Content.')
+    doc.lang = 'en'
+    with patch('plagdef.model.pipeline.translate.MIN_BACKOFF', 0.01):
+        translated = translate({doc}, 'de', FakeTranslatorBackend(slots=1, rate_limited_requests=10))
+    assert translated == set()
+    assert doc.text == 'Content.' and doc.lang == 'en'
+
+
+def test_translate_resumes_with_missing_chunks():
+    doc = Document('doc', 'path/to/doc', 'First part. ' * 500 + 'Second part. ' * 100)
+    cache = {}
+    translated = translate({doc}, 'de', FakeTranslatorBackend(fail_on='Second'), cache)
+    assert translated == set()
+    assert len(cache) == 1
+    backend = FakeTranslatorBackend()
+    translate({doc}, 'de', backend, cache)
+    assert len(backend.requests) == 1
+    assert doc.text == 'FIRST PART. ' * 500 + 'SECOND PART. ' * 100
+
+
+def test_translate_leaves_out_docs_which_could_not_be_translated(caplog):
+    doc1, doc2 = Document('doc1', 'path/to/doc1', 'Good part.'), Document('doc2', 'path/to/doc2', 'Bad part.')
+    doc1.lang = doc2.lang = 'en'
+    translated = translate({doc1, doc2}, 'de', FakeTranslatorBackend(fail_on='Bad'))
+    assert translated == {doc1}
+    assert doc1.text == 'GOOD PART.' and doc1.lang == 'de'
+    assert doc2.text == 'Bad part.' and doc2.lang == 'en'
+    assert "Could not translate 'doc2', it is skipped." in caplog.text
+
+
+@patch("plagdef.model.pipeline.translate._get_proxies")
+def test_translate_fully_cached_docs_without_requests(prox_mock):
+    doc1 = Document('doc1', 'path/to/doc1', 'Content.')
+    doc2 = Document('doc2', 'path/to/doc2', 'Content.')
+    cache = {}
+    translate({doc1}, 'de', FakeTranslatorBackend(), cache)
+    translate({doc2}, 'de', cache=cache)
+    prox_mock.assert_not_called()
+    assert doc2.text == 'CONTENT.'
+
+
+@patch("plagdef.model.pipeline.translate._translate_large_doc")
+def test_translate_caches_large_docs(tl_mock):
+    def translate_large_doc(doc, target_lang):
+        doc.text, doc.lang = doc.text.upper(), target_lang
+
+    tl_mock.side_effect = translate_large_doc
+    cache = {}
+    doc1 = Document('doc1', 'path/to/doc1', "Hello Joe!" * 5001)
+    doc2 = Document('doc2', 'path/to/doc2', "Hello Joe!" * 5001)
+    assert translate({doc1}, 'de', cache=cache) == {doc1}
+    assert translate({doc2}, 'de', cache=cache) == {doc2}
+    tl_mock.assert_called_once()
+    assert doc2.text == "HELLO JOE!" * 5001 and doc2.lang == 'de'
+
+
 def test_split_text_at_punct():
     text = "This is some text. Should be split at dot."
     chunks = _split_text_at_punct(text, 25)
@@ -0,0 +1,55 @@
+import pickle
+
+import pytest
+
+from plagdef.model.corpus import MappedCorpus
+from plagdef.model.models import Document
+from plagdef.model.pipeline.seeding import ArchiveSentenceIndex
+from plagdef.tests.fakes import FakePreprocessor
+
+
+@pytest.fixture
+def docs():
+    docs = [Document('doc1', 'path/to/doc1', 'This is an awesome document. And some text in it. Nothing else.'),
+            Document('doc2', 'path/to/doc2', 'Ein schönes Dokument. This is an awesome document. And more text.'),
+            Document('arch1', 'path/to/arch1', 'Totally unrelated. Some text in it. This is an awesome paper.'),
+            Document('arch2', 'path/to/arch2', 'Completely different words here.')]
+    FakePreprocessor().preprocess('en', docs)
+    docs[0].lang, docs[0].urls = 'en', {'https://example.com'}
+    next(iter(docs[1].sents())).common = True
+    return docs
+
+
+def test_mapped_docs_equal_stored_docs(docs, tmp_path):
+    corpus = MappedCorpus.write(tmp_path, docs)
+    for doc_pos, doc in enumerate(docs):
+        mapped_doc = corpus.doc(doc_pos)
+        assert (mapped_doc.name, mapped_doc.path, mapped_doc.text, mapped_doc.lang, mapped_doc.urls) \
+               == (doc.name, doc.path, doc.text, doc.lang, doc.urls)
+        assert mapped_doc.vocab == doc.vocab
+        assert [(sent.start_char, sent.end_char, sent.bow, sent.common,
+                 [(word.start_char, word.end_char) for word in sent.words])
+                for sent in mapped_doc.sents(include_common=True)] \
+               == [(sent.start_char, sent.end_char, sent.bow, sent.common,
+                    [(word.start_char, word.end_char) for word in sent.words])
+                   for sent in doc.sents(include_common=True)]
+
+
+def test_pickled_corpus_only_contains_its_location(docs, tmp_path):
+    corpus = MappedCorpus.write(tmp_path, docs)
+    corpus.doc(0)
+    unpickled_corpus = pickle.loads(pickle.dumps(corpus))
+    assert len(pickle.dumps(corpus)) < 200
+    assert unpickled_corpus.doc(1).text == docs[1].text
+
+
+def test_archive_candidates_equal_archive_index_candidates(docs, tmp_path):
+    corpus = MappedCorpus.write(tmp_path, docs, archive_start=2)
+    archive_index = ArchiveSentenceIndex(docs[2:])
+    for doc_pos in range(2):
+        doc = docs[doc_pos]
+        expected = {archive_doc: [(sent.idx, archive_sent.idx) for sent, archive_sent in sent_pairs]
+                    for archive_doc, sent_pairs in archive_index.candidates(doc, 0.3).items()}
+        assert {docs[archive_doc_pos]: sent_idx_pairs
+                for archive_doc_pos, sent_idx_pairs in corpus.archive_candidates(doc_pos, 0.3).items()} == expected
+    assert len(corpus.archive_candidates(0, 0.3))
@@ -1,8 +1,12 @@
+import json
 from unittest.mock import patch
 
 from plagdef.model.detection import DocumentMatcher
 from plagdef.model.matching import Pipeline
 from plagdef.model.models import Document
+from plagdef.model.pipeline.seeding import SeedFinder, ArchiveSentenceIndex
+from plagdef.model.stats import run_collecting_stats
+from plagdef.tests.fakes import FakePreprocessor
 
 
 @patch('plagdef.model.detection.parallelize')
@@ -58,8 +62,131 @@ def test_find_matches_with_identical_doc_in_both_archive_and_docs(method, config
 
 
 @patch.object(Pipeline, 'find_matches', return_value=[])
-def test__find_matches(config):
+def test__find_matches(find_matches_mock, config):
     doc_matcher = DocumentMatcher(config)
     matches = doc_matcher._find_matches([(Document('doc0', '/some/path/to/doc0', 'Some text.'),
                                           Document('doc1', '/some/path/to/doc1', 'Some text.'))])
     assert matches == []
+
+
+def test_sweep_equals_separate_runs(config):
+    docs = {Document('doc1', 'path/to/doc1', 'This is an awesome document. And some text in it. Nothing else.'),
+            Document('doc2', 'path/to/doc2', 'It is a great one. This is an awesome document. And more text in it.'),
+            Document('doc3', 'path/to/doc3', 'Totally unrelated. Some text in it. This is an awesome paper.')}
+    FakePreprocessor().preprocess('en', docs)
+    sweep_results = DocumentMatcher(config).sweep(docs, [0.6, 0.3])
+    assert list(sweep_results.keys()) == [0.3, 0.6]
+    for sim_th, sweep_matches in sweep_results.items():
+        th_config = {**config, 'min_cos_sim': sim_th, 'min_dice_sim': sim_th, 'min_cluster_cos_sim': sim_th}
+        matches = DocumentMatcher(th_config).find_matches(docs)
+        assert {(frozenset({m.doc1, m.doc2}), len(m)) for m in sweep_matches} \
+               == {(frozenset({m.doc1, m.doc2}), len(m)) for m in matches}
+    assert len(sweep_results[0.3]) > len(sweep_results[0.6])
+
+
+@patch.object(SeedFinder, 'seed', return_value=set())
+def test_sweep_seeds_once_per_pair(seed_mock, config):
+    doc_matcher = DocumentMatcher(config)
+    doc_matcher._sweep_matches([(Document('doc0', '/some/path/to/doc0', 'Some text.'),
+                                 Document('doc1', '/some/path/to/doc1', 'Some text.'))], sim_thresholds=[0.3, 0.5, 0.7])
+    seed_mock.assert_called_once()
+
+
+def test_sweep_records_each_pair_once(config):
+    docs = [Document('doc1', 'path/to/doc1', 'This is an awesome document. And some text in it. Nothing else.'),
+            Document('doc2', 'path/to/doc2', 'It is a great one. This is an awesome document. And more text in it.')]
+    FakePreprocessor().preprocess('en', docs)
+    _, pair_stats = run_collecting_stats(DocumentMatcher(config)._sweep_matches, [tuple(docs)], 0, [0.3, 0.6])
+    assert pair_stats.counters['pairs'] == 1
+    assert pair_stats.counters['seeds@0.3'] >= pair_stats.counters['seeds@0.6'] > 0
+    assert 'seeds' not in pair_stats.counters
+
+
+def test_find_matches_profiles_slow_pairs(config, tmp_path):
+    doc1 = Document('doc1', 'path/to/doc1', 'This is an awesome document. And some text in it. Nothing else.')
+    doc2 = Document('doc2', 'path/to/doc2', 'It is a great one. This is an awesome document. And more text in it.')
+    FakePreprocessor().preprocess('en', {doc1, doc2})
+    doc_matcher = DocumentMatcher({**config, 'profile_pair_time': 0, 'profile_path': str(tmp_path / 'profiles')})
+    doc_matcher._find_matches([(doc1, doc2)])
+    profile_file, = (tmp_path / 'profiles').glob('doc1-doc2-*.prof')
+    pair_stats = json.loads(profile_file.with_suffix('.json').read_text(encoding='utf-8'))
+    assert pair_stats['sentences'] == [3, 3]
+    assert pair_stats['seeds'] > 0
+    assert {'clusters', 'summary_clusters', 'verbatim_cells'}.issubset(pair_stats)
+
+
+def test_find_matches_profiles_same_named_pairs_separately(config, tmp_path):
+    docs = [Document('doc', f'path/to/{dir_name}/doc', f'This is an awesome {dir_name}. And some text in it.')
+            for dir_name in ('a', 'b', 'c', 'd')]
+    FakePreprocessor().preprocess('en', docs)
+    doc_matcher = DocumentMatcher({**config, 'profile_pair_time': 0, 'profile_path': str(tmp_path / 'profiles')})
+    doc_matcher._find_matches([(docs[0], docs[1]), (docs[2], docs[3])])
+    assert len(list((tmp_path / 'profiles').glob('*.prof'))) == 2
+
+
+def test_profile_of_archive_pair_uses_its_sentence_pairs(config, tmp_path):
+    doc1 = Document('doc1', 'path/to/doc1', 'This is an awesome document. And some text in it. Nothing else.')
+    doc2 = Document('doc2', 'path/to/doc2', 'It is a great one. This is an awesome document. And more text in it.')
+    FakePreprocessor().preprocess('en', {doc1, doc2})
+    doc_matcher = DocumentMatcher({**config, 'profile_pair_time': 0, 'profile_path': str(tmp_path / 'profiles')})
+    sent_pairs = [(list(doc1.sents())[0], list(doc2.sents())[1])]
+    with patch.object(doc_matcher._seeder, 'seed', wraps=doc_matcher._seeder.seed) as seed_mock:
+        doc_matcher._match_pair(doc1, doc2, {}, sent_pairs)
+    assert [call.args for call in seed_mock.call_args_list] == [(doc1, doc2, sent_pairs)] * 2
+
+
+def test_find_matches_does_not_profile_fast_pairs(config, tmp_path):
+    doc1, doc2 = Document('doc1', 'path/to/doc1', 'Some text.'), Document('doc2', 'path/to/doc2', 'Other text.')
+    FakePreprocessor().preprocess('en', {doc1, doc2})
+    doc_matcher = DocumentMatcher({**config, 'profile_pair_time': 60, 'profile_path': str(tmp_path / 'profiles')})
+    doc_matcher._find_matches([(doc1, doc2)])
+    assert not (tmp_path / 'profiles').exists()
+
+
+def test_find_matches_with_archive_index_equals_pairwise_matching(config):
+    docs = {Document('doc1', 'path/to/doc1', 'This is an awesome document. And some text in it. Nothing else.'),
+            Document('doc2', 'path/to/doc2', 'It is a great one. This is an awesome document. And more text in it.')}
+    archive_docs = {Document('arch1', 'path/to/arch1', 'Totally unrelated. Some text in it. This is an awesome paper.'),
+                    Document('arch2', 'path/to/arch2', 'Completely different words here.')}
+    FakePreprocessor().preprocess('en', docs | archive_docs)
+    indexed_matches = DocumentMatcher({**config, 'archive_index': True}).find_matches(docs, archive_docs)
+    pairwise_matches = DocumentMatcher(config).find_matches(docs, archive_docs)
+    assert {(frozenset({m.doc1.name, m.doc2.name}), len(m)) for m in indexed_matches} \
+           == {(frozenset({m.doc1.name, m.doc2.name}), len(m)) for m in pairwise_matches}
+    assert any('arch1' in {m.doc1.name, m.doc2.name} for m in indexed_matches)
+
+
+def test_find_matches_with_mapped_corpus_equals_matching_docs(config):
+    docs = {Document('doc1', 'path/to/doc1', 'This is an awesome document. And some text in it. Nothing else.'),
+            Document('doc2', 'path/to/doc2', 'It is a great one. This is an awesome document. And more text in it.')}
+    archive_docs = {Document('arch1', 'path/to/arch1', 'Totally unrelated. Some text in it. This is an awesome paper.'),
+                    Document('arch2', 'path/to/arch2', 'Completely different words here.')}
+    FakePreprocessor().preprocess('en', docs | archive_docs)
+    for archive_index in (False, True):
+        doc_config = {**config, 'archive_index': archive_index}
+        mapped_matches = DocumentMatcher({**doc_config, 'mapped_corpus': True}).find_matches(docs, archive_docs)
+        matches = DocumentMatcher(doc_config).find_matches(docs, archive_docs)
+        assert {(frozenset({m.doc1, m.doc2}), len(m)) for m in mapped_matches} \
+               == {(frozenset({m.doc1, m.doc2}), len(m)) for m in matches}
+        assert len(mapped_matches)
+        assert {id(m.doc1) for m in mapped_matches} <= {id(doc) for doc in docs | archive_docs}
+
+
+def test_find_matches_with_archive_and_default_settings_queries_archive_index():
+    from plagdef.config import settings
+    docs = {Document('doc1', 'path/to/doc1', 'This is an awesome document. And some text in it. Nothing else.'),
+            Document('doc2', 'path/to/doc2', 'It is a great one. This is an awesome document. And more text in it.')}
+    archive_docs = {Document('arch1', 'path/to/arch1', 'Totally unrelated. Some text in it. This is an awesome paper.'),
+                    Document('arch2', 'path/to/arch2', 'Completely different words here.')}
+    FakePreprocessor().preprocess('en', docs | archive_docs)
+    config = {**settings, 'min_cos_sim': 0.3, 'min_dice_sim': 0.3, 'min_cluster_cos_sim': 0.3,
+              'min_cluster_char_len': 15, 'min_sent_number': 1}
+    with patch('plagdef.model.detection.MappedCorpus.write') as write_mock, \
+        patch('plagdef.model.detection.ArchiveSentenceIndex', wraps=ArchiveSentenceIndex) as index_mock:
+        matches = DocumentMatcher(config).find_matches(docs, archive_docs)
+    write_mock.assert_not_called()
+    index_mock.assert_called_once()
+    pairwise_matches = DocumentMatcher({**config, 'archive_index': False}).find_matches(docs, archive_docs)
+    assert {(frozenset({m.doc1, m.doc2}), len(m)) for m in matches} \
+           == {(frozenset({m.doc1, m.doc2}), len(m)) for m in pairwise_matches}
+    assert any('arch1' in {m.doc1.name, m.doc2.name} for m in matches)
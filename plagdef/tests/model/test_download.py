@@ -1,18 +1,26 @@
 import os
+import socket
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 from random import choice
 from string import ascii_uppercase
+from threading import Thread
 from unittest.mock import patch
 
+import pytest
+
 import requests
 from bs4 import BeautifulSoup
 from requests.exceptions import SSLError, HTTPError
 
-from plagdef.model.download import _download_page, download_external_sources, download_all_external_sources
+from plagdef.model import download
+from plagdef.model.download import _download_page, download_external_sources, download_all_external_sources, \
+    Downloader, resolvable_urls
 from plagdef.model.models import Document
 from plagdef.tests.fakes import FakeResponse
 
 
-@patch("requests.get", return_value=FakeResponse({'content-type': 'text/html'}, b'', ''))
+@patch("requests.Session.get", return_value=FakeResponse({'content-type': 'text/html'}, b'', ''))
 @patch.object(BeautifulSoup, 'get_text', return_value=''.join(choice(ascii_uppercase) for _ in range(2000)))
 def test_download_page(bs_mock, req_mock, tmp_path):
     file = _download_page("https://google.com", tmp_path)
@@ -22,50 +30,50 @@ def test_download_page(bs_mock, req_mock, tmp_path):
     assert not file.binary
 
 
-@patch("requests.get", return_value=FakeResponse({'content-type': 'text/html'}, b'', ''))
+@patch("requests.Session.get", return_value=FakeResponse({'content-type': 'text/html'}, b'', ''))
 @patch.object(BeautifulSoup, 'get_text', return_value='')
 def test_download_page_returns_none_if_content_length_zero(req_mock, bs_mock, tmp_path):
     file = _download_page("https://google.com", tmp_path)
     assert not file
 
 
-@patch("requests.get", return_value=FakeResponse({'content-type': 'text/html'}, b'', ''))
+@patch("requests.Session.get", return_value=FakeResponse({'content-type': 'text/html'}, b'', ''))
 @patch.object(BeautifulSoup, 'get_text', return_value=''.join(choice(ascii_uppercase) for _ in range(2000)))
 def test_download_page_with_url_with_path(req_mock, bs_mock, tmp_path):
     file = _download_page("https://reisevergnuegen.com/deutschland-duesseldorf-tipps", tmp_path)
     assert file.path.name == "deutschland-duesseldorf-tipps_from_reisevergnuegen.com.txt"
 
 
-@patch("requests.get", return_value=FakeResponse({'content-type': 'text/html'}, b'', ''))
+@patch("requests.Session.get", return_value=FakeResponse({'content-type': 'text/html'}, b'', ''))
 @patch.object(BeautifulSoup, 'get_text', return_value=''.join(choice(ascii_uppercase) for _ in range(2000)))
 def test_download_page_with_url_containing_insecure_chars(req_mock, bs_mock, tmp_path):
     file = _download_page("https://google.de/*!<<<>|a", tmp_path)
     assert file.path.name == "a_from_google.de.txt"
 
 
-@patch("requests.get", return_value=FakeResponse({'content-type': 'text/html'}, b'', ''))
+@patch("requests.Session.get", return_value=FakeResponse({'content-type': 'text/html'}, b'', ''))
 @patch.object(BeautifulSoup, 'get_text', return_value=''.join(choice(ascii_uppercase) for _ in range(2000)))
 def test_download_page_with_url_including_fragment(req_mock, bs_mock, tmp_path):
     file = _download_page("https://abc.de/path/#fragment", tmp_path)
     assert file.path.name == "path_from_abc.de.txt"
 
 
-@patch("requests.get", return_value=FakeResponse({'content-type': 'text/html'}, b'', ''))
+@patch("requests.Session.get", return_value=FakeResponse({'content-type': 'text/html'}, b'', ''))
 @patch.object(BeautifulSoup, 'get_text', return_value=''.join(choice(ascii_uppercase) for _ in range(2000)))
 def test_download_page_with_url_including_fragment_without_path(req_mock, bs_mock, tmp_path):
     file = _download_page("https://abc.de/#fragment", tmp_path)
     assert file.path.name == "abc.de.txt"
 
 
-@patch("requests.get", return_value=FakeResponse({'content-type': 'application/pdf'}, bytearray(os.urandom(2000)),
-                                                 'Content'))
+@patch("requests.Session.get",
+       return_value=FakeResponse({'content-type': 'application/pdf'}, bytearray(os.urandom(2000)), 'Content'))
 def test_download_page_with_different_content_type(req_mock, tmp_path):
     file = _download_page("https://google.de", tmp_path)
     assert file.path.name == "google.de.pdf"
     assert file.binary
 
 
-@patch("requests.get", return_value=FakeResponse({}, b'', ''))
+@patch("requests.Session.get", return_value=FakeResponse({}, b'', ''))
 @patch.object(BeautifulSoup, 'get_text', return_value=''.join(choice(ascii_uppercase) for _ in range(2000)))
 def test_download_page_with_no_content_type(bs_mock, req_mock, tmp_path):
     file = _download_page("https://google.de", tmp_path)
@@ -73,33 +81,33 @@ def test_download_page_with_no_content_type(bs_mock, req_mock, tmp_path):
     assert not file.binary
 
 
-@patch("requests.get", return_value=FakeResponse({'content-type': 'text/html'}, b'', ''))
+@patch("requests.Session.get", return_value=FakeResponse({'content-type': 'text/html'}, b'', ''))
 @patch.object(FakeResponse, "raise_for_status", side_effect=HTTPError())
 def test_download_page_with_status_404(req_mock, tmp_path):
     file = _download_page("https://google.de/not_existing_subpath", tmp_path)
     assert not file
 
 
-@patch("requests.get",
+@patch("requests.Session.get",
        return_value=FakeResponse({'content-type': 'application/pdf'}, bytearray(os.urandom(1999)), ''))
 def test_download_page_ignores_small_files(req_mock, tmp_path):
     file = _download_page("https://google.de", tmp_path)
     assert not file
 
 
-@patch("requests.get", side_effect=requests.ConnectionError())
+@patch("requests.Session.get", side_effect=requests.ConnectionError())
 def test_download_page_catches_timeout_error(req_mock, tmp_path):
     file = _download_page("https://google.de", tmp_path)
     assert not file
 
 
-@patch("requests.get", side_effect=SSLError())
+@patch("requests.Session.get", side_effect=SSLError())
 def test_download_page_catches_ssl_error(req_mock, tmp_path):
     file = _download_page("https://google.de", tmp_path)
     assert not file
 
 
-@patch("requests.get", side_effect=SSLError())
+@patch("requests.Session.get", side_effect=SSLError())
 def test_download_external_sources_filters_none(req_mock, tmp_path):
     doc = Document("doc", "path/to/doc", "Google.com is the most popular search engine.")
     doc.urls = {"https://google.com"}
@@ -107,7 +115,7 @@ def test_download_external_sources_filters_none(req_mock, tmp_path):
     assert files == set()
 
 
-@patch("requests.get", return_value=FakeResponse({'content-type': 'text/html'}, b'', ''))
+@patch("requests.Session.get", return_value=FakeResponse({'content-type': 'text/html'}, b'', ''))
 @patch.object(BeautifulSoup, 'get_text', return_value=''.join(choice(ascii_uppercase) for _ in range(2000)))
 def test_download_external_sources_filters_by_same_contents(req_mock, bs_mock, tmp_path):
     doc1 = Document("doc1", "path/to/doc1", "https://website.com, https://samewebsite.com")
@@ -116,7 +124,7 @@ def test_download_external_sources_filters_by_same_contents(req_mock, bs_mock, t
     assert len(files) == 1
 
 
-@patch("requests.get", side_effect=[FakeResponse({'content-type': 'text/html'}, b'', ''),
+@patch("requests.Session.get", side_effect=[FakeResponse({'content-type': 'text/html'}, b'', ''),
                                     FakeResponse({'content-type': 'text/html'}, b'', '')])
 @patch.object(BeautifulSoup, 'get_text', side_effect=[''.join(choice(ascii_uppercase) for _ in range(2000)),
                                                       ''.join(choice(ascii_uppercase) for _ in range(2000))])
@@ -130,7 +138,7 @@ def test_download_all_external_sources(req_mock, bs_mock, tmp_path):
     assert "google.com.txt", "bing.com.txt" in [file.path.name for file in files]
 
 
-@patch("requests.get", return_value=FakeResponse({'content-type': 'text/html'}, b'', ''))
+@patch("requests.Session.get", return_value=FakeResponse({'content-type': 'text/html'}, b'', ''))
 @patch.object(BeautifulSoup, 'get_text', return_value=''.join(choice(ascii_uppercase) for _ in range(2000)))
 def test_download_all_external_sources_filters_by_same_contents(req_mock, bs_mock, tmp_path):
     doc1 = Document("doc1", "path/to/doc1", "https://website.com")
@@ -139,3 +147,120 @@ def test_download_all_external_sources_filters_by_same_contents(req_mock, bs_moc
     doc2.urls = {"https://samewebsite.com"}
     files = download_all_external_sources({doc1, doc2}, tmp_path)
     assert len(files) == 1
+
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    body = ('Some text. ' * 200).encode()
+    requests = []
+
+    def do_GET(self):
+        _StandInHandler.requests.append((self.path, self.headers.get('If-None-Match')))
+        if self.path in ('/slow', '/slow_etag'):
+            time.sleep(1)
+        if self.headers.get('If-None-Match') == '"v1"':
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('ETag', '"v1"') if self.path in ('/etag', '/slow_etag') else None
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server_url():
+    _StandInHandler.requests = []
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _StandInHandler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_port}'
+    server.shutdown()
+    server.server_close()
+
+
+def test_downloader_revalidates_cached_response(server_url, tmp_path):
+    (tmp_path / 'cache').mkdir(), (tmp_path / 'docs').mkdir()
+    files = Downloader(tmp_path / 'cache').download({f'{server_url}/etag'}, tmp_path / 'docs')
+    cached_files = Downloader(tmp_path / 'cache').download({f'{server_url}/etag'}, tmp_path / 'docs')
+    assert files == cached_files
+    assert files.pop().content == _StandInHandler.body.decode()
+    assert _StandInHandler.requests == [('/etag', None), ('/etag', '"v1"')]
+
+
+def test_downloader_does_not_cache_without_validators(server_url, tmp_path):
+    Downloader(tmp_path / 'cache').download({f'{server_url}/plain'}, tmp_path)
+    Downloader(tmp_path / 'cache').download({f'{server_url}/plain'}, tmp_path)
+    assert _StandInHandler.requests == [('/plain', None), ('/plain', None)]
+    assert not len(list((tmp_path / 'cache').iterdir()))
+
+
+def test_downloader_skips_hanging_server(server_url, tmp_path):
+    start = time.perf_counter()
+    files = Downloader(timeout=0.2).download({f'{server_url}/slow', f'{server_url}/plain'}, tmp_path)
+    assert len(files) == 1
+    assert time.perf_counter() - start < 1
+
+
+def test_downloader_stops_after_total_timeout(server_url, tmp_path):
+    start = time.perf_counter()
+    files = Downloader(total_timeout=0.2).download({f'{server_url}/slow'}, tmp_path)
+    assert files == set()
+    assert time.perf_counter() - start < 1
+
+
+def test_downloader_stores_nothing_after_total_timeout(server_url, tmp_path):
+    Downloader(tmp_path / 'cache', total_timeout=0.2).download({f'{server_url}/slow_etag'}, tmp_path)
+    time.sleep(1.2)
+    assert not any((tmp_path / 'cache').iterdir())
+
+
+@pytest.fixture
+def resolver_cache():
+    download._resolved_hosts.clear()
+    yield download._resolved_hosts
+    download._resolved_hosts.clear()
+
+
+def _getaddrinfo(host, port):
+    if host == 'slow.com':
+        time.sleep(1)
+    if host not in ('a.com', 'slow.com'):
+        raise socket.gaierror()
+    return [(socket.AF_INET, socket.SOCK_STREAM, 6, '', ('127.0.0.1', 0))]
+
+
+@patch('socket.getaddrinfo', side_effect=_getaddrinfo)
+def test_resolvable_urls_drops_unknown_hosts(resolve_mock, resolver_cache):
+    urls = resolvable_urls({'https://a.com/x', 'https://a.com/y', 'https://no-such-host.com'}, timeout=1)
+    assert urls == {'https://a.com/x', 'https://a.com/y'}
+    assert resolve_mock.call_count == 2
+
+
+@patch('socket.getaddrinfo', side_effect=_getaddrinfo)
+def test_resolvable_urls_caches_hosts(resolve_mock, resolver_cache):
+    resolvable_urls({'https://a.com/x', 'https://no-such-host.com'}, timeout=1)
+    urls = resolvable_urls({'https://a.com/y', 'https://no-such-host.com/z'}, timeout=1)
+    assert urls == {'https://a.com/y'}
+    assert resolve_mock.call_count == 2
+
+
+@patch('socket.getaddrinfo', side_effect=_getaddrinfo)
+def test_resolvable_urls_looks_up_unresolved_hosts_again_after_a_while(resolve_mock, resolver_cache):
+    resolvable_urls({'https://a.com/x', 'https://no-such-host.com'}, timeout=1)
+    with patch('plagdef.model.download.monotonic', return_value=time.monotonic() + download.UNRESOLVED_HOST_TTL + 1):
+        urls = resolvable_urls({'https://a.com/y', 'https://no-such-host.com/z'}, timeout=1)
+    assert urls == {'https://a.com/y'}
+    assert sorted(call.args[0] for call in resolve_mock.call_args_list) == ['a.com', 'no-such-host.com',
+                                                                           'no-such-host.com']
+
+
+@patch('socket.getaddrinfo', side_effect=_getaddrinfo)
+def test_resolvable_urls_drops_hosts_exceeding_timeout(resolve_mock, resolver_cache):
+    start = time.perf_counter()
+    urls = resolvable_urls({'https://a.com', 'https://slow.com'}, timeout=0.2)
+    assert urls == {'https://a.com'}
+    assert time.perf_counter() - start < 1
+    assert 'slow.com' not in resolver_cache
@@ -1,6 +1,9 @@
+from unittest.mock import patch
+
 from plagdef.model.detection import DocumentMatcher
 from plagdef.model.matching import VerbatimMatcher
 from plagdef.model.models import Document, Cluster, Seed, MatchType
+from plagdef.tests.fakes import FakePreprocessor
 
 
 def test_common_words(preprocessor, config):
@@ -196,3 +199,74 @@ def test_find_matches_with_archive_docs(config):
     doc_matcher.preprocess('en', archive_docs)
     matches = doc_matcher.find_matches(set(docs), archive_docs=archive_docs)
     assert len(matches) == 4
+
+
+def test_find_verbatim_matches_reuses_cached_cluster_matches():
+    doc1 = Document('doc1', 'path/to/doc1', 'Some text in doc1. There must be identical sentences.')
+    doc2 = Document('doc2', 'path/to/doc2', 'Some text in doc2. There must be identical sentences.')
+    FakePreprocessor().preprocess('en', [doc1, doc2])
+    cluster = Cluster({Seed(doc1.sents(include_common=True)[1], doc2.sents(include_common=True)[1], 1, 1)})
+    verbatim_matcher = VerbatimMatcher(25)
+    cache = {}
+    matches = verbatim_matcher.find_verbatim_matches({cluster}, cache)
+    with patch.object(VerbatimMatcher, '_common_words') as common_words_mock:
+        cached_matches = verbatim_matcher.find_verbatim_matches({cluster}, cache)
+    common_words_mock.assert_not_called()
+    assert len(matches) == 1
+    assert cached_matches == matches
+
+
+def _budget_pair():
+    doc1 = Document('doc1', 'path/to/doc1', 'Some identical text. This is a sentence. This as well. More similar text.')
+    doc2 = Document('doc2', 'path/to/doc2',
+                    'Some identical text. Totally different words. These are too. More similar text.')
+    FakePreprocessor().preprocess('en', {doc1, doc2})
+    return doc1, doc2
+
+
+def test_find_matches_within_budgets_is_not_flagged(config):
+    doc_matcher = DocumentMatcher({**config, 'min_verbatim_match_char_len': 5, 'max_pair_seeds': 100,
+                                   'max_cluster_sents': 100, 'max_verbatim_cells': 10000, 'pair_deadline': 60})
+    doc_pair_matches, = doc_matcher._find_matches([_budget_pair()])
+    assert len(doc_pair_matches.list(MatchType.VERBATIM)) == 2
+    assert not doc_pair_matches.exceeded_budgets
+
+
+def test_find_matches_keeps_most_similar_seeds(config):
+    doc_matcher = DocumentMatcher({**config, 'min_verbatim_match_char_len': 5, 'max_pair_seeds': 1})
+    doc_pair_matches, = doc_matcher._find_matches([_budget_pair()])
+    assert doc_pair_matches.exceeded_budgets == {'seeds'}
+    assert len(doc_pair_matches) == 1
+
+
+def test_find_matches_skips_verbatim_breakdown_of_large_clusters(config):
+    for budget in ({'max_cluster_sents': 1}, {'max_verbatim_cells': 10}):
+        doc_matcher = DocumentMatcher({**config, 'min_verbatim_match_char_len': 5, **budget})
+        doc_pair_matches, = doc_matcher._find_matches([_budget_pair()])
+        assert doc_pair_matches.exceeded_budgets == {next(iter(budget))[4:]}
+        assert not len(doc_pair_matches.list(MatchType.VERBATIM))
+        assert len(doc_pair_matches.list(MatchType.INTELLIGENT)) == 2
+
+
+def test_find_matches_stops_cluster_extension_after_deadline(config):
+    doc_matcher = DocumentMatcher({**config, 'min_verbatim_match_char_len': 5, 'pair_deadline': 0})
+    doc_pair_matches = doc_matcher._match_pair(*_budget_pair(), {})
+    assert doc_pair_matches.exceeded_budgets == {'deadline'}
+    assert not len(doc_pair_matches)
+
+
+def test_find_matches_skips_remaining_stages_after_deadline(config):
+    doc_matcher = DocumentMatcher({**config, 'min_verbatim_match_char_len': 5, 'pair_deadline': 0})
+    # The deadline only passes after the clusters are built
+    with patch('plagdef.model.pipeline.extension.perf_counter', return_value=0):
+        doc_pair_matches, = doc_matcher._find_matches([_budget_pair()])
+    assert doc_pair_matches.exceeded_budgets == {'deadline'}
+    assert not len(doc_pair_matches.list(MatchType.VERBATIM))
+    assert len(doc_pair_matches.list(MatchType.INTELLIGENT)) == 2
+
+
+def test_find_matches_stops_cluster_extension_after_deadline(config):
+    doc_matcher = DocumentMatcher({**config, 'min_verbatim_match_char_len': 5, 'pair_deadline': 0})
+    doc_pair_matches = doc_matcher._match_pair(*_budget_pair(), {})
+    assert doc_pair_matches.exceeded_budgets == {'deadline'}
+    assert not len(doc_pair_matches)
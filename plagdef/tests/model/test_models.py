@@ -470,6 +470,14 @@ def test_doc_pair_matches_len():
     assert len(doc_pair_matches) == 2
 
 
+def test_doc_pair_matches_frags_in_pair_order():
+    doc1, doc2 = Document('doc1', 'path/to/doc1', 'a'), Document('doc2', 'path/to/doc2', 'b')
+    frag1, frag2 = Fragment(0, 7, doc1), Fragment(0, 4, doc2)
+    doc_pair_matches = DocumentPairMatches(doc1, doc2)
+    assert doc_pair_matches.frags_in_pair_order(Match(MatchType.VERBATIM, frag2, frag1)) == (frag1, frag2)
+    assert doc_pair_matches.frags_in_pair_order(Match(MatchType.VERBATIM, frag1, frag2)) == (frag1, frag2)
+
+
 def _create_sent(doc_name: str, sent_idx: int):
     doc = Document(doc_name, 'path/to/doc', '')
     [doc.sents(include_common=True).add(Sentence(idx, -1, Counter(), doc)) for idx in range(sent_idx + 1)]
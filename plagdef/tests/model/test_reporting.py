@@ -1,4 +1,5 @@
-from plagdef.model.reporting import generate_text_report
+from plagdef.model.models import Document, DocumentPairMatches, Match, MatchType, Fragment
+from plagdef.model.reporting import generate_text_report, write_text_report
 
 
 def test_generate_text_report_with_no_matches_returns_msg():
@@ -25,3 +26,32 @@ def test_generate_text_report_contains_matches(matches):
     assert "Pair('path/to/doc3', 'path/to/doc4'):\n" in report or "Pair('path/to/doc4', 'path/to/doc3'):\n" in report
     assert 'Match(Fragment(2, 6), Fragment(2, 8))\n' in report \
            or 'Match(Fragment(2, 8), Fragment(2, 6))\n' in report
+
+
+def test_write_text_report_in_chunks(matches):
+    class Stream(list):
+        write = list.append
+
+    stream = Stream()
+    write_text_report(matches, stream, chunk_lines=2)
+    assert len(stream) > 2
+    assert ''.join(stream) == generate_text_report(matches)
+
+
+def test_generate_text_report_orders_fragments_by_pair():
+    doc1, doc2 = Document('doc1', 'path/to/doc1', 'Some text.'), Document('doc2', 'path/to/doc2', 'Other text.')
+    dpm = DocumentPairMatches(doc1, doc2, [Match(MatchType.VERBATIM, Fragment(5, 9, doc2), Fragment(0, 4, doc1)),
+                                           Match(MatchType.VERBATIM, Fragment(5, 8, doc1), Fragment(0, 3, doc2))])
+    report = generate_text_report([dpm])
+    assert report.endswith("  Pair('path/to/doc1', 'path/to/doc2'):\n"
+                           '    Match(Fragment(0, 4), Fragment(5, 9))\n'
+                           '    Match(Fragment(5, 8), Fragment(0, 3))\n')
+
+
+def test_generate_text_report_flags_pairs_with_exceeded_budgets():
+    doc1, doc2 = Document('doc1', 'path/to/doc1', 'Some text.'), Document('doc2', 'path/to/doc2', 'Other text.')
+    dpm = DocumentPairMatches(doc1, doc2, [Match(MatchType.INTELLIGENT, Fragment(0, 4, doc1), Fragment(0, 5, doc2))])
+    dpm.exceeded_budgets.update({'verbatim_cells', 'deadline'})
+    report = generate_text_report([dpm])
+    assert "Pair('path/to/doc1', 'path/to/doc2') [incomplete, exceeded budgets: deadline, verbatim_cells]:\n" \
+           in report
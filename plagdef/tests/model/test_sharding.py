@@ -0,0 +1,112 @@
+import json
+import os
+from unittest.mock import patch
+
+import pytest
+
+from plagdef.model.detection import DocumentMatcher
+from plagdef.model.models import Document
+from plagdef.model.sharding import ShardQueue, work
+from plagdef.tests.fakes import FakePreprocessor
+
+
+@pytest.fixture
+def docs():
+    docs = {Document('doc1', 'path/to/doc1', 'This is an awesome document. And some text in it. Nothing else.'),
+            Document('doc2', 'path/to/doc2', 'It is a great one. This is an awesome document. And more text in it.'),
+            Document('doc3', 'path/to/doc3', 'Totally unrelated. Some text in it. This is an awesome paper.')}
+    FakePreprocessor().preprocess('en', docs)
+    return docs
+
+
+def _queue_config(config, tmp_path, **kwargs):
+    return {**config, 'shard_queue_path': str(tmp_path / 'queue'), 'shard_size': 1, **kwargs}
+
+
+def test_find_matches_with_local_workers_equals_unsharded_matching(config, docs, tmp_path):
+    sharded_matches = DocumentMatcher(_queue_config(config, tmp_path, shard_workers=3)).find_matches(docs)
+    matches = DocumentMatcher(config).find_matches(docs)
+    assert {(frozenset({m.doc1, m.doc2}), len(m)) for m in sharded_matches} \
+           == {(frozenset({m.doc1, m.doc2}), len(m)) for m in matches}
+    assert not any((tmp_path / 'queue' / 'jobs').iterdir())
+
+
+def test_find_matches_retries_failed_shards(config, docs, tmp_path):
+    failures = iter([True, False, False, False])
+
+    def match_pairs(self, doc_pairs):
+        if next(failures):
+            raise RuntimeError('Worker failure')
+        return self._find_matches(doc_pairs)
+
+    with patch.object(DocumentMatcher, 'match_pairs', match_pairs):
+        sharded_matches = DocumentMatcher(_queue_config(config, tmp_path, shard_workers=1)).find_matches(docs)
+    assert len(sharded_matches) == len(DocumentMatcher(config).find_matches(docs))
+    assert not any((tmp_path / 'queue' / 'jobs').iterdir())
+
+
+def test_find_matches_gives_up_on_shards_after_max_attempts(config, docs, tmp_path):
+    with patch.object(DocumentMatcher, 'match_pairs', side_effect=RuntimeError('Worker failure')):
+        matches = DocumentMatcher(_queue_config(config, tmp_path, shard_workers=1, shard_attempts=2)).find_matches(docs)
+    assert matches == []
+    job_dir, = (tmp_path / 'queue' / 'jobs').iterdir()
+    failed_shards = [json.loads(path.read_text()) for path in (job_dir / 'failed').iterdir()]
+    assert len(failed_shards) == 3
+    assert not (job_dir / 'job.json').exists()
+    assert all(shard['attempts'] == 2 for shard in failed_shards)
+
+
+def test_requeue_expired_puts_back_abandoned_shards(config, docs, tmp_path):
+    queue = ShardQueue.submit(tmp_path, {**config, 'shard_size': 2, 'shard_lease_time': 60}, list(docs),
+                              [(0, 1), (0, 2), (1, 2)])
+    shard = queue.claim('crashed-worker')
+    os.utime(shard.path, (0, 0))
+    queue.requeue_expired()
+    job_dir = tmp_path / 'jobs' / queue.job_id
+    assert not any((job_dir / 'claimed').iterdir())
+    assert json.loads((job_dir / 'pending' / f'{shard.name}.json').read_text())['attempts'] == 1
+
+
+def test_requeue_expired_shard_is_never_missing_from_queue(config, docs, tmp_path):
+    queue = ShardQueue.submit(tmp_path, {**config, 'shard_size': 3, 'shard_lease_time': 60}, list(docs),
+                              [(0, 1), (0, 2), (1, 2)])
+    shard = queue.claim('crashed-worker')
+    os.utime(shard.path, (0, 0))
+    done_while_requeued, retry = [], ShardQueue.retry
+
+    def checked_retry(self, expired_shard):
+        done_while_requeued.append(self.done())
+        retry(self, expired_shard)
+        done_while_requeued.append(self.done())
+
+    with patch.object(ShardQueue, 'retry', checked_retry):
+        queue.requeue_expired()
+    assert done_while_requeued == [False, False]
+    assert not queue.done()
+
+
+def test_submit_keeps_jobs_of_other_coordinators(config, docs, tmp_path):
+    job_config = {**config, 'shard_size': 1}
+    queue1 = ShardQueue.submit(tmp_path, job_config, list(docs), [(0, 1), (0, 2)])
+    queue2 = ShardQueue.submit(tmp_path, job_config, list(docs), [(1, 2)])
+    assert ShardQueue.open_jobs(tmp_path) == sorted([queue1.job_id, queue2.job_id])
+    assert work(tmp_path, job_id=queue1.job_id) == 2
+    assert queue1.done() and not queue2.done()
+    assert len(queue1.results()) == 2 and queue2.results() == []
+
+
+def test_work_without_job_returns(tmp_path):
+    assert work(tmp_path) == 0
+
+
+def test_queue_stores_jobs_and_results_without_pickles(config, docs, tmp_path):
+    queue = ShardQueue.submit(tmp_path, {**config, 'shard_size': 3}, list(docs), [(0, 1), (0, 2), (1, 2)])
+    work(tmp_path, job_id=queue.job_id)
+    job_dir = tmp_path / 'jobs' / queue.job_id
+    assert {path.suffix for path in job_dir.rglob('*.*')} == {'.json', '.npy'}
+    (encoded_matches, worker_stats), = queue.results()
+    job_config, corpus = queue.job()
+    assert job_config['shard_size'] == 3 and len(corpus) == 3
+    assert worker_stats.to_dict()['counters']['pairs'] == 3
+    assert {frozenset({corpus[pos1].name, corpus[pos2].name}) for pos1, pos2, *_ in encoded_matches} \
+           == {frozenset({'doc1', 'doc2'}), frozenset({'doc1', 'doc3'}), frozenset({'doc2', 'doc3'})}
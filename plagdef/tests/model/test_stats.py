@@ -0,0 +1,103 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+from time import sleep
+
+from plagdef.model.stats import Stats, stats, timed, SLOWEST_PAIR_COUNT
+from plagdef.util import parallelize
+
+
+def test_timer_records_calls_and_time():
+    pipe_stats = Stats()
+    with pipe_stats.timer('seeding'):
+        pass
+    with pipe_stats.timer('seeding'):
+        pass
+    assert pipe_stats.to_dict()['stages']['seeding']['calls'] == 2
+    assert pipe_stats.to_dict()['stages']['seeding']['seconds'] >= 0
+
+
+def test_nested_timers_record_own_time():
+    pipe_stats = Stats()
+    with pipe_stats.timer('seeding'):
+        with pipe_stats.timer('vectorization'):
+            sleep(0.05)
+    stages = pipe_stats.to_dict()['stages']
+    assert stages['seeding']['seconds'] >= stages['vectorization']['seconds'] >= 0.05
+    assert stages['seeding']['own_seconds'] < 0.05
+    assert stages['vectorization']['own_seconds'] == stages['vectorization']['seconds']
+
+
+def test_threads_record_into_same_stats():
+    pipe_stats = Stats()
+
+    def record(_):
+        for _ in range(1000):
+            pipe_stats.count('items')
+            with pipe_stats.timer('stage'):
+                pass
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(record, range(8)))
+    assert pipe_stats.counters['items'] == 8000
+    assert pipe_stats.to_dict()['stages']['stage']['calls'] == 8000
+
+
+def test_timed_records_into_process_stats():
+    @timed('test_stage')
+    def stage(number):
+        return number + 1
+
+    stats.reset()
+    assert stage(1) == 2
+    assert stats.to_dict()['stages']['test_stage']['calls'] == 1
+
+
+def test_record_pair_keeps_slowest_pairs():
+    pipe_stats = Stats()
+    for idx in range(SLOWEST_PAIR_COUNT + 5):
+        pipe_stats.record_pair(f'doc{idx}', 'other', idx, seeds=idx)
+    stats_dict = pipe_stats.to_dict()
+    assert len(stats_dict['slowest_pairs']) == SLOWEST_PAIR_COUNT
+    assert stats_dict['slowest_pairs'][0] == {'doc1': f'doc{SLOWEST_PAIR_COUNT + 4}', 'doc2': 'other',
+                                              'seconds': SLOWEST_PAIR_COUNT + 4, 'seeds': SLOWEST_PAIR_COUNT + 4}
+    assert stats_dict['counters']['pairs'] == SLOWEST_PAIR_COUNT + 5
+    assert stats_dict['per_pair']['seeds']['max'] == SLOWEST_PAIR_COUNT + 4
+
+
+def test_merge():
+    stats1, stats2 = Stats(), Stats()
+    with stats1.timer('seeding'):
+        pass
+    with stats2.timer('seeding'):
+        pass
+    stats1.record_pair('doc1', 'doc2', 1, seeds=3)
+    stats2.record_pair('doc3', 'doc4', 2, seeds=5)
+    stats1.merge(stats2)
+    stats_dict = stats1.to_dict()
+    assert stats_dict['stages']['seeding']['calls'] == 2
+    assert stats_dict['counters'] == {'pairs': 2, 'seeds': 8}
+    assert stats_dict['per_pair']['seeds'] == {'mean': 4, 'max': 5}
+    assert [pair['doc1'] for pair in stats_dict['slowest_pairs']] == ['doc3', 'doc1']
+
+
+def test_decode_encoded_stats():
+    worker_stats = Stats()
+    with worker_stats.timer('seeding'):
+        worker_stats.record_pair('doc1', 'doc2', 0.5, seeds=3)
+    decoded = Stats.decode(json.loads(json.dumps(worker_stats.encode())))
+    merged = Stats()
+    merged.record_pair('doc3', 'doc4', 0.5, seeds=3)
+    merged.merge(decoded)
+    assert decoded.to_dict() == worker_stats.to_dict()
+    assert merged.to_dict()['counters'] == {'pairs': 2, 'seeds': 6}
+
+
+def _count_items(items, pos=0):
+    stats.count('items', len(items))
+    return list(items)
+
+
+def test_parallelize_merges_stats_of_workers():
+    stats.reset()
+    parallelize(_count_items, [1, 2, 3, 4])
+    assert stats.to_dict()['counters']['items'] == 4
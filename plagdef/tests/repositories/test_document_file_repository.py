@@ -151,6 +151,62 @@ def test_pdf_reader_merges_hyphenated_words_at_line_end(tmp_path):
                    ' which split words.'
 
 
+def test_pdf_reader_merges_hyphenated_words_at_page_end(tmp_path):
+    doc1 = FPDF()
+    doc1.set_font('helvetica', size=12)
+    doc1.add_page()
+    doc1.cell(txt="This is a PDF file con-")
+    doc1.add_page()
+    doc1.cell(txt="taining one sentence on two pages.")
+    doc1.output(f'{tmp_path}/doc1.pdf')
+    reader = PdfReader(tmp_path / 'doc1.pdf', lang='en', use_ocr=True)
+    text = reader._extract()
+    assert text == 'This is a PDF file containing one sentence on two pages.'
+
+
+def test_pdf_reader_joins_pages_with_space(tmp_path):
+    doc1 = FPDF()
+    doc1.set_font('helvetica', size=12)
+    doc1.add_page()
+    doc1.cell(txt="This is the first page.")
+    doc1.add_page()
+    doc1.cell(txt="This is the second page.")
+    doc1.output(f'{tmp_path}/doc1.pdf')
+    reader = PdfReader(tmp_path / 'doc1.pdf', lang='en', use_ocr=True)
+    text = reader._extract()
+    assert text == 'This is the first page. This is the second page.'
+    assert reader.stats.pages == 2
+    assert not reader.stats.truncated
+
+
+def test_pdf_reader_stops_at_page_budget(tmp_path):
+    doc1 = FPDF()
+    doc1.set_font('helvetica', size=12)
+    for i in range(3):
+        doc1.add_page()
+        doc1.cell(txt=f"This is page {i}.")
+    doc1.output(f'{tmp_path}/doc1.pdf')
+    reader = PdfReader(tmp_path / 'doc1.pdf', lang='en', use_ocr=True, max_pages=2)
+    text = reader._extract()
+    assert text == 'This is page 0. This is page 1.'
+    assert reader.stats.pages == 2
+    assert reader.stats.truncated
+
+
+def test_pdf_reader_stops_at_char_budget(tmp_path):
+    doc1 = FPDF()
+    doc1.set_font('helvetica', size=12)
+    for i in range(3):
+        doc1.add_page()
+        doc1.cell(txt=f"This is page {i}.")
+    doc1.output(f'{tmp_path}/doc1.pdf')
+    reader = PdfReader(tmp_path / 'doc1.pdf', lang='en', use_ocr=True, max_chars=20)
+    text = reader._extract()
+    assert text == 'This is page 0. This'
+    assert reader.stats.chars == 20
+    assert reader.stats.truncated
+
+
 @patch("pdfplumber.open", side_effect=UnicodeDecodeError("", bytes(), -1, -1, ""))
 def test_pdf_reader_extract_urls_returns_none_on_unicode_decode_error(pdf_mock, tmp_path):
     reader = PdfReader(tmp_path, lang='eng', use_ocr=True)
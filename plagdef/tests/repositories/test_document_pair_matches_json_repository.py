@@ -1,7 +1,9 @@
 from pathlib import Path
 
+import jsonpickle
 import pytest
 
+from plagdef.model.models import Document, DocumentPairMatches, Match, MatchType, Fragment
 from plagdef.repositories import DocumentPairMatchesJsonRepository
 
 
@@ -55,3 +57,137 @@ def test_file_exists_with_no_content(tmp_path):
     repo = DocumentPairMatchesJsonRepository(tmp_path)
     empty = repo.list()
     assert empty == set()
+
+
+def test_save_all_doc_pair_matches(tmp_path, matches):
+    repo = DocumentPairMatchesJsonRepository(tmp_path)
+    repo.save_all(matches)
+    listed = {dpm: dpm for dpm in repo.list()}
+    assert set(listed) == matches
+    for dpm in matches:
+        for match_type in MatchType:
+            assert listed[dpm].list(match_type) == dpm.list(match_type)
+
+
+def test_save_all_stores_texts_once_per_doc(tmp_path):
+    doc1, doc2, doc3 = Document('doc1', 'path/to/doc1', 'First text.'), Document('doc2', 'path/to/doc2', 'Second.'), \
+        Document('doc3', 'path/to/doc3', 'Third text.')
+    dpms = [DocumentPairMatches(doc1, doc2, [Match(MatchType.VERBATIM, Fragment(0, 5, doc1), Fragment(0, 6, doc2))]),
+            DocumentPairMatches(doc1, doc3, [Match(MatchType.SUMMARY, Fragment(6, 10, doc1), Fragment(0, 5, doc3))])]
+    repo = DocumentPairMatchesJsonRepository(tmp_path)
+    repo.save_all(dpms)
+    assert len(list((tmp_path / 'docs').iterdir())) == 3
+    assert 'First text.' not in (tmp_path / 'matches.jsonl').read_text(encoding='utf-8')
+    listed = repo.list()
+    docs1 = [dpm.doc1 for dpm in listed]
+    assert docs1[0] is docs1[1]
+
+
+def test_save_all_replaces_report(tmp_path, matches):
+    repo = DocumentPairMatchesJsonRepository(tmp_path)
+    repo.save_all(matches)
+    repo.save_all([next(iter(matches))])
+    assert len(repo.list()) == 1
+
+
+def test_list_reports_of_former_versions(tmp_path, matches):
+    dpm = next(iter(matches))
+    (tmp_path / f'{dpm.doc1.name}-{dpm.doc2.name}.json').write_text(jsonpickle.encode(dpm), encoding='utf-8')
+    repo = DocumentPairMatchesJsonRepository(tmp_path)
+    assert repo.list() == {dpm}
+
+
+def test_list_skips_corrupt_doc_pair(tmp_path, matches):
+    repo = DocumentPairMatchesJsonRepository(tmp_path)
+    repo.save_all(matches)
+    with (tmp_path / 'matches.jsonl').open('a', encoding='utf-8') as file:
+        file.write('Invalid content.\n')
+    assert repo.list() == matches
+
+
+def test_list_index(tmp_path):
+    doc1, doc2 = Document('doc1', 'path/to/doc1', 'First text.'), Document('doc2', 'path/to/doc2', 'Second.')
+    dpm = DocumentPairMatches(doc1, doc2, [Match(MatchType.VERBATIM, Fragment(0, 5, doc1), Fragment(0, 6, doc2)),
+                                           Match(MatchType.SUMMARY, Fragment(6, 10, doc1), Fragment(0, 5, doc2))])
+    repo = DocumentPairMatchesJsonRepository(tmp_path)
+    repo.save_all([dpm])
+    entry, = repo.list_index()
+    assert (entry.doc1_name, entry.doc2_name, entry.doc1_path, entry.doc2_path) \
+           == ('doc1', 'doc2', 'path/to/doc1', 'path/to/doc2')
+    assert entry.match_counts == {'verbatim': 1, 'summary': 1}
+
+
+def test_list_index_without_index(tmp_path, matches):
+    dpm = next(iter(matches))
+    (tmp_path / f'{dpm.doc1.name}-{dpm.doc2.name}.json').write_text(jsonpickle.encode(dpm), encoding='utf-8')
+    repo = DocumentPairMatchesJsonRepository(tmp_path)
+    assert repo.list_index() == []
+
+
+def test_load_indexed_doc_pairs(tmp_path):
+    doc1, doc2 = Document('dóc1', 'path/to/dóc1', 'Fürst text.'), Document('dóc2', 'path/to/dóc2', 'Sécond.')
+    doc3 = Document('dóc3', 'path/to/dóc3', 'Thîrd text.')
+    dpms = [DocumentPairMatches(doc1, doc2, [Match(MatchType.VERBATIM, Fragment(0, 5, doc1), Fragment(0, 6, doc2))]),
+            DocumentPairMatches(doc1, doc3, [Match(MatchType.SUMMARY, Fragment(6, 10, doc1), Fragment(0, 5, doc3))])]
+    repo = DocumentPairMatchesJsonRepository(tmp_path)
+    repo.save_all(dpms[:1])
+    repo.save(dpms[1])
+    loaded = [repo.load(entry) for entry in repo.list_index()]
+    assert loaded == dpms
+    assert [dpm.list(MatchType.VERBATIM) for dpm in loaded] == [dpm.list(MatchType.VERBATIM) for dpm in dpms]
+    assert loaded[0].doc1 is loaded[1].doc1
+
+
+def test_save_all_keeps_exceeded_budgets(tmp_path):
+    doc1, doc2 = Document('doc1', 'path/to/doc1', 'First text.'), Document('doc2', 'path/to/doc2', 'Second.')
+    dpm = DocumentPairMatches(doc1, doc2, [Match(MatchType.INTELLIGENT, Fragment(0, 5, doc1), Fragment(0, 6, doc2))])
+    dpm.exceeded_budgets.add('deadline')
+    repo = DocumentPairMatchesJsonRepository(tmp_path)
+    repo.save_all([dpm])
+    assert repo.list().pop().exceeded_budgets == {'deadline'}
+    assert repo.load(repo.list_index()[0]).exceeded_budgets == {'deadline'}
+
+
+def test_save_all_updates_renamed_docs_and_removes_stale_ones(tmp_path):
+    doc1, doc2 = Document('doc1', 'path/to/doc1', 'First text.'), Document('doc2', 'path/to/doc2', 'Second.')
+    renamed_doc1 = Document('renamed', 'other/path/to/renamed', 'First text.')
+    repo = DocumentPairMatchesJsonRepository(tmp_path)
+    repo.save_all([DocumentPairMatches(doc1, doc2, [Match(MatchType.VERBATIM, Fragment(0, 5, doc1),
+                                                          Fragment(0, 6, doc2))])])
+    repo.save_all([DocumentPairMatches(renamed_doc1, doc2, [Match(MatchType.VERBATIM, Fragment(0, 5, renamed_doc1),
+                                                                  Fragment(0, 6, doc2))])])
+    listed = repo.list().pop()
+    assert {listed.doc1.name, listed.doc2.name} == {'renamed', 'doc2'}
+    assert len(list((tmp_path / 'docs').iterdir())) == 2
+
+
+def test_save_all_keeps_docs_with_same_text_apart(tmp_path):
+    doc1, doc2 = Document('doc1', 'path/to/doc1', 'Same text.'), Document('doc2', 'path/to/doc2', 'Same text.')
+    doc3 = Document('doc3', 'path/to/doc3', 'Other text.')
+    repo = DocumentPairMatchesJsonRepository(tmp_path)
+    repo.save_all([DocumentPairMatches(doc1, doc3, [Match(MatchType.VERBATIM, Fragment(0, 4, doc1),
+                                                          Fragment(0, 5, doc3))]),
+                   DocumentPairMatches(doc2, doc3, [Match(MatchType.VERBATIM, Fragment(0, 4, doc2),
+                                                          Fragment(0, 5, doc3))])])
+    assert {entry.doc1_name for entry in repo.list_index()} == {'doc1', 'doc2'}
+    assert {repo.load(entry).doc1.name for entry in repo.list_index()} == {'doc1', 'doc2'}
+
+
+def test_list_ignores_reports_of_former_versions_once_replaced(tmp_path, matches):
+    dpm, *other_matches = matches
+    (tmp_path / f'{dpm.doc1.name}-{dpm.doc2.name}.json').write_text(jsonpickle.encode(dpm), encoding='utf-8')
+    repo = DocumentPairMatchesJsonRepository(tmp_path)
+    repo.save_all(other_matches)
+    assert repo.list() == set(other_matches)
+
+
+def test_save_same_doc_pair_again_supersedes_former_one(tmp_path):
+    doc1, doc2 = Document('doc1', 'path/to/doc1', 'First text.'), Document('doc2', 'path/to/doc2', 'Second.')
+    repo = DocumentPairMatchesJsonRepository(tmp_path)
+    repo.save(DocumentPairMatches(doc1, doc2, [Match(MatchType.VERBATIM, Fragment(0, 5, doc1), Fragment(0, 6, doc2))]))
+    repo.save(DocumentPairMatches(doc2, doc1, [Match(MatchType.SUMMARY, Fragment(0, 6, doc2), Fragment(0, 5, doc1))]))
+    entry, = repo.list_index()
+    listed, = repo.list()
+    assert entry.match_counts == {'summary': 1}
+    assert repo.load(entry).list(MatchType.SUMMARY) == listed.list(MatchType.SUMMARY)
+    assert not listed.list(MatchType.VERBATIM)
@@ -6,7 +6,8 @@ from pickle import dump, load
 import pytest
 
 from plagdef.model.models import Document, Fragment, Sentence
-from plagdef.repositories import DocumentPickleRepository
+from plagdef.model.pipeline.preprocessing import CommonContentIndex
+from plagdef.repositories import DocumentPickleRepository, CommonIndexPickleRepository
 
 
 def test_serialize_docs(tmp_path):
@@ -94,3 +95,40 @@ def test_pickle_document_with_sentence(tmp_path):
     with (tmp_path / 'pickle.dat').open('rb') as file:
         unpickled_doc = load(file)
     assert doc == unpickled_doc
+
+
+def test_serialize_common_index(tmp_path):
+    index = CommonContentIndex([['some', 'line']])
+    ser = CommonIndexPickleRepository(tmp_path)
+    ser.save('digest', index)
+    assert ser.get('digest').contains_line_of(['some', 'line'])
+    assert ser.get('other') is None
+
+
+def test_serialize_common_index_removes_stale_index(tmp_path):
+    ser = CommonIndexPickleRepository(tmp_path)
+    ser.save('old', CommonContentIndex([['some', 'line']]))
+    ser.save('new', CommonContentIndex([['other', 'line']]))
+    assert [file.name for file in tmp_path.glob('*')] == ['.common_new.pdef']
+
+
+def test_common_index_file_with_corrupt_content(tmp_path):
+    (tmp_path / '.common_digest.pdef').write_text('Invalid content.')
+    assert CommonIndexPickleRepository(tmp_path).get('digest') is None
+
+
+def test_kept_docs_are_reused_and_least_recently_used_evicted(tmp_path, monkeypatch):
+    from collections import OrderedDict
+    monkeypatch.setattr(DocumentPickleRepository, 'keep_in_memory', True)
+    monkeypatch.setattr(DocumentPickleRepository, 'KEPT_FILES', 2)
+    monkeypatch.setattr(DocumentPickleRepository, '_loaded', OrderedDict())
+    repos = []
+    for idx in range(3):
+        (tmp_path / str(idx)).mkdir()
+        repos.append(DocumentPickleRepository(tmp_path / str(idx)))
+        repos[idx].save({Document(f'doc{idx}', f'path/to/doc{idx}', f'Some text {idx}.')})
+    assert list(DocumentPickleRepository._loaded) == [repos[1].file_path, repos[2].file_path]
+    kept_doc = next(iter(DocumentPickleRepository._loaded[repos[2].file_path][1]))
+    assert next(iter(repos[2].list())) is kept_doc
+    assert next(iter(repos[0].list())).name == 'doc0'
+    assert list(DocumentPickleRepository._loaded) == [repos[2].file_path, repos[0].file_path]
@@ -0,0 +1,53 @@
+from pathlib import Path
+from unittest.mock import patch
+
+from plagdef.model.models import File
+from plagdef.repositories import ExternalSourceRepository, FileRepository
+
+
+def test_save_all_stores_identical_contents_once(tmp_path):
+    repo = ExternalSourceRepository(tmp_path)
+    repo.save_all({'https://a.com': File(tmp_path / 'a.com.txt', 'Same content.', False),
+                   'https://b.com': File(tmp_path / 'b.com.txt', 'Same content.', False)})
+    assert len(list(tmp_path.glob('*.txt'))) == 1
+    assert repo.paths({'https://a.com'}) == repo.paths({'https://b.com'})
+
+
+def test_save_all_skips_contents_stored_in_previous_runs(tmp_path):
+    ExternalSourceRepository(tmp_path).save_all({'https://a.com': File(tmp_path / 'a.com.txt', 'Content.', False)})
+    repo = ExternalSourceRepository(tmp_path)
+    with patch.object(FileRepository, 'list') as list_mock:
+        repo.save_all({'https://b.com': File(tmp_path / 'b.com.txt', 'Content.', False),
+                       'https://c.com': File(tmp_path / 'c.com.txt', 'New content.', False)})
+    list_mock.assert_not_called()
+    assert sorted(path.name for path in tmp_path.glob('*.txt')) == ['a.com.txt', 'c.com.txt']
+    assert repo.paths({'https://b.com'}) == {tmp_path / 'a.com.txt'}
+
+
+def test_paths_of_unknown_url(tmp_path):
+    repo = ExternalSourceRepository(tmp_path)
+    repo.save_all({'https://a.com': File(tmp_path / 'a.com.txt', 'Content.', False)})
+    assert repo.paths({'https://unknown.com'}) == set()
+    assert repo.paths() == {tmp_path / 'a.com.txt'}
+
+
+def test_list_reads_only_given_paths(tmp_path):
+    repo = ExternalSourceRepository(tmp_path, 'en')
+    repo.save_all({'https://a.com': File(tmp_path / 'a.com.txt', 'First content.', False),
+                   'https://b.com': File(tmp_path / 'b.com.txt', 'Second content.', False)})
+    docs = repo.list(repo.paths({'https://b.com'}))
+    assert [doc.text for doc in docs] == ['Second content.']
+
+
+def test_index_includes_files_downloaded_without_index(tmp_path):
+    FileRepository(tmp_path).save_all({File(tmp_path / 'a.com.txt', 'Content.', False)})
+    repo = ExternalSourceRepository(tmp_path)
+    repo.save_all({'https://a.com': File(tmp_path / 'other.txt', 'Content.', False)})
+    assert [path.name for path in tmp_path.glob('*.txt')] == ['a.com.txt']
+    assert repo.paths({'https://a.com'}) == {Path(tmp_path / 'a.com.txt')}
+
+
+def test_corrupt_index_is_rebuilt(tmp_path):
+    (tmp_path / '.sources.pdef').write_text('Invalid content.')
+    FileRepository(tmp_path).save_all({File(tmp_path / 'a.com.txt', 'Content.', False)})
+    assert ExternalSourceRepository(tmp_path).paths() == {tmp_path / 'a.com.txt'}
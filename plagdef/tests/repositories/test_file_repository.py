@@ -171,3 +171,11 @@ def test_remove_all_if_file_not_exists_is_noop(tmp_path):
     file_repo = FileRepository(tmp_path)
     file_repo.remove_all({file})
     assert not len(list(tmp_path.glob('*')))
+
+
+def test_list_ignores_pdef_files(tmp_path):
+    (tmp_path / 'doc.txt').write_text('Hello World!', encoding='utf-8')
+    (tmp_path / '.cache').mkdir()
+    (tmp_path / '.cache' / 'response.pdef').write_bytes(urandom(128))
+    files = FileRepository(tmp_path, recursive=True).list()
+    assert [file.path.name for file in files] == ['doc.txt']
@@ -0,0 +1,25 @@
+import pytest
+
+from plagdef.repositories import TranslationCacheRepository
+
+
+def test_save_and_load_translations(tmp_path):
+    repo = TranslationCacheRepository(tmp_path)
+    repo.save({('digest', 'de'): 'Übersetzung.'})
+    assert TranslationCacheRepository(tmp_path).load() == {('digest', 'de'): 'Übersetzung.'}
+
+
+def test_load_without_file(tmp_path):
+    assert TranslationCacheRepository(tmp_path).load() == {}
+
+
+def test_load_corrupt_file(tmp_path):
+    (tmp_path / '.translations.pdef').write_text('Invalid content.')
+    assert TranslationCacheRepository(tmp_path).load() == {}
+
+
+def test_init_with_file_fails(tmp_path):
+    file_path = tmp_path / 'test.file'
+    file_path.write_text('Content.')
+    with pytest.raises(NotADirectoryError):
+        TranslationCacheRepository(file_path)
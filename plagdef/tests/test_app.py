@@ -1,9 +1,137 @@
+import io
+import json
+import logging
+import subprocess
+import sys
+from collections import Counter
+from unittest.mock import patch
+
 from click.testing import CliRunner
 
-from plagdef.app import cli
+from plagdef.app import cli, reanalyze_pair, worker, _run_daemon_job
+from plagdef.config import settings
+from plagdef.model.models import Document, Sentence
 
 
 def test_cli_version():
     runner = CliRunner()
     result = runner.invoke(cli, ['--version'])
     assert result.exit_code == 0
+
+
+def test_app_import_does_not_load_heavy_modules():
+    heavy_modules = ('stanza', 'torch', 'selenium', 'pdfplumber', 'ocrmypdf', 'pkg_resources')
+    result = subprocess.run([sys.executable, '-c', 'import sys, plagdef.app; '
+                                                   f'print([m for m in {heavy_modules} if m in sys.modules])'],
+                            capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == '[]'
+
+
+def test_reanalyze_pair_reuses_preprocessed_docs():
+    doc1 = Document('doc1', 'path/to/doc1', 'This is a document.')
+    doc2 = Document('doc2', 'path/to/doc2', 'This also is a document.')
+    doc1.add_sent(Sentence(0, 19, Counter({'this': 1, 'be': 1, 'document': 1}), doc1))
+    doc2.add_sent(Sentence(0, 24, Counter({'this': 1, 'also': 1, 'be': 1, 'document': 1}), doc2))
+    last_sim = settings['min_cos_sim']
+    with patch('plagdef.services.find_pair_matches', return_value=[]) as fpm_mock, \
+        patch('plagdef.services.find_matches') as fm_mock:
+        reanalyze_pair(doc1, doc2, 0.9)
+    fm_mock.assert_not_called()
+    assert fpm_mock.call_args.args[:2] == (doc1, doc2)
+    assert fpm_mock.call_args.args[2]['min_cos_sim'] == 0.9
+    assert settings['min_cos_sim'] == last_sim
+
+
+def test_reanalyze_pair_preprocesses_docs_without_sents():
+    doc1 = Document('doc1', 'path/to/doc1', 'This is a document.')
+    doc2 = Document('doc2', 'path/to/doc2', 'This also is a document.')
+    with patch('plagdef.services.find_pair_matches') as fpm_mock, \
+        patch('plagdef.services.find_matches', return_value=[]) as fm_mock:
+        reanalyze_pair(doc1, doc2, 0.9)
+    fpm_mock.assert_not_called()
+    assert fm_mock.call_args.kwargs['config']['min_cos_sim'] == 0.9
+    assert not fm_mock.call_args.kwargs['download']
+
+
+def test_cli_sweep_reports_each_threshold(tmp_path):
+    runner = CliRunner()
+    with patch('plagdef.app.sweep_matches', return_value={0.5: [], 0.7: []}) as sweep_mock:
+        result = runner.invoke(cli, [str(tmp_path), 'False', '-l', 'en', '-w', '0.7', '-w', '0.5'])
+    assert result.exit_code == 0
+    assert sweep_mock.call_args.args[3] == (0.7, 0.5)
+    assert 'Similarity threshold 0.5:\n\nNo matches found.' in result.output
+    assert 'Similarity threshold 0.7:\n\nNo matches found.' in result.output
+
+
+def test_cli_writes_stats(tmp_path):
+    runner = CliRunner()
+    stats_file = tmp_path / 'stats.json'
+    with patch('plagdef.app.find_matches', return_value=[]):
+        result = runner.invoke(cli, [str(tmp_path), 'False', '-l', 'en', '--stats', str(stats_file)])
+    assert result.exit_code == 0
+    assert set(json.loads(stats_file.read_text(encoding='utf-8'))) \
+           == {'stages', 'counters', 'per_pair', 'slowest_pairs'}
+
+
+def test_cli_profile_pairs_writes_profiles_to_json_dir(tmp_path):
+    runner = CliRunner()
+    last_settings = dict(settings)
+    with patch('plagdef.app.find_matches', return_value=[]):
+        result = runner.invoke(cli, [str(tmp_path), 'False', '-l', 'en', '-j', str(tmp_path), '--profile-pairs', '5'])
+    assert result.exit_code == 0
+    assert settings['profile_pair_time'] == 5
+    assert settings['profile_path'] == str(tmp_path / 'profiles')
+    settings.update(last_settings)
+
+
+def test_cli_daemon_submits_job_with_absolute_paths(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    runner = CliRunner()
+    with patch('plagdef.daemon.submit_job', return_value=0) as submit_mock:
+        result = runner.invoke(cli, ['.', 'False', '-l', 'en', '-j', 'out', '--daemon'])
+    assert result.exit_code == 0
+    params, port, _ = submit_mock.call_args.args
+    assert port == settings['daemon_port']
+    assert params['docdir'] == [str(tmp_path), False]
+    assert params['jsondir'] == str(tmp_path / 'out')
+    assert 'use_daemon' not in params
+
+
+def test_run_daemon_job_streams_report_and_restores_settings(tmp_path):
+    out = io.StringIO()
+    last_settings = dict(settings)
+    params = {'docdir': [str(tmp_path), False], 'lang': 'en', 'ocr': False, 'common_docdir': None,
+              'archive_docdir': None, 'sim_th': 0.8, 'sweep_ths': [], 'jsondir': None, 'download_path': None,
+              'profile_pair_time': None, 'stats_file': None, 'shard_queue': None}
+    with patch('plagdef.app.find_matches', return_value=[]) as fm_mock:
+        exit_code = _run_daemon_job(params, out)
+    assert exit_code == 0
+    assert fm_mock.call_args.args[0] == (str(tmp_path), False)
+    assert 'No matches found.' in out.getvalue()
+    assert settings == last_settings
+
+
+def test_run_daemon_job_streams_log_and_progress(tmp_path):
+    out = io.StringIO()
+    params = {'docdir': [str(tmp_path), False], 'lang': 'en', 'ocr': False, 'common_docdir': None,
+              'archive_docdir': None, 'sim_th': 0.8, 'sweep_ths': [], 'jsondir': None, 'download_path': None,
+              'profile_pair_time': None, 'stats_file': None, 'shard_queue': None}
+
+    def find_matches(*args):
+        logging.getLogger('plagdef.services').warning('Some warning.')
+        sys.stderr.write('Matching: 100%\n')
+        return []
+
+    with patch('plagdef.app.find_matches', side_effect=find_matches):
+        assert _run_daemon_job(params, out) == 0
+    assert 'Some warning.' in out.getvalue() and 'Matching: 100%' in out.getvalue()
+    assert not any(isinstance(handler, logging.StreamHandler) and handler.stream is out
+                   for handler in logging.getLogger('plagdef').handlers)
+
+
+def test_worker_runs_workers_on_queue(tmp_path):
+    runner = CliRunner()
+    with patch('plagdef.model.sharding.run_workers') as run_mock:
+        result = runner.invoke(worker, [str(tmp_path), '-p', '2', '--wait'])
+    assert result.exit_code == 0
+    run_mock.assert_called_once_with(tmp_path, 2, True)
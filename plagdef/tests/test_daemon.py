@@ -0,0 +1,74 @@
+import http.client
+import io
+import json
+import stat
+from threading import Thread
+
+import pytest
+from click import UsageError
+
+from plagdef.daemon import JobServer, submit_job, HOST, _write_token
+
+
+@pytest.fixture
+def token_path(tmp_path):
+    token_path = tmp_path / 'daemon' / 'token'
+    _write_token(token_path, 'secret')
+    return token_path
+
+
+@pytest.fixture
+def job_server():
+    def job_runner(params, out):
+        out.write(f'Matching {params["docdir"]}...\n')
+        out.write('Done')
+        return 3
+
+    server = JobServer(0, job_runner, 'secret')
+    Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_submit_job_streams_output_and_returns_exit_code(job_server, token_path):
+    out = io.StringIO()
+    exit_code = submit_job({'docdir': 'docs'}, job_server.server_address[1], token_path, out)
+    assert exit_code == 3
+    assert out.getvalue() == 'Matching docs...\nDone'
+    assert job_server.jobs == 1
+
+
+def test_submit_job_with_wrong_token_is_rejected(job_server, token_path):
+    _write_token(token_path, 'guessed')
+    with pytest.raises(UsageError):
+        submit_job({'docdir': 'docs'}, job_server.server_address[1], token_path, io.StringIO())
+    assert job_server.jobs == 0
+
+
+def test_token_is_only_readable_by_user(token_path):
+    assert stat.S_IMODE(token_path.stat().st_mode) == 0o600
+
+
+def test_status(job_server):
+    conn = http.client.HTTPConnection(HOST, job_server.server_address[1])
+    conn.request('GET', '/status', headers={'Authorization': 'Bearer secret'})
+    status = json.loads(conn.getresponse().read())
+    conn.close()
+    assert status['jobs'] == 0
+    assert not status['busy']
+
+
+def test_status_without_token_is_rejected(job_server):
+    conn = http.client.HTTPConnection(HOST, job_server.server_address[1])
+    conn.request('GET', '/status')
+    assert conn.getresponse().status == 401
+    conn.close()
+
+
+def test_submit_job_without_daemon_fails(job_server, token_path):
+    port = job_server.server_address[1]
+    job_server.shutdown()
+    job_server.server_close()
+    with pytest.raises(UsageError):
+        submit_job({}, port, token_path, io.StringIO())
@@ -1,3 +1,4 @@
+from pathlib import Path
 from unittest.mock import patch
 
 import pytest
@@ -6,8 +7,12 @@ from click import UsageError
 from plagdef.model.detection import DocumentMatcher
 from plagdef.model.models import DocumentPairMatches, Match, Fragment, MatchType
 from plagdef.model.pipeline.preprocessing import Document
-from plagdef.repositories import UnsupportedFileFormatError, DocumentPairMatchesJsonRepository, DocumentPickleRepository
-from plagdef.services import find_matches, write_json_reports, _preprocess_docs
+from plagdef.model.download import Downloader
+from plagdef.model.models import File
+from plagdef.repositories import UnsupportedFileFormatError, DocumentPairMatchesJsonRepository, \
+    DocumentPickleRepository, ExternalSourceRepository
+from plagdef.services import find_matches, write_json_reports, _preprocess_docs, find_pair_matches, \
+    _preprocess_external_sources
 from plagdef.tests.fakes import DocumentFakeRepository, FakeDocumentMatcher
 
 
@@ -67,6 +72,89 @@ def test_preprocess_removes_formerly_preprocessed_document(save_mock, list_mock,
     save_mock.assert_called_with(docs)
 
 
+def test_preprocess_builds_common_index_once(tmp_path):
+    doc_matcher = FakeDocumentMatcher()
+    docs = {Document('doc1', 'path/to/doc1', 'This is a document.\n')}
+    (tmp_path / 'docs').mkdir(), (tmp_path / 'common').mkdir()
+    common_repo = DocumentFakeRepository({Document('common', 'path/to/common', 'A common line')}, 'en',
+                                         tmp_path / 'common')
+    _preprocess_docs(doc_matcher, True, DocumentFakeRepository(docs, 'en', tmp_path / 'docs'), common_repo)
+    _preprocess_docs(doc_matcher, True, DocumentFakeRepository(docs, 'en', tmp_path), common_repo)
+    assert doc_matcher.common_index_builds == 1
+    assert doc_matcher.used_common_index.contains_line_of(['a', 'common', 'line'])
+
+
+def test_preprocess_skips_common_index_if_docs_are_preprocessed(tmp_path):
+    doc_matcher = FakeDocumentMatcher()
+    docs = {Document('doc1', 'path/to/doc1', 'This is a document.\n')}
+    common_repo = DocumentFakeRepository({Document('common', 'path/to/common', 'A common line')}, 'en', tmp_path)
+    with patch.object(DocumentPickleRepository, 'list', return_value=docs):
+        _preprocess_docs(doc_matcher, True, DocumentFakeRepository(docs, 'en', tmp_path), common_repo)
+    assert doc_matcher.common_index_builds == 0
+
+
+def test_preprocess_external_sources_only_preprocesses_new_contents(config, tmp_path):
+    source_text = 'This is the text of an external source which is referenced by a submission.'
+    doc1 = Document('doc1', 'path/to/doc1', 'See https://a.com')
+    doc1.urls = {'https://a.com'}
+    doc2 = Document('doc2', 'path/to/doc2', 'See https://b.com')
+    doc2.urls = {'https://b.com'}
+    files = {'https://a.com': File(tmp_path / 'a.com.txt', source_text, False),
+             'https://b.com': File(tmp_path / 'b.com.txt', 'Another external source which is unrelated.', False)}
+    with patch.object(Downloader, 'download_by_url',
+                      side_effect=lambda urls, target_dir: {url: files[url] for url in urls}):
+        doc_matcher = FakeDocumentMatcher()
+        ext_docs = _preprocess_external_sources(doc_matcher, {doc1}, ExternalSourceRepository(tmp_path, 'en'),
+                                                None, {**config, 'transl': False, 'resolve_hosts': False})
+        assert [doc.text for doc in ext_docs] == [source_text]
+        assert [doc.text for doc in doc_matcher.preprocessed_docs] == [source_text]
+        doc3 = Document('doc3', 'path/to/doc3', 'Also see https://a.com/index.html')
+        doc3.urls = {'https://a.com/index.html'}
+        files['https://a.com/index.html'] = File(tmp_path / 'index.html_from_a.com.txt', source_text, False)
+        ext_docs = _preprocess_external_sources(doc_matcher, {doc2, doc3}, ExternalSourceRepository(tmp_path, 'en'),
+                                                None, {**config, 'transl': False, 'resolve_hosts': False})
+    assert sorted(doc.name for doc in ext_docs) == ['a.com', 'b.com']
+    assert [doc.name for doc in doc_matcher.preprocessed_docs] == ['b.com']
+
+
+def test_preprocess_external_sources_translates_sources_once(config, tmp_path):
+    doc = Document('doc', 'path/to/doc', 'See https://a.de')
+    doc.urls = {'https://a.de'}
+    files = {'https://a.de': File(tmp_path / 'a.de.txt', 'Das ist der Text einer externen Quelle.', False)}
+
+    def detect_lang(docs):
+        for source in docs:
+            source.lang = 'de' if 'Quelle' in source.text else 'en'
+
+    def translate(docs, target_lang, cache):
+        for source in docs:
+            source.text, source.lang = 'This is the text of an external source.', target_lang
+        return docs
+
+    with patch.object(Downloader, 'download_by_url',
+                      side_effect=lambda urls, target_dir: {url: files[url] for url in urls}), \
+        patch('plagdef.services.detect_lang', side_effect=detect_lang), \
+        patch('plagdef.services.translate', side_effect=translate) as translate_mock:
+        for _ in range(2):
+            ext_docs = _preprocess_external_sources(FakeDocumentMatcher(), {doc},
+                                                    ExternalSourceRepository(tmp_path, 'en'), None,
+                                                    {**config, 'ser': False, 'transl': True, 'resolve_hosts': False})
+            assert [(Path(source.path).name, source.text) for source in ext_docs] \
+                   == [('a.de_trans.txt', 'This is the text of an external source.')]
+    assert [len(call.args[0]) for call in translate_mock.call_args_list] == [1, 0]
+    assert sorted(path.name for path in tmp_path.glob('*.txt')) == ['a.de_trans.txt']
+
+
+def test_preprocess_external_sources_without_sources_skips_deserialization(config, tmp_path):
+    doc = Document('doc', 'path/to/doc', 'No references.')
+    with patch.object(Downloader, 'download_by_url', return_value={}), \
+        patch.object(DocumentPickleRepository, 'list') as list_mock:
+        ext_docs = _preprocess_external_sources(FakeDocumentMatcher(), {doc}, ExternalSourceRepository(tmp_path, 'en'),
+                                                None, {**config, 'transl': False, 'resolve_hosts': False})
+    assert ext_docs == set()
+    list_mock.assert_not_called()
+
+
 def test_find_matches(config, tmp_path):
     docs = [Document('doc1', 'path/to/doc1', 'This is a document.\n'),
             Document('doc2', 'path/to/doc2', 'This also is a document.\n')]
@@ -80,6 +168,16 @@ def test_find_matches(config, tmp_path):
     alg_fm.assert_called_with(doc_repo.list(), None)
 
 
+def test_find_pair_matches_skips_preprocessing(config):
+    docs = [Document('doc1', 'path/to/doc1', 'This is a document.\n'),
+            Document('doc2', 'path/to/doc2', 'This also is a document.\n')]
+    with patch.object(DocumentMatcher, 'find_matches', return_value=[]) as alg_fm, \
+        patch.object(DocumentMatcher, 'preprocess') as alg_prep:
+        find_pair_matches(docs[0], docs[1], config)
+    alg_prep.assert_not_called()
+    alg_fm.assert_called_with(set(docs))
+
+
 def test_find_matches_catches_unsupported_file_format_error(config, tmp_path):
     docs = [Document('doc1', 'path/to/doc1', 'This is a document.\n'),
             Document('doc2', 'path/to/doc2', 'This also is a document.\n')]
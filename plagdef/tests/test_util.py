@@ -1,4 +1,4 @@
-from plagdef.util import cos_sim, dice_sim, truncate
+from plagdef.util import cos_sim, dice_sim, truncate, parallelize
 
 
 def test_truncate():
@@ -45,3 +45,9 @@ def test_dice_coeff():
     # n_t = 4, n_x = 5, n_y = 6
     # dice-coeff = 2 * 4 / (5 + 6) = 8 / 11 = 0.7272...
     assert sim == 0.7272727272727273
+
+
+def test_parallelize_runs_single_item_in_process():
+    # A lambda cannot be pickled, so this only works without worker processes
+    result = parallelize(lambda chunk, pos: [item * 2 for item in chunk], [21])
+    assert result == [42]
@@ -1,16 +1,19 @@
 import os
+from contextlib import nullcontext
 from concurrent.futures import ProcessPoolExecutor, as_completed
+from importlib.metadata import version as dist_version
 from multiprocessing import RLock
 from typing import Callable
 
 from numpy import dot, array_split
 from numpy.linalg import norm
-from pkg_resources import get_distribution
 from tqdm import tqdm
 
+from plagdef.model.stats import stats, run_collecting_stats
+
 
 def version():
-    return get_distribution('plagdef').version
+    return dist_version('plagdef')
 
 
 def truncate(string: str, length: int):
@@ -38,11 +41,32 @@ def dice_sim(bow1: dict, bow2: dict):
     return 2 * n_com / n_x_plus_n_y if n_x_plus_n_y else 0
 
 
+_warm_pool = None
+
+
+def keep_pool_warm():
+    """Let long-running processes reuse one pool of worker processes instead of spawning one per call."""
+    global _warm_pool
+    if _warm_pool is None:
+        _warm_pool = _process_pool()
+        list(_warm_pool.map(abs, range(os.cpu_count())))
+
+
+def _process_pool() -> ProcessPoolExecutor:
+    return ProcessPoolExecutor(initargs=(RLock(),), initializer=tqdm.set_lock, max_workers=os.cpu_count())
+
+
 def parallelize(fun: Callable, data):
+    if len(data) < 2:  # Not worth the overhead of spawning worker processes
+        return fun(data, 0)
     data_chunks = array_split(data, os.cpu_count())
-    with ProcessPoolExecutor(initargs=(RLock(),), initializer=tqdm.set_lock, max_workers=os.cpu_count()) as p:
+    with nullcontext(_warm_pool) if _warm_pool else _process_pool() as p:
         futures = []
         for i, chunk in enumerate(data_chunks):
-            futures.append(p.submit(fun, chunk, i))
-        match_chunks = [f.result() for f in as_completed(futures)]
+            futures.append(p.submit(run_collecting_stats, fun, chunk, i))
+        match_chunks = []
+        for future in as_completed(futures):
+            match_chunk, worker_stats = future.result()
+            match_chunks.append(match_chunk)
+            stats.merge(worker_stats)
     return [match for chunk in match_chunks for match in chunk]